@@ -0,0 +1,128 @@
+import gzip
+import json
+
+from errors import AlgoBenchError
+from stats import ConfusionMatrix, DurationStats, newLatencyStats
+
+# Version of the snapshot format written by saveAggregate
+snapshotVersion = 1
+
+class Aggregate(object):
+    '''
+    Description: Mergeable summary of the calls made by (part of) a benchmark: the latency
+        aggregates, error and connection counts, the time spent throttled and, when a mapping
+        function was given, the confusion matrix and predictions of each algo. The results
+        themselves are kept too unless they were mapped. Aggregates of separate parts of a run
+        merge into the aggregate of the whole run.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0
+        self.latencyStats = newLatencyStats()
+        self.errors = {}
+        self.connections = {}
+        self.throttled = {}
+        self.confusionMatrices = {}
+        self.predictions = {}
+        self.results = []
+        # Settings needed to recalculate the stats, see Benchmark.snapshot
+        self.settings = {}
+
+    def merge(self, other, indexOffset=0):
+        '''
+        Description: Adds other into this aggregate. The parts are assumed to have run at the same
+            time, so the elapsed time is the longest of the two. indexOffset is added to the call
+            indices of the predictions of other, so those of separate runs don't collide.
+        '''
+        self.count += other.count
+        self.elapsed = max(self.elapsed, other.elapsed)
+        for kind in other.latencyStats:
+            own = self.latencyStats.setdefault(kind, {})
+            for algo, durationStats in other.latencyStats[kind].iteritems():
+                if algo not in own:
+                    own[algo] = DurationStats()
+                own[algo].merge(durationStats)
+
+        for algo, errors in other.errors.iteritems():
+            own = self.errors.setdefault(algo, {"calls": 0, "failed": 0, "types": {}})
+            own["calls"] += errors["calls"]
+            own["failed"] += errors["failed"]
+            for errorType, count in errors["types"].iteritems():
+                own["types"][errorType] = own["types"].get(errorType, 0) + count
+
+        for algo, connections in other.connections.iteritems():
+            own = self.connections.setdefault(algo, {"new": 0, "reused": 0})
+            own["new"] += connections["new"]
+            own["reused"] += connections["reused"]
+
+        for algo, seconds in other.throttled.iteritems():
+            self.throttled[algo] = self.throttled.get(algo, 0) + seconds
+
+        for algo, matrix in other.confusionMatrices.iteritems():
+            if algo not in self.confusionMatrices:
+                self.confusionMatrices[algo] = ConfusionMatrix()
+            self.confusionMatrices[algo].merge(matrix)
+
+        for algo, predictions in other.predictions.iteritems():
+            own = self.predictions.setdefault(algo, {})
+            for callIndex, correct in predictions.iteritems():
+                own[callIndex + indexOffset] = correct
+
+        self.results.extend(other.results)
+        for key, value in other.settings.iteritems():
+            self.settings.setdefault(key, value)
+
+    def toDict(self, includeResults=False):
+        '''
+        Description: The aggregate as a JSON serializable dict. The raw results are only included
+            with includeResults, the aggregates are enough to recalculate every stat.
+        '''
+        return {
+            "version": snapshotVersion,
+            "count": self.count,
+            "elapsed": self.elapsed,
+            "settings": self.settings,
+            "latencyStats": dict((kind, dict((algo, durationStats.toDict()) for algo, durationStats in algos.iteritems()))
+                                 for kind, algos in self.latencyStats.iteritems()),
+            "errors": self.errors,
+            "connections": self.connections,
+            "throttled": self.throttled,
+            "confusionMatrices": dict((algo, matrix.toDict()) for algo, matrix in self.confusionMatrices.iteritems()),
+            "predictions": dict((algo, sorted(predictions.iteritems())) for algo, predictions in self.predictions.iteritems()),
+            "results": self.results if includeResults else []
+        }
+
+    @staticmethod
+    def fromDict(data):
+        if data.get("version") != snapshotVersion:
+            raise AlgoBenchError('Unsupported snapshot version: ' + str(data.get("version")))
+        aggregate = Aggregate()
+        aggregate.count = data["count"]
+        aggregate.elapsed = data["elapsed"]
+        aggregate.settings = data["settings"]
+        for kind, algos in data["latencyStats"].iteritems():
+            aggregate.latencyStats[kind] = dict((algo, DurationStats.fromDict(stats)) for algo, stats in algos.iteritems())
+        aggregate.errors = data["errors"]
+        aggregate.connections = data["connections"]
+        aggregate.throttled = data["throttled"]
+        aggregate.confusionMatrices = dict((algo, ConfusionMatrix.fromDict(matrix))
+                                           for algo, matrix in data["confusionMatrices"].iteritems())
+        aggregate.predictions = dict((algo, dict((callIndex, correct) for callIndex, correct in predictions))
+                                     for algo, predictions in data["predictions"].iteritems())
+        aggregate.results = data["results"]
+        return aggregate
+
+def saveAggregate(aggregate, path, includeResults=False):
+    '''
+    Description: Writes the aggregate to path as a JSON snapshot, gzip compressed if the path
+        ends with .gz.
+    '''
+    openFile = gzip.open if path.endswith('.gz') else open
+    with openFile(path, 'wb') as f:
+        json.dump(aggregate.toDict(includeResults), f, separators=(',', ':'))
+
+def loadAggregate(path):
+    # Reads a snapshot written by saveAggregate
+    openFile = gzip.open if path.endswith('.gz') else open
+    with openFile(path, 'rb') as f:
+        return Aggregate.fromDict(json.load(f))
@@ -0,0 +1,295 @@
+import asyncore
+import collections
+import json
+import socket
+import ssl
+import time
+import urlparse
+
+from errors import CallError, parseApiResponse
+
+class AsyncRequest(asyncore.dispatcher):
+    '''
+    Description: A single non-blocking HTTP POST to the algorithm API. The request is written and
+        the response read whenever the socket is ready, so one thread can drive many of them.
+    '''
+    def __init__(self, engine, task):
+        asyncore.dispatcher.__init__(self, map=engine.socketMap)
+        self.engine = engine
+        self.task = task
+        self.outBuffer = engine.buildRequest(task.algo, task.input)
+        self.inBuffer = []
+        self.handshaking = False
+        self.done = False
+        task.attempts += 1
+        task.timing.setdefault('acquired', time.time())
+        for key in ('sent', 'received', 'parsed'):
+            task.timing.pop(key, None)
+        self.deadline = time.time() + engine.timeout if engine.timeout is not None else None
+
+        if engine.address is None:
+            raise engine.addressError
+        self.create_socket(engine.family, socket.SOCK_STREAM)
+        try:
+            self.connect(engine.address)
+        except socket.error:
+            self.close()
+            raise
+
+    def handle_connect(self):
+        if self.engine.secure:
+            self.socket = self.engine.sslContext.wrap_socket(self.socket, server_hostname=self.engine.host,
+                                                             do_handshake_on_connect=False)
+            self.handshaking = True
+            self.__handshake()
+
+    def __handshake(self):
+        try:
+            self.socket.do_handshake()
+            self.handshaking = False
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            pass
+
+    def writable(self):
+        return not self.connected or self.handshaking or len(self.outBuffer) > 0
+
+    def handle_write(self):
+        if self.handshaking:
+            self.__handshake()
+            return
+        if 'sent' not in self.task.timing:
+            self.task.timing['sent'] = time.time()
+        try:
+            sent = self.send(self.outBuffer)
+        except ssl.SSLWantWriteError:
+            return
+        self.outBuffer = self.outBuffer[sent:]
+
+    def handle_read(self):
+        if self.handshaking:
+            self.__handshake()
+            return
+        try:
+            data = self.recv(65536)
+            # Drain whatever the SSL layer already decrypted, poll() can't see it
+            while data and self.engine.secure and self.socket.pending():
+                self.inBuffer.append(data)
+                data = self.recv(65536)
+        except ssl.SSLWantReadError:
+            return
+        if data:
+            self.inBuffer.append(data)
+
+    def handle_close(self):
+        self.close()
+        self.task.timing['received'] = time.time()
+        self.__finish(''.join(self.inBuffer))
+
+    def handle_error(self):
+        self.close()
+        self.fail(CallError('connection', 'The connection failed'))
+
+    def checkDeadline(self, now):
+        if self.deadline is not None and now > self.deadline:
+            self.close()
+            self.fail(CallError('timeout', 'No response after ' + str(self.engine.timeout) + 's'))
+
+    def fail(self, error):
+        if self.done:
+            return
+        self.done = True
+        self.engine.finish(self.task, None, error)
+
+    def __finish(self, rawResponse):
+        if self.done:
+            return
+        self.done = True
+        try:
+            response = self.engine.parseResponse(rawResponse)
+        except CallError as e:
+            self.engine.finish(self.task, None, e)
+            return
+        self.task.timing['parsed'] = time.time()
+        self.engine.finish(self.task, response, None)
+
+class AsyncEngine(object):
+    '''
+    Description: Event driven request engine. Issues the algorithm calls over non-blocking sockets
+        from a single thread, keeping at most maxNumConnections requests in flight. Calls taking
+        longer than timeout seconds are abandoned, and failed calls are sent again according to
+        retryPolicy once their back-off has passed. When rateLimiter has a TokenBucket, a call is
+        only sent once a token is available. Every call opens its own connection, there is no
+        keep-alive pooling like the SessionPool of the thread engine. Up to queueSize tasks are
+        read ahead of the free connections, like the task queue of the thread engine, so the
+        queueWait of both engines is measured the same way.
+    '''
+    def __init__(self, apiKey, apiAddress, maxNumConnections, timeout=None, retryPolicy=None, rateLimiter=None, queueSize=0):
+        self.apiKey = apiKey
+        self.maxNumConnections = maxNumConnections
+        self.queueSize = queueSize
+        # Tasks read from the input and waiting for a connection
+        self.queue = collections.deque()
+        self.timeout = timeout
+        self.retryPolicy = retryPolicy
+        self.rateLimiter = rateLimiter
+        # Task waiting for a token of the rate limit, and since when
+        self.throttledTask = None
+        self.throttledSince = None
+        self.socketMap = {}
+        self.callback = None
+        # (retry time, task) of the failed calls waiting for their back-off
+        self.retries = []
+
+        address = urlparse.urlparse(apiAddress)
+        self.secure = address.scheme == 'https'
+        self.host = address.hostname
+        self.port = address.port or (443 if self.secure else 80)
+        self.basePath = address.path.rstrip('/')
+        # Certificates and the hostname are checked like the thread engine does
+        self.sslContext = ssl.create_default_context() if self.secure else None
+
+        # Resolved once, not for every call. When it fails, each call fails with a connection error
+        self.family = socket.AF_INET
+        self.address = None
+        self.addressError = None
+        try:
+            self.family, _, _, _, self.address = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+        except socket.error as e:
+            self.addressError = e
+
+    def run(self, tasks, callback, startCallback=None):
+        '''
+        Description: Sends every task and calls callback(task) as soon as its response is parsed,
+            and startCallback(task) before it's first sent.
+        '''
+        self.callback = callback
+        tasks = iter(tasks)
+        exhausted = False
+
+        while True:
+            # Top up the in-flight window, calls due for a retry go first
+            wait = 0.1
+            while len(self.socketMap) < self.maxNumConnections:
+                task = self.throttledTask
+                if task is None:
+                    now = time.time()
+                    self.retries.sort(key=lambda retry: retry[0])
+                    if self.retries and self.retries[0][0] <= now:
+                        task = self.retries.pop(0)[1]
+                    else:
+                        # The tasks are read when a connection is free, and only then with a
+                        # queueSize of 0, e.g. when reading one waits for its scheduled time
+                        while not exhausted and len(self.queue) < max(1, self.queueSize):
+                            try:
+                                queued = next(tasks)
+                            except StopIteration:
+                                exhausted = True
+                                break
+                            queued.timing['enqueued'] = time.time()
+                            self.queue.append(queued)
+                        if self.queue:
+                            task = self.queue.popleft()
+                if task is None:
+                    break
+
+                tokenWait = self.__takeToken(task)
+                if tokenWait > 0:
+                    wait = min(wait, tokenWait)
+                    break
+                if task.attempts == 0 and startCallback is not None:
+                    startCallback(task)
+                try:
+                    AsyncRequest(self, task)
+                except socket.error as e:
+                    self.finish(task, None, CallError('connection', 'The connection failed: ' + str(e)))
+
+            if not self.socketMap:
+                if self.throttledTask is None and not self.retries and not self.queue and exhausted:
+                    break
+                if self.retries:
+                    wait = min(wait, self.retries[0][0] - time.time())
+                time.sleep(max(0, wait))
+                continue
+            # poll() isn't limited to file descriptors below 1024 like select()
+            asyncore.loop(timeout=wait, map=self.socketMap, count=1, use_poll=True)
+
+            now = time.time()
+            for request in self.socketMap.values():
+                request.checkDeadline(now)
+
+    def __takeToken(self, task):
+        # Returns 0 once the task can be sent, or how long until the rate limit allows it
+        if self.rateLimiter is None or self.rateLimiter.bucket is None:
+            return 0
+        wait = self.rateLimiter.bucket.tryTake()
+        if wait > 0:
+            if self.throttledTask is None:
+                self.throttledTask = task
+                self.throttledSince = time.time()
+            return wait
+        if self.throttledTask is not None:
+            self.rateLimiter.addThrottled(task.algo, time.time() - self.throttledSince)
+            self.throttledTask = None
+        return 0
+
+    def finish(self, task, response, error):
+        # Called once per attempt, hands the task back to the callback unless it's retried
+        task.response = response
+        task.error = error
+        if self.rateLimiter is not None:
+            self.rateLimiter.observe(error)
+        if error is not None:
+            if self.retryPolicy is not None and self.retryPolicy.shouldRetry(error, task.attempts):
+                self.retries.append((time.time() + self.retryPolicy.delay(task.attempts), task))
+                return
+            task.timing['failed'] = time.time()
+        self.callback(task)
+
+    def buildRequest(self, algo, input):
+        # Same encoding rules as Algorithmia.client.postJsonHelper
+        if input is None:
+            body = json.dumps(None)
+            contentType = 'application/json'
+        elif isinstance(input, basestring):
+            body = input.encode('utf-8') if isinstance(input, unicode) else input
+            contentType = 'text/plain'
+        elif isinstance(input, bytearray):
+            body = str(input)
+            contentType = 'application/octet-stream'
+        else:
+            body = json.dumps(input)
+            contentType = 'application/json'
+
+        path = algo
+        for prefix in ('algo://', '/'):
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+
+        headers = [
+            'POST ' + self.basePath + '/v1/algo/' + path + ' HTTP/1.0',
+            'Host: ' + self.host,
+            'Content-Type: ' + contentType,
+            'Content-Length: ' + str(len(body)),
+            'Connection: close'
+        ]
+        if self.apiKey is not None:
+            headers.append('Authorization: ' + self.apiKey)
+
+        return '\r\n'.join(headers) + '\r\n\r\n' + body
+
+    def parseResponse(self, rawResponse):
+        '''
+        Description: Returns the full JSON response, or raises a CallError if the call failed. This
+            matches what BenchThread stores after going through the patched pipe method.
+        '''
+        if not rawResponse:
+            raise CallError('connection', 'The connection was closed without a response')
+        elif '\r\n\r\n' not in rawResponse:
+            raise CallError('invalidResponse', 'The response is not valid HTTP')
+
+        head, body = rawResponse.split('\r\n\r\n', 1)
+        try:
+            status = int(head.split('\r\n', 1)[0].split()[1])
+        except (IndexError, ValueError):
+            raise CallError('invalidResponse', 'The response is not valid HTTP')
+        return parseApiResponse(status, body)
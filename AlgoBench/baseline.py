@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+import time
+
+from errors import AlgoBenchError
+
+# For each metric a regression check can be run on: whether a higher value is worse, and whether
+# its tolerance is relative to the baseline value (latencies, throughput) or absolute (rates)
+regressionMetrics = {
+    "mean": (True, True),
+    "p50": (True, True),
+    "p90": (True, True),
+    "p95": (True, True),
+    "p99": (True, True),
+    "p99.9": (True, True),
+    "throughput": (False, True),
+    "errorRate": (True, False),
+    "accuracy": (False, False),
+    "fScore": (False, False)
+}
+
+# default allows the mean to be 10% and the p95 20% slower, 1% more errors and 1% less accuracy
+defaultTolerances = {"mean": 0.1, "p95": 0.2, "errorRate": 0.01, "accuracy": 0.01}
+
+def splitAlgoVersion(algo):
+    '''
+    Description: Splits "userName/algoName/1.0.0" into ("userName/algoName", "1.0.0"). The
+        version is None for an algo without one.
+    '''
+    if algo.startswith('algo://'):
+        algo = algo[len('algo://'):]
+    parts = algo.split('/')
+    if len(parts) > 2:
+        return '/'.join(parts[:2]), '/'.join(parts[2:])
+    return algo, None
+
+def validateTolerances(tolerances):
+    if not isinstance(tolerances, dict):
+        raise AlgoBenchError('Please provide tolerances as a dict')
+    for metric, tolerance in tolerances.iteritems():
+        if metric not in regressionMetrics:
+            raise AlgoBenchError('Unknown regression metric ' + str(metric) + ', should be one of ' + ', '.join(sorted(regressionMetrics)))
+        elif not isinstance(tolerance, (int, float)) or tolerance < 0:
+            raise AlgoBenchError('The tolerance of ' + metric + ' should be a number that is at least 0')
+
+def checkMetrics(current, baseline, tolerances):
+    '''
+    Description: Compares the metrics of a run with those of its baseline. Returns one check per
+        metric in tolerances that both have: the baseline and current values, the change (relative
+        or absolute, positive when the current run is worse), the tolerance and whether it passed.
+    '''
+    checks = []
+    for metric in sorted(tolerances):
+        if current.get(metric) is None or baseline.get(metric) is None:
+            continue
+        higherIsWorse, relative = regressionMetrics[metric]
+        change = current[metric] - baseline[metric]
+        if not higherIsWorse:
+            change = -change
+        if relative:
+            change = float(change) / baseline[metric] if baseline[metric] else 0.0
+        checks.append({"metric": metric, "baseline": baseline[metric], "current": current[metric],
+                       "change": change, "tolerance": tolerances[metric], "passed": change <= tolerances[metric]})
+    return checks
+
+class BaselineStore(object):
+    '''
+    Description: SQLite database of the stats of earlier runs, keyed by algo, version and input
+        set. Each recorded run gets one row per algo, with its latency percentiles, throughput,
+        error rate and accuracy as metrics.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                            'algo TEXT NOT NULL, name TEXT NOT NULL, version TEXT, inputSet TEXT NOT NULL, '
+                            'recordedAt REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS runsByName ON runs (name, inputSet, recordedAt)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS metrics (runId INTEGER NOT NULL REFERENCES runs (id), '
+                            'metric TEXT NOT NULL, value REAL, PRIMARY KEY (runId, metric))')
+
+    def record(self, algo, inputSet, metrics, recordedAt=None):
+        # Appends the metrics of one algo, returns the id of the new run
+        name, version = splitAlgoVersion(algo)
+        if recordedAt is None:
+            recordedAt = time.time()
+        with self.lock, self.db:
+            cursor = self.db.execute('INSERT INTO runs (algo, name, version, inputSet, recordedAt) VALUES (?, ?, ?, ?, ?)',
+                                     (algo, name, version, inputSet, recordedAt))
+            runId = cursor.lastrowid
+            self.db.executemany('INSERT INTO metrics (runId, metric, value) VALUES (?, ?, ?)',
+                                [(runId, metric, value) for metric, value in metrics.iteritems()])
+        return runId
+
+    def baseline(self, algo, inputSet, version=None):
+        '''
+        Description: The most recent run of the same algo (any version of it, or only the given
+            version) on inputSet, as {"id", "algo", "version", "recordedAt", "metrics"}. None if
+            there's no such run.
+        '''
+        name = splitAlgoVersion(algo)[0]
+        query = 'SELECT id, algo, version, recordedAt FROM runs WHERE name = ? AND inputSet = ?'
+        params = [name, inputSet]
+        if version is not None:
+            query += ' AND version = ?'
+            params.append(version)
+        query += ' ORDER BY recordedAt DESC, id DESC LIMIT 1'
+        with self.lock:
+            row = self.db.execute(query, params).fetchone()
+            return self.__run(row) if row is not None else None
+
+    def history(self, algo, inputSet):
+        # Every recorded run of the algo (any version) on inputSet, oldest first
+        name = splitAlgoVersion(algo)[0]
+        with self.lock:
+            rows = self.db.execute('SELECT id, algo, version, recordedAt FROM runs WHERE name = ? AND inputSet = ? '
+                                   'ORDER BY recordedAt, id', (name, inputSet)).fetchall()
+            return [self.__run(row) for row in rows]
+
+    def __run(self, row):
+        # A (id, algo, version, recordedAt) row of runs with its metrics
+        metrics = dict(self.db.execute('SELECT metric, value FROM metrics WHERE runId = ?', (row[0],)).fetchall())
+        return {"id": row[0], "algo": row[1], "version": row[2], "recordedAt": row[3], "metrics": metrics}
+
+    def close(self):
+        self.db.close()
@@ -1,63 +1,170 @@
 import Algorithmia
+import Queue
+import collections
+import json
+import multiprocessing
+import pickle
+import random
+import requests
+import sys
 import threading
+import time
+from itertools import chain, islice
 from Algorithmia.algorithm import algorithm
+from aggregate import Aggregate, loadAggregate, saveAggregate
+from asyncengine import AsyncEngine
+from baseline import BaselineStore, checkMetrics, defaultTolerances, validateTolerances
+from cache import ResponseCache
+from connection import SessionPool
+from distributed import Coordinator, validateDistributed
+from errors import AlgoBenchError, CallError, asCallError, parseApiResponse
+from inputs import LabelledInputs, isLazyInput
+from loadprofile import arrivalTimes, expectedArrivals, validateLoadProfile
+from ratelimit import RateLimiter, TokenBucket, validateRateLimit
+from reporters import Reporter
+from retry import RetryPolicy
+from significance import bootstrapTest, mannWhitney, mcnemarTest, welchTest
+from sinks import ResultsSink
+from stats import ConfusionMatrix, DurationStats, EncodedResults, addDuration, addLatencies, averageScores, newLatencyStats, numpyStats
 from decimal import Decimal
 
-def pipe(self, input1):
-    responseJson = self.client.postJsonHelper(self.url, input1)
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-    # Parse response JSON
-    if 'error' in responseJson:
-        # Failure
-        raise Exception(responseJson['error']['message'])
+def postJsonHelper(client, url, input_object, timing, session=None, timeout=None):
+    '''
+    Description: Same as Algorithmia.client.postJsonHelper, but records when the request was
+        sent, when the response was received and when its JSON was parsed in timing. The request
+        goes through session (e.g. a SessionPool) when one is given. A failed call raises a
+        CallError.
+    '''
+    headers = {}
+    if client.apiKey is not None:
+        headers['Authorization'] = client.apiKey
+
+    input_json = None
+    if input_object is None:
+        input_json = json.dumps(None)
+        headers['Content-Type'] = 'application/json'
+    elif isinstance(input_object, basestring):
+        input_json = input_object
+        headers['Content-Type'] = 'text/plain'
+    elif isinstance(input_object, bytearray):
+        input_json = input_object
+        headers['Content-Type'] = 'application/octet-stream'
     else:
-        # Success, check content_type
-        if responseJson['metadata']['content_type'] == 'binary':
-            # Decode Base64 encoded binary file
-            return base64.b64decode(responseJson['result'])
-        elif responseJson['metadata']['content_type'] == 'void':
-            return None
-        else:
-            return responseJson
+        input_json = json.dumps(input_object)
+        headers['Content-Type'] = 'application/json'
+
+    post = session.post if session is not None else requests.post
+    timing['sent'] = time.time()
+    response = post(client.apiAddress + url, data=input_json, headers=headers, timeout=timeout)
+    timing['received'] = time.time()
+    responseJson = parseApiResponse(response.status_code, response.content)
+    timing['parsed'] = time.time()
+    return responseJson
+
+def pipe(self, input1, timing=None, session=None, timeout=None):
+    if timing is None:
+        timing = {}
+    # Error responses are raised as a CallError by postJsonHelper. The full JSON is returned
+    # whatever the content_type, so every result keeps its metadata (binary results stay base64
+    # encoded in the result, like with the async engine)
+    return postJsonHelper(self.client, self.url, input1, timing, session, timeout)
 
 # This is a monkey patch
 # Override default pipe method to return full JSON response
 algorithm.pipe = pipe
 
-threadLimiter = None
+def mapChunk(args):
+    # Maps a chunk of results for calcStats, at module level so it can run in a worker process
+    mapFunc, chunk = args
+    return [(res.get('algo'), res.get('callIndex'), mapFunc(res)) for res in chunk]
 
-class AlgoBenchError(Exception):
-     def __init__(self, value):
-         self.value = value
-     def __str__(self):
-         return repr(self.value)
+def mapChunks(pool, mapFunc, chunks, window):
+    # Maps the chunks in the pool in order, with at most window chunks handed to it at a time.
+    # Pool.imap would read every chunk up front, which can be all the results
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(mapChunk, ((mapFunc, chunk),)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def iterChunks(items, size):
+    # Lists of up to size consecutive items
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+def splitBatchResult(response, inputs):
+    '''
+    Description: Default batchSplitter, expects the algorithm to return a list with one result per
+        input of the batch, in the same order.
+    '''
+    return response['result']
 
 class Benchmark(object):
     def __init__(self, settings):
+        # Bumped whenever the results change as a whole, see __mapResults
+        self.resultsGeneration = 0
         self.results = []
         self.average = {}
         self.uncertainty = {}
+        self.percentiles = {}
+        self.stdDev = {}
+        self.confidenceInterval = {}
+        self.latency = {}
+        self.coldStarts = {}
+        self.throughput = {}
+        self.elapsed = 0
+        self.saturation = {}
+        self.sampling = {}
+        self.connections = {}
+        self.cacheStats = {}
+        self.errors = {}
+        self.errorRate = {}
+        self.throttled = {}
+        self.client = None
+        self.threadLimiter = None
+        self.retryPolicy = None
+        self.sessionPool = None
+        self.latencyStats = newLatencyStats()
+        self.durationStats = self.latencyStats['server']
         self.threadCount = 0
         self.currentThread = 0
         self.processedThread = 0
         self.threads = []
-        self.maxThreadPool = 200
+        self.resultLock = threading.Lock()
 
         self.settings = settings
+        self.sink = None
+        self.cache = None
 
-        self.stats = {}
-        self.stats["labels"] = []
-        self.stats["TP"] = {"labels": {}}
-        self.stats["FP"] = {"labels": {}}
-        self.stats["TN"] = {"labels": {}}
-        self.stats["FN"] = {"labels": {}}
-        self.stats["accuracy"] = {"overall": 0, "labels": {}}
-        self.stats["recall"] ={"labels": {}}
-        self.stats["precision"] = {"labels": {}}
-        self.stats["fScore"] = {"labels": {}}
+        self.stats = self.__newStats()
+        self.confusionMatrix = None
+        self.algoStats = {}
+        self.confusionMatrices = {}
+        self.predictions = {}
+        # (key, mapped results) of the last calcStats, see __mapResults
+        self.mapped = None
 
         self.__validateSettings(settings)
 
+    @property
+    def results(self):
+        return self.__results
+
+    @results.setter
+    def results(self, results):
+        self.__results = ResultList(results)
+        self.resultsGeneration += 1
+
     def __validateSettings(self, settings):
         '''
         Description: Validates settings and autmatically coverts input and algo parameters into
@@ -66,10 +173,31 @@ class Benchmark(object):
         Example settings:
             settings = {
                 "apiKey": "xxx",
+                "apiAddress": "https://api.algorithmia.com",
                 "numBenchRuns": 1,
                 "maxNumConnections": 10,
+                "rateLimit": {"rps": 20, "burst": 5, "adaptive": True},
+                "numWarmupRuns": 0,
+                "coldStartFactor": 3.0,
+                "timeout": 60,
+                "maxRetries": 0,
+                "retryBackoff": 0.5,
+                "engine": "thread" or "async",
+                "resultsSink": JsonLinesSink(path),
+                "responseCache": ResponseCache(path),
+                "cacheMode": "replay" or "bypass",
+                "loadProfile": {"pattern": "constant", "rps": 20, "duration": 60},
+                "statsBackend": "python" or "numpy",
+                "statsMapping": {"processes": 4, "chunkSize": 500, "memoize": True},
+                "batchSize": 1,
+                "batchSplitter": func(response, inputs),
                 "inputList": [inputs] or "inputLabelList: [{"data": data, "label": label},...]" or "inputSingle": input,
-                "algoList": [algos] or "algoSingle": algo
+                    (inputList and inputLabelList can also be generators or an InputSource)
+                "algoList": [algos] or "algoSingle": algo,
+                "matrixOrder": "interleaved" or "random",
+                "matrixSeed": 1,
+                "reporters": [ProgressReporter(), MetricsReporter()],
+                "distributed": {"processes": 4, "remote": [(host, port)], "authkey": key, "chunkSize": 50, "mapFunc": func}
                     }
         '''
         # Input validation and error handling
@@ -79,6 +207,12 @@ class Benchmark(object):
         if 'apiKey' not in settings:
             raise AlgoBenchError('Please provide an apiKey')
 
+        if 'apiAddress' not in settings:
+            # default is the address used by the Algorithmia client
+            settings['apiAddress'] = Algorithmia.getApiAddress()
+        elif not isinstance(settings['apiAddress'], basestring):
+            raise AlgoBenchError('Please provide apiAddress as a string')
+
         if 'numBenchRuns' not in settings:
             # default is 1
             settings['numBenchRuns'] = 1
@@ -97,15 +231,151 @@ class Benchmark(object):
             elif settings['maxNumConnections'] <= 0:
                 raise AlgoBenchError('maxNumConnections should be at least 1')
 
+        if 'rateLimit' in settings:
+            validateRateLimit(settings['rateLimit'])
+
+        if 'numWarmupRuns' not in settings:
+            # default is no warm-up
+            settings['numWarmupRuns'] = 0
+        else:
+            if not isinstance(settings['numWarmupRuns'], int):
+                raise AlgoBenchError('Number of numWarmupRuns should be an integer.')
+            elif settings['numWarmupRuns'] < 0:
+                raise AlgoBenchError('numWarmupRuns cannot be negative')
+
+        if 'coldStartFactor' not in settings:
+            # default is 3 times the median duration
+            settings['coldStartFactor'] = 3.0
+        else:
+            if not isinstance(settings['coldStartFactor'], (int, float)):
+                raise AlgoBenchError('coldStartFactor should be a number.')
+            elif settings['coldStartFactor'] <= 1:
+                raise AlgoBenchError('coldStartFactor should be greater than 1')
+
+        if 'timeout' not in settings:
+            # default is to wait as long as the call takes
+            settings['timeout'] = None
+        elif settings['timeout'] is not None:
+            if not isinstance(settings['timeout'], (int, float)):
+                raise AlgoBenchError('timeout should be a number.')
+            elif settings['timeout'] <= 0:
+                raise AlgoBenchError('timeout should be positive')
+
+        if 'maxRetries' not in settings:
+            # default is no retries
+            settings['maxRetries'] = 0
+        else:
+            if not isinstance(settings['maxRetries'], int):
+                raise AlgoBenchError('Number of maxRetries should be an integer.')
+            elif settings['maxRetries'] < 0:
+                raise AlgoBenchError('maxRetries cannot be negative')
+
+        if 'retryBackoff' not in settings:
+            # default waits up to 0.5s before the first retry, doubling after each attempt
+            settings['retryBackoff'] = 0.5
+        else:
+            if not isinstance(settings['retryBackoff'], (int, float)):
+                raise AlgoBenchError('retryBackoff should be a number.')
+            elif settings['retryBackoff'] < 0:
+                raise AlgoBenchError('retryBackoff cannot be negative')
+
+        if 'engine' not in settings:
+            # default is a pool of worker threads
+            settings['engine'] = 'thread'
+        elif settings['engine'] not in ('thread', 'async'):
+            raise AlgoBenchError('engine should be either thread or async')
+
+        if 'loadProfile' in settings:
+            validateLoadProfile(settings['loadProfile'])
+            if settings['engine'] != 'thread':
+                raise AlgoBenchError('loadProfile is only supported by the thread engine')
+
+        if 'saturation' in settings:
+            self.__validateSaturation(settings)
+
+        if 'adaptiveSampling' in settings:
+            self.__validateAdaptiveSampling(settings)
+
+        if 'distributed' in settings:
+            validateDistributed(settings)
+
+        if 'resultsSink' in settings:
+            if not isinstance(settings['resultsSink'], ResultsSink):
+                raise AlgoBenchError('Please provide resultsSink as a ResultsSink')
+            self.sink = settings['resultsSink']
+
+        if 'responseCache' in settings:
+            if not isinstance(settings['responseCache'], ResponseCache):
+                raise AlgoBenchError('Please provide responseCache as a ResponseCache')
+            self.cache = settings['responseCache']
+            if 'cacheMode' not in settings:
+                # default replays the cached responses
+                settings['cacheMode'] = 'replay'
+            elif settings['cacheMode'] not in ('replay', 'bypass'):
+                raise AlgoBenchError('cacheMode should be either replay or bypass')
+        elif 'cacheMode' in settings:
+            raise AlgoBenchError('cacheMode needs a responseCache')
+
+        if 'reporters' not in settings:
+            # default reports nothing while the run is in progress
+            settings['reporters'] = []
+        elif not isinstance(settings['reporters'], list):
+            raise AlgoBenchError('Please provide reporters as a list')
+        else:
+            for reporter in settings['reporters']:
+                if not isinstance(reporter, Reporter):
+                    raise AlgoBenchError('Please provide every reporter as a Reporter')
+
+        if 'statsBackend' not in settings:
+            # default is plain python
+            settings['statsBackend'] = 'python'
+        elif settings['statsBackend'] not in ('python', 'numpy'):
+            raise AlgoBenchError('statsBackend should be either python or numpy')
+        elif settings['statsBackend'] == 'numpy' and numpy is None:
+            raise AlgoBenchError('The numpy statsBackend requires numpy to be installed')
+
+        if 'statsMapping' not in settings:
+            settings['statsMapping'] = {}
+        elif not isinstance(settings['statsMapping'], dict):
+            raise AlgoBenchError('Please provide statsMapping as a dict')
+        statsMapping = settings['statsMapping']
+        # default maps the results in this process, 500 at a time, and keeps the mapped results
+        for key, default, minimum in [('processes', 0, 0), ('chunkSize', 500, 1)]:
+            statsMapping.setdefault(key, default)
+            if not isinstance(statsMapping[key], int):
+                raise AlgoBenchError('statsMapping ' + key + ' should be an integer')
+            elif statsMapping[key] < minimum:
+                raise AlgoBenchError('statsMapping ' + key + ' should be at least ' + str(minimum))
+        # default doesn't keep the mapped results when they're streamed to a resultsSink
+        statsMapping.setdefault('memoize', 'resultsSink' not in settings)
+        if not isinstance(statsMapping['memoize'], bool):
+            raise AlgoBenchError('statsMapping memoize should be True or False')
+
+        if 'batchSize' not in settings:
+            # default is one input per call
+            settings['batchSize'] = 1
+        else:
+            if not isinstance(settings['batchSize'], int):
+                raise AlgoBenchError('batchSize should be an integer.')
+            elif settings['batchSize'] <= 0:
+                raise AlgoBenchError('batchSize should be at least 1')
+
+        if 'batchSplitter' not in settings:
+            # default expects a list of results in the order of the inputs
+            settings['batchSplitter'] = splitBatchResult
+        elif not callable(settings['batchSplitter']):
+            raise AlgoBenchError('Please provide batchSplitter as a function')
+
         if 'algoList' not in settings and 'algoSingle' not in settings:
             raise AlgoBenchError('Please provide at least one algo')
         elif 'algoList' in settings and 'algoSingle' in settings:
             raise AlgoBenchError('You cannot provide algoList and algoSingle at the same time')
-        elif 'algoList' in settings:
-            if 'inputList' in settings:
-                raise AlgoBenchError('You cannot provide algoList and inputList at the same time')
-            elif 'inputLabelList' in settings:
-                raise AlgoBenchError('You cannot provide algoList and inputLabelList at the same time')
+
+        if 'matrixOrder' not in settings:
+            # default sends the algos in the same order for every input
+            settings['matrixOrder'] = 'interleaved'
+        elif settings['matrixOrder'] not in ('interleaved', 'random'):
+            raise AlgoBenchError('matrixOrder should be either interleaved or random')
 
         if 'inputList' not in settings and 'inputSingle' not in settings and 'inputLabelList' not in settings:
             raise AlgoBenchError('Please provide an input')
@@ -118,10 +388,15 @@ class Benchmark(object):
         elif 'inputList' in settings and 'inputSingle' in settings and 'inputLabelList' in settings:
             raise AlgoBenchError('You cannot provide inputList, inputSingle and inputLabelList at the same time')
         elif 'inputList' in settings:
-            if not isinstance(settings['inputList'], list):
+            if isLazyInput(settings['inputList']):
+                # Converted and validated as the inputs are read during the run
+                settings['inputLabelList'] = LabelledInputs(settings.pop('inputList'), False)
+            elif not isinstance(settings['inputList'], list):
                 raise AlgoBenchError('Please provide inputList as a list')
         elif 'inputLabelList' in settings:
-            if not isinstance(settings['inputLabelList'], list):
+            if isLazyInput(settings['inputLabelList']):
+                settings['inputLabelList'] = LabelledInputs(settings['inputLabelList'], True)
+            elif not isinstance(settings['inputLabelList'], list):
                 raise AlgoBenchError('Please provide inputLabelList as a list')
             elif isinstance(settings['inputLabelList'], list):
                 for item in settings['inputLabelList']:
@@ -140,143 +415,678 @@ class Benchmark(object):
         if 'inputList' in settings:
             settings['inputLabelList'] = map(lambda item: {"data": item, "label": None}, settings.pop('inputList'))
 
-    def __validateMappingFunc(self, algoResults):
-        for res in algoResults:
-            if 'result' in res and 'label' in res and len(res) == 2:
-                pass
-            else:
-                raise AlgoBenchError('Please provide a mapping function which returns in the valid format')
+    def __validateSaturation(self, settings):
+        '''
+        Description: Validates the saturation search settings and fills in the defaults.
+
+        Example settings:
+            settings["saturation"] = {
+                "mode": "concurrency" or "rps",
+                "start": 1,
+                "factor": 2,
+                "max": 256,
+                "callsPerStep": 50,
+                "stepDuration": 10,
+                "sloP99": 1.5,
+                "sloErrorRate": 0.01,
+                "sloMetric": "roundTrip"
+                    }
+        '''
+        saturation = settings['saturation']
+        if not isinstance(saturation, dict):
+            raise AlgoBenchError('Please provide saturation as a dict')
+
+        saturation.setdefault('mode', 'concurrency')
+        if saturation['mode'] not in ('concurrency', 'rps'):
+            raise AlgoBenchError('saturation mode should be either concurrency or rps')
+        elif saturation['mode'] == 'rps' and settings['engine'] != 'thread':
+            raise AlgoBenchError('The rps saturation mode is only supported by the thread engine')
+
+        # Open-loop steps are judged by the latency from the intended send time
+        saturation.setdefault('sloMetric', 'roundTrip' if saturation['mode'] == 'concurrency' else 'openLoop')
+        if saturation['sloMetric'] not in newLatencyStats():
+            raise AlgoBenchError('saturation sloMetric should be one of ' + ', '.join(sorted(newLatencyStats())))
+
+        defaults = [('start', 1), ('factor', 2), ('max', 256), ('callsPerStep', 50), ('stepDuration', 10), ('sloErrorRate', 0.01)]
+        for key, default in defaults:
+            saturation.setdefault(key, default)
+        for key, default in defaults + [('sloP99', None)]:
+            if not isinstance(saturation.get(key), (int, float)):
+                raise AlgoBenchError('saturation ' + key + ' should be a number')
+            elif saturation[key] <= 0 and key != 'sloErrorRate':
+                raise AlgoBenchError('saturation ' + key + ' should be positive')
+        if saturation['factor'] <= 1:
+            raise AlgoBenchError('saturation factor should be greater than 1')
+
+    def __validateAdaptiveSampling(self, settings):
+        '''
+        Description: Validates the adaptive sampling settings and fills in the defaults.
+
+        Example settings:
+            settings["adaptiveSampling"] = {
+                "targetWidth": 0.05,
+                "metric": "mean" or "p50", "p90", "p95", "p99", "p99.9",
+                "kind": "server",
+                "level": 0.95,
+                "minCalls": 20,
+                "maxCalls": 1000,
+                "checkEvery": 10
+                    }
+        '''
+        sampling = settings['adaptiveSampling']
+        if not isinstance(sampling, dict):
+            raise AlgoBenchError('Please provide adaptiveSampling as a dict')
+        if 'loadProfile' in settings:
+            raise AlgoBenchError('You cannot provide adaptiveSampling and loadProfile at the same time')
+
+        sampling.setdefault('metric', 'mean')
+        metrics = ['mean'] + [name for name, q in DurationStats.percentiles]
+        if sampling['metric'] not in metrics:
+            raise AlgoBenchError('adaptiveSampling metric should be one of ' + ', '.join(metrics))
+
+        sampling.setdefault('kind', 'server')
+        if sampling['kind'] not in newLatencyStats():
+            raise AlgoBenchError('adaptiveSampling kind should be one of ' + ', '.join(sorted(newLatencyStats())))
+
+        sampling.setdefault('level', 0.95)
+        if not isinstance(sampling['level'], float) or not 0 < sampling['level'] < 1:
+            raise AlgoBenchError('adaptiveSampling level should be between 0 and 1')
+
+        if not isinstance(sampling.get('targetWidth'), (int, float)) or sampling['targetWidth'] <= 0:
+            raise AlgoBenchError('adaptiveSampling targetWidth should be a positive number')
+
+        for key, default in [('minCalls', 20), ('maxCalls', 1000), ('checkEvery', 10)]:
+            sampling.setdefault(key, default)
+            # An interval needs at least 2 durations
+            minimum = 1 if key == 'checkEvery' else 2
+            if not isinstance(sampling[key], int):
+                raise AlgoBenchError('adaptiveSampling ' + key + ' should be an integer')
+            elif sampling[key] < minimum:
+                raise AlgoBenchError('adaptiveSampling ' + key + ' should be at least ' + str(minimum))
+        if sampling['maxCalls'] < sampling['minCalls']:
+            raise AlgoBenchError('adaptiveSampling maxCalls should be at least minCalls')
+
+    def __validateMappingFunc(self, res):
+        if 'result' in res and 'label' in res and len(res) == 2:
+            pass
+        else:
+            raise AlgoBenchError('Please provide a mapping function which returns in the valid format')
 
     def run(self):
-        apiKey = self.settings['apiKey']
         numBenchRuns = self.settings['numBenchRuns']
-        global threadLimiter
-        threadLimiter = threading.BoundedSemaphore(self.settings['maxNumConnections'])
+        self.__createClient()
+        # Every run starts over, the results and stats are those of this run only
+        self.results = []
+        self.processedThread = 0
         inputLabelList = self.settings['inputLabelList']
         algoList = self.settings['algoList']
 
+        lazy = isinstance(inputLabelList, LabelledInputs)
+        if lazy:
+            # Only the inputs needed for the warm-up are read ahead, the rest is read as the
+            # calls are sent
+            items = iter(inputLabelList)
+            inputLabelList = list(islice(items, max(1, self.settings['numWarmupRuns'])))
+            if len(inputLabelList) == 0:
+                raise AlgoBenchError('Please provide an input')
+            inputs = chain(inputLabelList, items)
+        else:
+            inputs = inputLabelList
+
         if len(algoList) > 1:
-            # Run different algo versions over the same input data
-            input = inputLabelList[0]["data"]
-            label = inputLabelList[0]["label"]
-            self.threadCount = len(algoList) * numBenchRuns
-            for algo in algoList:
-                self.__addThreads(apiKey, algo, input, label, numBenchRuns)
-                self.currentThread += 1
-        elif len(inputLabelList) > 1:
-            # Run different inputs over the same algo
+            # Run different algo versions over the same input data, every algo gets every input
+            self.threadCount = None if lazy else len(algoList) * len(inputLabelList) * numBenchRuns
+            calls = None
+        elif lazy or len(inputLabelList) > 1:
+            # Run different inputs over the same algo, the number of lazy inputs isn't known
             algo = algoList[0]
-            self.threadCount = len(inputLabelList) * numBenchRuns
-            for item in inputLabelList:
-                input = item["data"]
-                label = item["label"]
-                self.__addThreads(apiKey, algo, input, label, numBenchRuns)
-                self.currentThread += 1
+            self.threadCount = None if lazy else len(inputLabelList) * numBenchRuns
+            calls = ((algo, item["data"], item["label"]) for item in inputs)
         elif len(inputLabelList) == 1:
             #Run for single input and single algo
             algo = algoList[0]
             input = inputLabelList[0]["data"]
             label = inputLabelList[0]["label"]
             self.threadCount = numBenchRuns
-            self.__addThreads(apiKey, algo, input, label, numBenchRuns)
-            self.currentThread += 1
-        self.__processThreads()
+            calls = [(algo, input, label)]
+
+        if 'loadProfile' in self.settings:
+            # Open-loop: calls are sent at the rate of the load profile, cycling over the inputs,
+            # instead of as fast as the responses come back
+            profile = self.settings['loadProfile']
+            self.threadCount = expectedArrivals(profile)
+            if calls is None:
+                calls = ((algo, item["data"], item["label"]) for item in inputs for algo in algoList)
+            tasks = self.__addScheduledTasks(list(calls), profile)
+        elif 'adaptiveSampling' in self.settings:
+            # The number of calls to each algo depends on how fast its estimate converges
+            self.threadCount = None
+            if calls is None:
+                calls = ((algo, item["data"], item["label"]) for item in inputs for algo in algoList)
+            tasks = self.__addAdaptiveTasks(list(calls))
+        elif calls is None:
+            tasks = self.__addMatrixTasks(inputs, algoList, numBenchRuns)
+        else:
+            tasks = self.__addTasks(calls, numBenchRuns)
+        distributed = 'distributed' in self.settings
+        if self.settings['batchSize'] > 1 and not distributed:
+            # A distributed run sends the single calls, each worker batches its chunks in runCalls
+            tasks = self.__batchTasks(tasks, self.settings['batchSize'])
+
+        if self.settings['numWarmupRuns'] > 0:
+            self.__warmUp(algoList, inputLabelList)
+        if distributed:
+            self.__runDistributed(tasks)
+        else:
+            self.__processThreads(tasks)
+        self.__closeSessionPool()
+        if 'adaptiveSampling' in self.settings:
+            self.__summarizeSampling()
+
+    def __createClient(self):
+        '''
+        Description: Every benchmark has its own Algorithmia client and rate limiter, so several
+            benchmarks can run side by side in one process without sharing an apiKey or limits.
+        '''
+        self.client = Algorithmia.client(self.settings['apiKey'], self.settings['apiAddress'])
+        bucket = None
+        if 'rateLimit' in self.settings:
+            rateLimit = self.settings['rateLimit']
+            bucket = TokenBucket(rateLimit['rps'], rateLimit['burst'], rateLimit['adaptive'])
+        self.threadLimiter = RateLimiter(self.settings['maxNumConnections'], bucket)
+        self.retryPolicy = RetryPolicy(self.settings['maxRetries'], self.settings['retryBackoff'])
+
+    def __warmUp(self, algoList, inputLabelList):
+        '''
+        Description: Sends numWarmupRuns untimed calls to each algo before the benchmark starts, so
+            the measured calls don't pay for loading the algorithms. The responses are discarded.
+        '''
+        numWarmupRuns = self.settings['numWarmupRuns']
+        tasks = (BenchTask(algo, inputLabelList[i % len(inputLabelList)]["data"], None)
+                 for algo in algoList for i in range(numWarmupRuns))
+        self.__execute(tasks, lambda task: None)
+
+    def searchSaturation(self):
+        '''
+        Description: Finds the max sustainable throughput of each algo. The concurrency (or the
+            target request rate in rps mode) starts at saturation["start"] and is multiplied by
+            saturation["factor"] after each short measurement, until the p99 latency goes above
+            sloP99, the error rate goes above sloErrorRate or saturation["max"] is reached.
+
+            self.saturation[algo] = {
+                "sustainableLevel": last concurrency/rps within the SLO (None if the first step failed),
+                "maxThroughput": highest throughput measured within the SLO,
+                "curve": [{"level", "throughput", "p99", "errorRate", "calls", "withinSlo"}, ...]
+            }
+        '''
+        if 'saturation' not in self.settings:
+            raise AlgoBenchError('Please provide the saturation settings')
+
+        config = self.settings['saturation']
+        # The search cycles over the inputs, so lazy inputs are read into memory
+        inputLabelList = list(self.settings['inputLabelList'])
+        algoList = self.settings['algoList']
+
+        self.__createClient()
+        if self.settings['numWarmupRuns'] > 0:
+            self.__warmUp(algoList, inputLabelList)
+
+        for algo in algoList:
+            calls = [(algo, item["data"], item["label"]) for item in inputLabelList]
+            curve = []
+            level = config['start']
+            while level <= config['max']:
+                step = self.__measureSaturationStep(algo, calls, level)
+                curve.append(step)
+                if not step['withinSlo']:
+                    break
+                if config['mode'] == 'concurrency':
+                    level = max(level + 1, int(level * config['factor']))
+                else:
+                    level = level * config['factor']
+
+            sustainable = [step for step in curve if step['withinSlo']]
+            self.saturation[algo] = {
+                "sustainableLevel": sustainable[-1]['level'] if sustainable else None,
+                "maxThroughput": max(step['throughput'] for step in sustainable) if sustainable else None,
+                "curve": curve
+            }
+        self.__closeSessionPool()
+
+    def __measureSaturationStep(self, algo, calls, level):
+        # Runs a single short measurement of the saturation search at the given level
+        config = self.settings['saturation']
+        stepStats = newLatencyStats()
+        counts = {"calls": 0, "errors": 0}
+
+        def addStepResult(task):
+            with self.resultLock:
+                counts["calls"] += 1
+                if task.response is None:
+                    counts["errors"] += 1
+                addLatencies(stepStats, {"response": task.response, "algo": task.algo, "timing": task.timing})
+
+        if config['mode'] == 'concurrency':
+            self.threadLimiter = RateLimiter(level, self.threadLimiter.bucket)
+            tasks = (BenchTask(*calls[i % len(calls)]) for i in xrange(config['callsPerStep']))
+            numWorkers = level
+            openLoop = False
+        else:
+            numWorkers = self.settings['maxNumConnections']
+            self.threadLimiter = RateLimiter(numWorkers, self.threadLimiter.bucket)
+            tasks = self.__addScheduledTasks(calls, {"pattern": "constant", "rps": level, "duration": config['stepDuration']})
+            openLoop = True
+
+        start = time.time()
+        self.__execute(tasks, addStepResult, numWorkers, openLoop)
+        elapsed = time.time() - start
+
+        metricStats = stepStats[config['sloMetric']].get(algo)
+        p99 = metricStats.percentile(0.99) if metricStats is not None else None
+        errorRate = float(counts["errors"]) / counts["calls"] if counts["calls"] else 1.0
+        return {
+            "level": level,
+            "calls": counts["calls"],
+            "throughput": (counts["calls"] - counts["errors"]) / elapsed,
+            "p99": p99,
+            "errorRate": errorRate,
+            "withinSlo": p99 is not None and p99 <= config['sloP99'] and errorRate <= config['sloErrorRate']
+        }
+
+    def __newStats(self):
+        stats = {}
+        stats["labels"] = []
+        stats["TP"] = {"labels": {}}
+        stats["FP"] = {"labels": {}}
+        stats["TN"] = {"labels": {}}
+        stats["FN"] = {"labels": {}}
+        stats["accuracy"] = {"overall": 0, "labels": {}}
+        stats["recall"] ={"labels": {}}
+        stats["precision"] = {"labels": {}}
+        stats["fScore"] = {"labels": {}}
+        return stats
 
     def calcStats(self, mapFunc):
         '''
         Description: Calculates certain stats like accuracy, recall, precision,
             f-score etc. Requires a mapping function for mapping algorithm results.
             Requires labelled data for calculations. Needs at least 2 classes (binary classification).
+            The stats over all the results are kept in self.stats, and the stats of each algo
+            version in self.algoStats[algo]. Failed calls have no response and are left out, they
+            are counted in self.errors and self.errorRate instead.
 
         '''
         if not self.__hasLabels():
             raise AlgoBenchError('Cannot evaluate stats because data is unlabeled or is incorrectly labelled (has None amond labels).')
 
-        #algoResults = [{"result": result, "label": label}]
-        algoResults = map(mapFunc, self.results)
+        labels = self.stats['labels']
+        self.algoStats = {}
+        self.confusionMatrices = {}
+        self.predictions = {}
+        if self.settings['statsBackend'] == 'numpy':
+            # Encode the mapped results as integer arrays and let numpy do the counting
+            encoded = EncodedResults()
+            algoEncoded = {}
+            for algo, callIndex, result, label in self.__mapResults(mapFunc):
+                encoded.add(result, label)
+                self.__addPrediction(algo, callIndex, result, label)
+                if algo not in algoEncoded:
+                    algoEncoded[algo] = EncodedResults()
+                algoEncoded[algo].add(result, label)
+
+            self.confusionMatrix, labelStats = numpyStats(encoded, labels)
+            self.__updateStats(self.stats, labelStats)
+            for algo in algoEncoded:
+                self.confusionMatrices[algo], labelStats = numpyStats(algoEncoded[algo], labels)
+                self.algoStats[algo] = self.__newStats()
+                self.algoStats[algo]['labels'] = labels
+                self.__updateStats(self.algoStats[algo], labelStats)
+        else:
+            # Map and count every result in a single pass, the overall counts are the sum of
+            # the counts of each algo
+            for algo, callIndex, result, label in self.__mapResults(mapFunc):
+                self.__addPrediction(algo, callIndex, result, label)
+                if algo not in self.confusionMatrices:
+                    self.confusionMatrices[algo] = ConfusionMatrix()
+                self.confusionMatrices[algo].add(result, label)
+
+            self.__calcAllMatrixStats()
+
+    def __calcAllMatrixStats(self):
+        # Stats of each algo from self.confusionMatrices, and the overall stats from their sum
+        labels = self.stats['labels']
+        self.algoStats = {}
+        matrix = ConfusionMatrix()
+        for algo in self.confusionMatrices:
+            matrix.merge(self.confusionMatrices[algo])
+            self.algoStats[algo] = self.__newStats()
+            self.algoStats[algo]['labels'] = labels
+            self.__calcMatrixStats(self.confusionMatrices[algo], self.algoStats[algo])
+        self.confusionMatrix = matrix
+        self.__calcMatrixStats(matrix, self.stats)
+
+    def __mapResults(self, mapFunc):
+        '''
+        Description: Yields (algo, callIndex, result, label) for every successful result, with the result and
+            label returned by mapFunc. The results are mapped statsMapping chunkSize at a time, in a
+            pool of statsMapping processes when there are any. With memoize, the mapped results
+            are kept, and calling calcStats again with the same function object on the same
+            results doesn't map them again. The results are the same as long as there was no run
+            or merge, self.results wasn't replaced and the list wasn't changed in place.
+        '''
+        config = self.settings['statsMapping']
+        key = (mapFunc, self.resultsGeneration, self.results.version)
+        if self.mapped is not None and self.mapped[0] == key:
+            for mapped in self.mapped[1]:
+                yield mapped
+            return
+
+        pool = None
+        chunks = iterChunks(self.__iterSuccessful(), config['chunkSize'])
+        if config['processes'] > 0:
+            try:
+                pickle.dumps(mapFunc)
+            except Exception:
+                raise AlgoBenchError('Please provide a mapping function defined at module level, it is sent to the statsMapping processes')
+            pool = multiprocessing.Pool(config['processes'])
+            mappedChunks = mapChunks(pool, mapFunc, chunks, 2 * config['processes'])
+        else:
+            mappedChunks = (mapChunk((mapFunc, chunk)) for chunk in chunks)
+
+        memo = [] if config['memoize'] else None
+        try:
+            for mappedChunk in mappedChunks:
+                for algo, callIndex, algoResult in mappedChunk:
+                    #algoResult = {"result": result, "label": label}
+                    self.__validateMappingFunc(algoResult)
+                    mapped = (algo, callIndex, algoResult['result'], algoResult['label'])
+                    if memo is not None:
+                        memo.append(mapped)
+                    yield mapped
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        if memo is not None:
+            self.mapped = (key, memo)
+
+    def __addPrediction(self, algo, callIndex, result, label):
+        # Whether each call was predicted right, by algo and position among the calls to the algo
+        if callIndex is not None:
+            self.predictions.setdefault(algo, {})[callIndex] = result == label
+
+    def compare(self, algoA, algoB, kind="server", numResamples=2000):
+        '''
+        Description: Tests whether the durations of algoB differ from those of algoA (e.g. an old
+            and a new version), for any latency kind (see self.latency). Differences are B - A, so
+            a negative difference means algoB is faster.
+
+            {
+                "meanA", "meanB", "difference",
+                "welch": {"t", "df", "p", "effectSize" (Cohen's d)},
+                "mannWhitney": {"u", "z", "p", "effectSize" (rank-biserial correlation)},
+                "bootstrap": {"difference", "confidenceInterval", "p"},
+                "mcnemar": {"pairs", "onlyA", "onlyB", "statistic", "p", "oddsRatio"} or None
+            }
+
+            Welch's t-test uses the exact running mean and variance, the Mann-Whitney U and
+            bootstrap tests use the random sample of up to 1000 durations kept for each algo.
+            McNemar's test compares how often each algo was right on the same calls, and needs
+            calcStats to have been run on a matrix run (the k-th call to each algo has the same
+            input); it's None otherwise.
+        '''
+        if kind not in self.latencyStats:
+            raise AlgoBenchError('kind should be one of ' + ', '.join(sorted(self.latencyStats)))
+        for algo in (algoA, algoB):
+            if algo not in self.latencyStats[kind] or self.latencyStats[kind][algo].count < 2:
+                raise AlgoBenchError('At least 2 ' + kind + ' durations of ' + algo + ' are needed for a comparison')
+
+        statsA = self.latencyStats[kind][algoA]
+        statsB = self.latencyStats[kind][algoB]
+        samplesA = statsA.reservoir.samples
+        samplesB = statsB.reservoir.samples
+        comparison = {
+            "meanA": statsA.mean(),
+            "meanB": statsB.mean(),
+            "difference": statsB.mean() - statsA.mean(),
+            "welch": welchTest(statsA, statsB),
+            "mannWhitney": mannWhitney(samplesA, samplesB),
+            "bootstrap": bootstrapTest(samplesA, samplesB, numResamples),
+            "mcnemar": None
+        }
+        if algoA in self.predictions and algoB in self.predictions:
+            comparison["mcnemar"] = mcnemarTest(self.predictions[algoA], self.predictions[algoB])
+        return comparison
+
+    def snapshot(self, includeResults=False):
+        '''
+        Description: Returns an Aggregate of the last run (and of any snapshots merged into it):
+            the latency aggregates, error and connection counts, throttled time and, after
+            calcStats, the confusion matrices and predictions of each algo. The raw results are
+            only included with includeResults.
+        '''
+        aggregate = Aggregate()
+        aggregate.count = sum(errors["calls"] for errors in self.errors.itervalues())
+        aggregate.elapsed = self.elapsed
+        aggregate.settings = dict((key, self.settings[key]) for key in ('algoList', 'maxNumConnections', 'coldStartFactor'))
+        aggregate.latencyStats = self.latencyStats
+        aggregate.errors = self.errors
+        aggregate.connections = self.connections
+        aggregate.throttled = self.throttled
+        aggregate.confusionMatrices = self.confusionMatrices
+        aggregate.predictions = self.predictions
+        if includeResults:
+            aggregate.results = list(self.__iterResults())
+        return aggregate
+
+    def save(self, path, includeResults=False):
+        '''
+        Description: Saves a snapshot of the run to path (JSON, gzip compressed if the path ends
+            with .gz), to be merged with other runs or compared later with Benchmark.load.
+        '''
+        saveAggregate(self.snapshot(includeResults), path, includeResults)
+
+    @staticmethod
+    def load(paths):
+        '''
+        Description: Returns a Benchmark with the merged stats of one or more saved snapshots,
+            e.g. the shards of a run split over parallel jobs. It can't be run, but has every stat
+            of a finished run.
+        '''
+        if isinstance(paths, basestring):
+            paths = [paths]
+        aggregates = [loadAggregate(path) for path in paths]
+        settings = {"apiKey": None, "inputList": []}
+        settings["algoList"] = []
+        for aggregate in aggregates:
+            for algo in aggregate.settings.get('algoList', []):
+                if algo not in settings["algoList"]:
+                    settings["algoList"].append(algo)
+        for key in ('maxNumConnections', 'coldStartFactor'):
+            if key in aggregates[0].settings:
+                settings[key] = aggregates[0].settings[key]
+
+        benchmark = Benchmark(settings)
+        for aggregate in aggregates:
+            benchmark.merge(aggregate)
+        return benchmark
+
+    def merge(self, other):
+        '''
+        Description: Merges another run into this one, and recalculates every stat as if all of
+            the calls had been made in a single run, without going over the results again. other
+            is a Benchmark, an Aggregate or the path of a saved snapshot. The runs are assumed to
+            have run at the same time, so the throughput is over the longest elapsed time. The
+            predictions of other are renumbered after those of this run, so McNemar's test pairs
+            the calls within each run. Raw results are added to self.results, except with a
+            resultsSink, which isn't rewritten.
+        '''
+        if isinstance(other, Benchmark):
+            other = other.snapshot(includeResults=other.sink is None)
+        elif isinstance(other, basestring):
+            other = loadAggregate(other)
+        elif not isinstance(other, Aggregate):
+            raise AlgoBenchError('Please provide a Benchmark, an Aggregate or the path of a snapshot to merge')
+
+        self.mapped = None
+        self.resultsGeneration += 1
+        indexOffset = 1 + max([-1] + [callIndex for predictions in self.predictions.itervalues() for callIndex in predictions])
+        total = self.snapshot()
+        total.merge(other, indexOffset)
+        if self.sink is None:
+            self.results.extend(total.results)
+
+        self.elapsed = total.elapsed
+        self.latencyStats = total.latencyStats
+        self.connections = total.connections
+        self.errors = total.errors
+        self.throttled = total.throttled
+        self.__finishRun(detectColdStarts=False)
+
+        self.confusionMatrices = total.confusionMatrices
+        self.predictions = total.predictions
+        if self.confusionMatrices:
+            self.__calcMergedMatrixStats()
 
-        self.__validateMappingFunc(algoResults)
+    def __baselineMetrics(self, algo):
+        # The stats of an algo that are kept in a BaselineStore
+        metrics = {"throughput": self.throughput.get(algo), "errorRate": self.errorRate.get(algo)}
+        if algo in self.latency.get('server', {}):
+            latency = self.latency['server'][algo]
+            for key in ["count", "mean", "stdDev"] + [name for name, q in DurationStats.percentiles]:
+                metrics[key] = latency[key]
+        if algo in self.algoStats:
+            metrics["accuracy"] = self.algoStats[algo]["accuracy"]["overall"]
+            metrics["fScore"] = self.algoStats[algo]["fScore"].get("macro")
+        return metrics
 
+    def __baselineAlgos(self):
+        return [algo for algo in self.settings['algoList'] if algo in self.errors or algo in self.algoStats]
+
+    def recordBaseline(self, store, inputSet):
+        '''
+        Description: Appends the stats of each algo of the run (latency percentiles, throughput,
+            error rate and, after calcStats, accuracy and macro F1 Score) to a BaselineStore,
+            under the name of the inputs that were used. Returns the id of each new run by algo.
+        '''
+        if not isinstance(store, BaselineStore):
+            raise AlgoBenchError('Please provide store as a BaselineStore')
+        recordedAt = time.time()
+        return dict((algo, store.record(algo, inputSet, self.__baselineMetrics(algo), recordedAt))
+                    for algo in self.__baselineAlgos())
+
+    def checkRegression(self, store, inputSet, tolerances=None, baselineVersion=None):
+        '''
+        Description: Compares the stats of each algo of the run with its baseline, the most recent
+            run of the same algo (or of its baselineVersion) on inputSet recorded in the store.
+            tolerances maps metrics to how much worse they may get: relative for the latencies and
+            throughput (0.1 is 10% slower), absolute for errorRate and accuracy. Run it before
+            recordBaseline, or the run is its own baseline.
+
+            {
+                "passed": bool,
+                "algos": {algo: {
+                    "baseline": {"id", "algo", "version", "recordedAt", "metrics"} or None,
+                    "checks": [{"metric", "baseline", "current", "change", "tolerance", "passed"}],
+                    "passed": bool
+                }}
+            }
+
+            An algo without a baseline passes, the first recorded run becomes its baseline.
+        '''
+        if not isinstance(store, BaselineStore):
+            raise AlgoBenchError('Please provide store as a BaselineStore')
+        if tolerances is None:
+            tolerances = defaultTolerances
+        validateTolerances(tolerances)
+
+        report = {"passed": True, "algos": {}}
+        for algo in self.__baselineAlgos():
+            baseline = store.baseline(algo, inputSet, baselineVersion)
+            checks = []
+            if baseline is not None:
+                checks = checkMetrics(self.__baselineMetrics(algo), baseline["metrics"], tolerances)
+            passed = all(check["passed"] for check in checks)
+            report["algos"][algo] = {"baseline": baseline, "checks": checks, "passed": passed}
+            report["passed"] = report["passed"] and passed
+        return report
+
+    def __updateStats(self, stats, labelStats):
+        # Fills in the per label stats from numpyStats, and the averages
+        for key in labelStats:
+            stats[key].update(labelStats[key])
+        averages = averageScores(stats)
+        for key in averages:
+            stats[key].update(averages[key])
+
+    def __calcMatrixStats(self, matrix, stats):
         # Calculate basics: TP, TN, FP, FN
-        self.__calcBasics(algoResults)
-        self.__calcAccuracy(algoResults)
-        self.__calcPrecision()
-        self.__calcRecall()
-        self.__calcFScore()
+        self.__calcBasics(matrix, stats)
+        self.__calcAccuracy(matrix, stats)
+        self.__calcPrecision(stats)
+        self.__calcRecall(stats)
+        self.__calcFScore(stats)
+
+        # Macro, micro and weighted averages of precision, recall and F1 Score
+        averages = averageScores(stats)
+        for key in averages:
+            stats[key].update(averages[key])
 
-    def __calcBasics(self, algoResults):
+    def __calcBasics(self, matrix, stats):
         '''
         Description: True positives, false positives, true negatives and false negatives are calculated.
             OvR (one vs Rest) method is used here for the purpose of the stats calculations needing binary
-            classification.
-        '''
-        for label in self.stats['labels']:
-            self.stats['TP']['labels'][label] = 0
-            self.stats['FP']['labels'][label] = 0
-            self.stats['TN']['labels'][label] = 0
-            self.stats['FN']['labels'][label] = 0
-
-            for res in algoResults:
-                if res['label'] == label:
-                    if res['result'] == label:
-                        self.stats['TP']['labels'][label] += 1
-                    elif res['result'] != label:
-                        self.stats['FN']['labels'][label] += 1
-                elif res['label'] != label:
-                    if res['result'] == label:
-                        self.stats['FP']['labels'][label] += 1
-                    elif res['result'] != label:
-                        self.stats['TN']['labels'][label] += 1
-
-    def __calcAccuracy(self, algoResults):
+            classification. The counts come from the confusion matrix, so the results aren't revisited
+            for every label.
+        '''
+        basics = matrix.basics(stats['labels'])
+        for key in ('TP', 'FP', 'TN', 'FN'):
+            stats[key]['labels'].update(basics[key])
+
+    def __calcAccuracy(self, matrix, stats):
         # Calculate accuracy for each label/class
-        for label in self.stats['labels']:
-            TP = self.stats['TP']['labels'][label]
-            FP = self.stats['FP']['labels'][label]
-            TN = self.stats['TN']['labels'][label]
-            FN = self.stats['FN']['labels'][label]
-            self.stats['accuracy']['labels'][label] = float(TP + TN)/float(TP + FP + TN + FN)
+        for label in stats['labels']:
+            TP = stats['TP']['labels'][label]
+            FP = stats['FP']['labels'][label]
+            TN = stats['TN']['labels'][label]
+            FN = stats['FN']['labels'][label]
+            stats['accuracy']['labels'][label] = float(TP + TN)/float(TP + FP + TN + FN)
 
         # Calculate overall accuracy for the algorithm
-        overall_positive = 0
-        overall_negative = 0
-        for res in algoResults:
-            if res['result'] == res['label']:
-                overall_positive += 1
-            elif res['result'] != res['label']:
-                overall_negative += 1
+        overall_positive = matrix.correct()
+        overall_negative = matrix.total - overall_positive
 
         if float(overall_positive + overall_negative) == 0.0:
-            self.stats['accuracy']['overall'] = None
+            stats['accuracy']['overall'] = None
         else:
-            self.stats['accuracy']['overall'] = float(overall_positive) / float(overall_positive + overall_negative)
+            stats['accuracy']['overall'] = float(overall_positive) / float(overall_positive + overall_negative)
 
-    def __calcPrecision(self):
+    def __calcPrecision(self, stats):
         # Calculate precision for each label/class
-        for label in self.stats['labels']:
-            TP = self.stats['TP']['labels'][label]
-            FP = self.stats['FP']['labels'][label]
+        for label in stats['labels']:
+            TP = stats['TP']['labels'][label]
+            FP = stats['FP']['labels'][label]
             if float(TP + FP) == 0.0:
-                self.stats['precision']['labels'][label] = None
+                stats['precision']['labels'][label] = None
             else:
-                self.stats['precision']['labels'][label] = float(TP)/float(TP + FP)
+                stats['precision']['labels'][label] = float(TP)/float(TP + FP)
 
-    def __calcRecall(self):
+    def __calcRecall(self, stats):
         # Calculate precision for each label/class
-        for label in self.stats['labels']:
-            TP = self.stats['TP']['labels'][label]
-            FN = self.stats['FN']['labels'][label]
+        for label in stats['labels']:
+            TP = stats['TP']['labels'][label]
+            FN = stats['FN']['labels'][label]
 
             if float(TP + FN) == 0.0:
-                self.stats['recall']['labels'][label] = None
+                stats['recall']['labels'][label] = None
             else:
-                self.stats['recall']['labels'][label] = float(TP)/float(TP + FN)
+                stats['recall']['labels'][label] = float(TP)/float(TP + FN)
 
-    def __calcFScore(self):
+    def __calcFScore(self, stats):
         # Calculate F1 Score for each label/class
-        for label in self.stats['labels']:
-            precision = self.stats['precision']['labels'][label]
-            recall = self.stats['recall']['labels'][label]
+        for label in stats['labels']:
+            precision = stats['precision']['labels'][label]
+            recall = stats['recall']['labels'][label]
 
             try:
                 if float(precision+recall) == 0.0:
@@ -284,20 +1094,16 @@ class Benchmark(object):
                 else:
                     fScore = float(2*precision*recall)/float(precision+recall)
 
-                self.stats['fScore']['labels'][label] = fScore
+                stats['fScore']['labels'][label] = fScore
             except TypeError:
-                self.stats['fScore']['labels'][label] = None
+                stats['fScore']['labels'][label] = None
 
     def __hasLabels(self):
         '''
         Description: Tells you if there exists at least 1 unique label. If so, It'll keep a copy
             in self.stats['label']
         '''
-        labels = []
-        for res in self.results:
-            labels.append(res['label'])
-
-        uniqueLabels = list(set(labels))
+        uniqueLabels = list(set(res['label'] for res in self.__iterSuccessful()))
 
         if len(uniqueLabels) >= 2 and None not in uniqueLabels:
             self.stats['labels'] = uniqueLabels
@@ -305,65 +1111,515 @@ class Benchmark(object):
         else:
             return False
 
-    def __addThreads(self, apiKey, algo, input, label, numBenchRuns):
-        # Create new pool of threads
-        for i in range(numBenchRuns):
-            self.threads.append(BenchThread(apiKey, algo, input, label))
-
-    def __processThreads(self):
-        '''
-        Description: Divides the thread pool into smaller chunks for OS related
-            resource restrictions
-        '''
-        quotient = int(self.threadCount / self.maxThreadPool)
-        remainder = self.threadCount % self.maxThreadPool
-
-        # Iterate over each equally sized sub-thread pool + the remaining thread pool
-        for i in range(quotient + 1):
-            # Only iterate over equally sized sub-thread pools
-            if i != quotient:
-                for j in range((i*self.maxThreadPool),((i+1)*self.maxThreadPool)):
-                    self.threads[j].start()
-                for t in self.threads[(i*self.maxThreadPool):((i+1)*self.maxThreadPool)]:
-                    t.join()
-                    self.processedThread += 1
-                    print str(self.processedThread) + "/" + str(self.threadCount)
-                    self.results.append({"response": t.response, "algo": t.algo, "label": t.label})
-            # Iterate over the remaining thread pool
+    def __addTasks(self, calls, numBenchRuns):
+        '''
+        Description: Lazily yields one BenchTask per (algo, input, label) call and run, so
+            only the tasks waiting in the work queue are ever held in memory.
+        '''
+        # Position of each call among the calls to the same algo
+        callIndex = {}
+        for algo, input, label in calls:
+            for i in range(numBenchRuns):
+                callIndex[algo] = callIndex.get(algo, -1) + 1
+                yield BenchTask(algo, input, label, callIndex[algo])
+            self.currentThread += 1
+
+    def __addMatrixTasks(self, inputs, algoList, numBenchRuns):
+        '''
+        Description: Lazily yields the algo x input x run tasks of a matrix run as one interleaved
+            workload: every algo is called once with an input before the next run or input. With
+            matrixOrder random, the algos are shuffled within each of these blocks, so no version
+            is systematically sent first while the calls of all versions stay spread over the run.
+        '''
+        shuffle = self.settings['matrixOrder'] == 'random'
+        rand = random.Random(self.settings.get('matrixSeed'))
+        order = list(algoList)
+        callIndex = {}
+        for item in inputs:
+            for i in range(numBenchRuns):
+                if shuffle:
+                    rand.shuffle(order)
+                for algo in order:
+                    callIndex[algo] = callIndex.get(algo, -1) + 1
+                    yield BenchTask(algo, item["data"], item["label"], callIndex[algo])
+            self.currentThread += 1
+
+    def __addAdaptiveTasks(self, calls):
+        '''
+        Description: Keeps yielding tasks for each algo, cycling over its calls, until the
+            confidence interval on its adaptiveSampling metric is narrower than targetWidth times
+            the estimate, or maxCalls calls were sent. The algos take turns, and convergence is
+            checked against the durations aggregated so far every checkEvery results.
+        '''
+        config = self.settings['adaptiveSampling']
+        algoCalls = {}
+        active = []
+        for algo, input, label in calls:
+            if algo not in algoCalls:
+                algoCalls[algo] = []
+                active.append(algo)
+            algoCalls[algo].append((input, label))
+
+        self.sampling = dict((algo, {"calls": 0, "relativeWidth": None, "converged": False}) for algo in active)
+        checked = dict.fromkeys(active, 0)
+        while active:
+            for algo in list(active):
+                sampling = self.sampling[algo]
+                snapshot = None
+                with self.resultLock:
+                    stats = self.latencyStats[config['kind']].get(algo)
+                    count = stats.count if stats is not None else 0
+                    if count >= config['minCalls'] and count - checked[algo] >= config['checkEvery']:
+                        checked[algo] = count
+                        # A copy, so the workers don't wait on the lock while the interval is computed
+                        snapshot = DurationStats.fromDict(stats.toDict())
+                if snapshot is not None:
+                    sampling["relativeWidth"] = self.__relativeWidth(snapshot)
+                    sampling["converged"] = sampling["relativeWidth"] <= config['targetWidth']
+
+                if sampling["converged"] or sampling["calls"] >= config['maxCalls']:
+                    active.remove(algo)
+                    continue
+                input, label = algoCalls[algo][sampling["calls"] % len(algoCalls[algo])]
+                yield BenchTask(algo, input, label, sampling["calls"])
+                sampling["calls"] += 1
+
+    def __relativeWidth(self, stats):
+        # Width of the confidence interval on the adaptiveSampling metric, relative to the estimate
+        config = self.settings['adaptiveSampling']
+        if config['metric'] == 'mean':
+            estimate = stats.mean()
+            low, high = stats.tConfidenceInterval(config['level'])
+        else:
+            q = dict(DurationStats.percentiles)[config['metric']]
+            estimate = stats.percentile(q)
+            low, high = stats.percentileConfidenceInterval(q, config['level'])
+        if estimate <= 0:
+            return float('inf')
+        return (high - low) / estimate
+
+    def __summarizeSampling(self):
+        # The final interval width of each algo, including the calls still in flight at the stop
+        config = self.settings['adaptiveSampling']
+        for algo in self.sampling:
+            stats = self.latencyStats[config['kind']].get(algo)
+            if stats is not None and stats.count >= 2:
+                self.sampling[algo]["relativeWidth"] = self.__relativeWidth(stats)
+                self.sampling[algo]["converged"] = self.sampling[algo]["relativeWidth"] <= config['targetWidth']
+
+    def __addScheduledTasks(self, calls, profile):
+        '''
+        Description: Yields one BenchTask at each arrival time of the load profile, cycling over the
+            calls. The intended send time is kept in the task timing, so latency can be measured from
+            when the request should have gone out rather than from when a connection was free.
+        '''
+        callIndex = {}
+        i = 0
+        start = time.time()
+        for offset in arrivalTimes(profile):
+            intended = start + offset
+            delay = intended - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            algo, input, label = calls[i % len(calls)]
+            i += 1
+            callIndex[algo] = callIndex.get(algo, -1) + 1
+            task = BenchTask(algo, input, label, callIndex[algo])
+            task.timing['intended'] = intended
+            yield task
+
+    def __batchTasks(self, tasks, batchSize):
+        '''
+        Description: Packs consecutive tasks for the same algo into a single task whose input is the
+            list of their inputs. The original tasks are kept in task.batch, so the response can be
+            split back into one result per input once the call completes. Incomplete batches are
+            sent once the tasks run out.
+        '''
+        pending = {}
+        batchIndex = {}
+        for task in tasks:
+            items = pending.setdefault(task.algo, [])
+            items.append(task)
+            if len(items) == batchSize:
+                batchIndex[task.algo] = batchIndex.get(task.algo, -1) + 1
+                yield BenchTask.batchOf(items, batchIndex[task.algo])
+                pending[task.algo] = []
+
+        for algo in pending:
+            if pending[algo]:
+                batchIndex[algo] = batchIndex.get(algo, -1) + 1
+                yield BenchTask.batchOf(pending[algo], batchIndex[algo])
+
+    def __splitBatch(self, task):
+        '''
+        Description: Splits the response of a batched call into one result per input with
+            batchSplitter. Each item is given an equal share of the batch duration as its duration,
+            and the duration of the whole call is kept in result["batch"]. When the call failed, or
+            batchSplitter doesn't return a result per input, every item of the batch has an empty
+            response.
+        '''
+        items = task.batch
+        responses = [None] * len(items)
+        error = task.error
+        batchDuration = None
+        if task.response is not None:
+            try:
+                outputs = self.settings['batchSplitter'](task.response, [item.input for item in items])
+            except Exception as e:
+                outputs = e
+            if isinstance(outputs, list) and len(outputs) == len(items):
+                metadata = task.response['metadata']
+                batchDuration = metadata['duration']
+                for i, output in enumerate(outputs):
+                    itemMetadata = dict(metadata)
+                    itemMetadata['duration'] = batchDuration / float(len(items))
+                    responses[i] = {"result": output, "metadata": itemMetadata}
             else:
-                for j in range((i*self.maxThreadPool), i*self.maxThreadPool + remainder):
-                    self.threads[j].start()
-                for t in self.threads[(i*self.maxThreadPool):(i*self.maxThreadPool + remainder)]:
-                    t.join()
-                    self.processedThread += 1
-                    print str(self.processedThread) + "/" + str(self.threadCount)
-                    self.results.append({"response": t.response, "algo": t.algo, "label": t.label})
-        # Calculate some stats about the benchmark
-        self.__calcAverage()
+                message = 'batchSplitter should return a list with one result per input, got: ' + repr(outputs)
+                error = CallError('batchSplit', message)
+
+        results = []
+        for i, item in enumerate(items):
+            result = self.__newResult(task, responses[i], error)
+            result["label"] = item.label
+            result["callIndex"] = item.callIndex
+            result["batch"] = {"index": i, "size": len(items), "duration": batchDuration}
+            results.append(result)
+        return results
+
+    def __newResult(self, task, response, error):
+        '''
+        Description: The result of a call. A failed call has an empty response and its error is
+            described by result["error"]: the error type (see CallError), message, HTTP status
+            and the latency until the call was given up.
+        '''
+        result = {"response": response, "algo": task.algo, "label": task.label,
+                  "callIndex": task.callIndex, "timing": task.timing,
+                  "reusedConnection": task.reusedConnection, "attempts": task.attempts, "error": None}
+        if error is not None:
+            result["error"] = {"type": error.errorType, "message": error.message, "status": error.status,
+                               "latency": task.timing.get('failed', time.time()) - task.timing.get('acquired', time.time())}
+        return result
+
+    def __replayCached(self, tasks):
+        '''
+        Description: Passes on the tasks whose response isn't in the responseCache. In replay mode
+            the others are completed straight away with the cached response, and their results are
+            tagged as cached so they're left out of the latency stats. In bypass mode every call is
+            made, e.g. for latency runs, and the cache is only refreshed.
+        '''
+        replay = self.settings['cacheMode'] == 'replay'
+        for task in tasks:
+            response = self.cache.get(task.algo, task.input) if replay else None
+            if response is None:
+                with self.resultLock:
+                    self.cacheStats["misses"] += 1
+                yield task
+            else:
+                with self.resultLock:
+                    self.cacheStats["hits"] += 1
+                task.response = response
+                task.cached = True
+                self.__addResult(task)
+
+    def __cacheResult(self, task):
+        # Stores the response of a call that was actually made, then adds its result
+        if task.response is not None:
+            self.cache.put(task.algo, task.input, task.response)
+            with self.resultLock:
+                self.cacheStats["stored"] += 1
+        self.__addResult(task)
+
+    def __processThreads(self, tasks):
+        '''
+        Description: Runs the tasks on a fixed pool of maxNumConnections worker threads. Workers
+            pull tasks from a bounded queue as soon as they are free, which keeps every connection
+            busy without creating a thread per call. With the async engine the tasks are sent over
+            non-blocking sockets from the calling thread instead.
+        '''
+        self.__runTasks(tasks)
+        self.throttled = dict(self.threadLimiter.throttled)
+        self.__finishRun()
+
+    def __runTasks(self, tasks):
+        # Sends the tasks and aggregates their results, without calculating the stats of the run
+        self.mapped = None
+        self.resultsGeneration += 1
+        self.latencyStats = newLatencyStats()
+        self.connections = {}
+        self.errors = {}
+        self.threadLimiter.throttled = {}
+        callback = self.__addResult
+        if self.cache is not None:
+            self.cacheStats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+            tasks = self.__replayCached(tasks)
+            callback = self.__cacheResult
+        if self.sink is not None:
+            self.sink.open()
+        for reporter in self.settings['reporters']:
+            reporter.runStarted(self.threadCount)
+        start = time.time()
+        try:
+            self.__execute(tasks, callback, startCallback=self.__startCall)
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+            for reporter in self.settings['reporters']:
+                reporter.runFinished()
+        self.elapsed = time.time() - start
+        if self.cache is not None:
+            self.cacheStats["evicted"] = self.cache.evict()
+
+    def __finishRun(self, detectColdStarts=True):
+        # Calculate some stats about the benchmark, the durations were already
+        # aggregated as the results came in
+        self.__calcAverage(self.latencyStats)
         self.__calcUncertainty()
+        if detectColdStarts:
+            self.__detectColdStarts()
+        else:
+            # Already merged from the cold and warm durations of each part
+            self.coldStarts = dict((algo, stats.count) for algo, stats in self.latencyStats.get('cold', {}).iteritems())
+        self.__calcDistribution()
+        for algo in self.durationStats:
+            if self.elapsed > 0:
+                self.throughput[algo] = self.durationStats[algo].count / self.elapsed
+        for algo in self.errors:
+            self.errorRate[algo] = float(self.errors[algo]["failed"]) / self.errors[algo]["calls"]
 
-    def __calcAverage(self):
-        algos = []
-        for res in self.results:
-            algos.append(res['algo'])
+    def runCalls(self, calls, mapFunc=None):
+        '''
+        Description: Runs the given (algo, input, label, callIndex) calls and returns their
+            Aggregate, without calculating the stats of the run. This is what the workers of a
+            distributed run do with each chunk of calls. With a mapping function the results are
+            reduced to the confusion matrix and predictions of each algo instead of being returned.
+        '''
+        if self.client is None:
+            self.__createClient()
+        self.results = []
+        tasks = (BenchTask(algo, input, label, callIndex) for algo, input, label, callIndex in calls)
+        if self.settings['batchSize'] > 1:
+            tasks = self.__batchTasks(tasks, self.settings['batchSize'])
+        self.__runTasks(tasks)
 
-        unique_algos = list(set(algos))
+        aggregate = Aggregate()
+        aggregate.count = len(self.results)
+        aggregate.latencyStats = self.latencyStats
+        aggregate.errors = self.errors
+        aggregate.connections = self.connections
+        aggregate.throttled = dict(self.threadLimiter.throttled)
+        if mapFunc is None:
+            aggregate.results = list(self.results)
+        else:
+            for res in self.results:
+                if res.get('error') is not None:
+                    continue
+                algoResult = mapFunc(res)
+                self.__validateMappingFunc(algoResult)
+                if res['algo'] not in aggregate.confusionMatrices:
+                    aggregate.confusionMatrices[res['algo']] = ConfusionMatrix()
+                aggregate.confusionMatrices[res['algo']].add(algoResult['result'], algoResult['label'])
+                aggregate.predictions.setdefault(res['algo'], {})[res['callIndex']] = algoResult['result'] == algoResult['label']
+        self.results = []
+        return aggregate
+
+    def close(self):
+        # Closes the connections kept alive by runCalls
+        self.__closeSessionPool()
+
+    def __runDistributed(self, tasks):
+        '''
+        Description: Shards the calls over the distributed workers, see distributed.Coordinator.
+            The aggregates the workers send back are merged as they arrive and their results are
+            kept or written to the resultsSink, so the stats come out the same as for a local run.
+            With a mapFunc, the workers map the results themselves and only their confusion
+            matrices come back, from which the stats are calculated as by calcStats.
+        '''
+        config = self.settings['distributed']
+        total = Aggregate()
+        self.mapped = None
+        self.resultsGeneration += 1
+
+        def addAggregate(aggregate):
+            results = aggregate.results
+            with self.resultLock:
+                for result in results:
+                    if self.sink is not None:
+                        self.sink.write(result)
+                    else:
+                        self.results.append(result)
+                aggregate.results = []
+                total.merge(aggregate)
+                self.processedThread += aggregate.count
+            # Mapped results don't come back, the reporters only see the others
+            for result in results:
+                for reporter in self.settings['reporters']:
+                    reporter.callFinished(result)
+
+        def startChunk(chunk):
+            # The calls of a chunk are in flight from when it's sent to its worker
+            sizes = collections.Counter(call[0] for call in chunk)
+            for algo, size in sizes.iteritems():
+                for reporter in self.settings['reporters']:
+                    reporter.callStarted(algo, size)
+
+        calls = ((task.algo, task.input, task.label, task.callIndex) for task in tasks)
+        if self.sink is not None:
+            self.sink.open()
+        for reporter in self.settings['reporters']:
+            reporter.runStarted(self.threadCount)
+        start = time.time()
+        try:
+            # Without results coming back, the calls started would never be seen to finish
+            onChunk = startChunk if config['mapFunc'] is None else None
+            Coordinator(config, self.settings).run(calls, addAggregate, onChunk)
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+            for reporter in self.settings['reporters']:
+                reporter.runFinished()
+        self.elapsed = time.time() - start
+
+        self.latencyStats = total.latencyStats
+        self.connections = total.connections
+        self.errors = total.errors
+        self.throttled = total.throttled
+        self.__finishRun()
+
+        if config['mapFunc'] is not None:
+            self.confusionMatrices = total.confusionMatrices
+            self.predictions = total.predictions
+            self.__calcMergedMatrixStats()
+
+    def __calcMergedMatrixStats(self):
+        # Stats of confusion matrices that were merged rather than counted by calcStats
+        labels = list(set(label for matrix in self.confusionMatrices.itervalues() for label in matrix.labels()))
+        if len(labels) < 2 or None in labels:
+            raise AlgoBenchError('Cannot evaluate stats because data is unlabeled or is incorrectly labelled (has None amond labels).')
+        self.stats['labels'] = labels
+        self.__calcAllMatrixStats()
+
+    def __execute(self, tasks, callback, numWorkers=None, openLoop=None, startCallback=None):
+        # Sends every task with the configured engine, callback(task) is called as each one finishes,
+        # and startCallback(task) before its first attempt
+        if numWorkers is None:
+            numWorkers = self.settings['maxNumConnections']
+        if openLoop is None:
+            openLoop = 'loadProfile' in self.settings
+
+        if self.settings['engine'] == 'async':
+            # Same read-ahead as the bounded queue of the worker pool
+            queueSize = 0 if openLoop else 2 * numWorkers
+            engine = AsyncEngine(self.client.apiKey, self.client.apiAddress, numWorkers,
+                                 self.settings['timeout'], self.retryPolicy, self.threadLimiter, queueSize)
+            engine.run(tasks, callback, startCallback)
+        else:
+            if self.sessionPool is None or self.sessionPool.maxNumConnections < numWorkers:
+                # Connections are kept alive between the warm-up, the run and any later steps
+                self.__closeSessionPool()
+                self.sessionPool = SessionPool(numWorkers)
+            self.__runWorkerPool(tasks, numWorkers, callback, openLoop, startCallback)
+
+    def __startCall(self, task):
+        size = len(task.batch) if task.batch is not None else 1
+        for reporter in self.settings['reporters']:
+            reporter.callStarted(task.algo, size)
+
+    def __closeSessionPool(self):
+        if self.sessionPool is not None:
+            self.sessionPool.close()
+            self.sessionPool = None
+
+    def __runWorkerPool(self, tasks, numWorkers, callback, openLoop, startCallback=None):
+        if openLoop:
+            # A bounded queue would hold back the schedule when every worker is busy
+            taskQueue = Queue.Queue()
+        else:
+            taskQueue = Queue.Queue(maxsize=2 * numWorkers)
+
+        self.threads = [BenchThread(self.client, self.threadLimiter, taskQueue, callback, self.sessionPool,
+                                    self.retryPolicy, self.settings['timeout'], startCallback) for i in range(numWorkers)]
+        for t in self.threads:
+            t.start()
+
+        try:
+            for task in tasks:
+                task.timing['enqueued'] = time.time()
+                taskQueue.put(task)
+        finally:
+            # One stop signal per worker, also when reading the inputs failed
+            for t in self.threads:
+                taskQueue.put(None)
+            for t in self.threads:
+                t.join()
+
+        # A failed callback (e.g. a sink or reporter) didn't stop the workers, it fails the run now
+        for t in self.threads:
+            if t.excInfo is not None:
+                raise t.excInfo[0], t.excInfo[1], t.excInfo[2]
+
+    def __addResult(self, task):
+        # Called from the worker threads whenever a task finishes
+        if task.batch is not None:
+            results = self.__splitBatch(task)
+        else:
+            results = [self.__newResult(task, task.response, task.error)]
+        if task.cached:
+            for result in results:
+                result["cached"] = True
+
+        with self.resultLock:
+            self.processedThread += len(results)
+            if not task.cached:
+                connections = self.connections.setdefault(task.algo, {"new": 0, "reused": 0})
+                connections["reused" if task.reusedConnection else "new"] += 1
+
+            for result in results:
+                errors = self.errors.setdefault(task.algo, {"calls": 0, "failed": 0, "types": {}})
+                errors["calls"] += 1
+                if result["error"] is not None:
+                    errors["failed"] += 1
+                    errorType = result["error"]["type"]
+                    errors["types"][errorType] = errors["types"].get(errorType, 0) + 1
+                addLatencies(self.latencyStats, result)
+                if self.sink is not None:
+                    # The result is written out straight away, nothing is kept in memory
+                    self.sink.write(result)
+                else:
+                    self.results.append(result)
 
-        sum = {}
-        total = {}
+        for result in results:
+            for reporter in self.settings['reporters']:
+                reporter.callFinished(result)
 
-        for algo in unique_algos:
-            sum[algo] = 0
-            total[algo] = 0
+    def __iterResults(self):
+        '''
+        Description: Iterates over the results of the run, either from Benchmark.results or
+            streamed back from the resultsSink.
+        '''
+        if self.sink is not None:
+            return iter(self.sink)
+        return iter(self.results)
 
-        for res in self.results:
-            algo = res['algo']
+    def __iterSuccessful(self):
+        # The results with a response, the ones calcStats maps
+        return (res for res in self.__iterResults() if res.get('error') is None)
 
-            sum[algo] += res['response']['metadata']['duration']
-            total[algo] += 1
+    def __calcAverage(self, latencyStats=None):
+        '''
+        Description: Calculates the average duration for each algo. The per algo aggregates are
+            built in a single pass over the results unless they are passed in.
+        '''
+        if latencyStats is None:
+            latencyStats = newLatencyStats()
+            for res in self.__iterResults():
+                addLatencies(latencyStats, res)
+        self.latencyStats = latencyStats
+        self.durationStats = latencyStats['server']
 
-        for s in sum:
-            self.average[s] = sum[s] / total[s]
+        for algo in self.durationStats:
+            self.average[algo] = self.durationStats[algo].mean()
 
         # Old code for single overall average
         #sum = 0
@@ -373,18 +1629,10 @@ class Benchmark(object):
 
     def __calcUncertainty(self):
         # Reference: https://www.youtube.com/watch?v=riMzriytw40
-        algos = []
-        for res in self.results:
-            algos.append(res['algo'])
-
-        unique_algos = list(set(algos))
-
-        for algo in unique_algos:
-            filteredResults = filter(lambda x: x['algo'] == algo, self.results)
-
-            # Get max and min value in self.results
-            maxVal = max(filteredResults, key=lambda x: float(x['response']['metadata']['duration']))['response']['metadata']['duration']
-            minVal = min(filteredResults, key=lambda x: float(x['response']['metadata']['duration']))['response']['metadata']['duration']
+        # Uses the max and min values aggregated by __calcAverage
+        for algo in self.durationStats:
+            maxVal = self.durationStats[algo].max
+            minVal = self.durationStats[algo].min
 
             self.uncertainty[algo] = (maxVal-minVal)/2
 
@@ -402,20 +1650,145 @@ class Benchmark(object):
             self.uncertainty[algo] = round(self.uncertainty[algo], minDLen)
             self.average[algo] = round(self.average[algo], minDLen)
 
-class BenchThread(threading.Thread):
-    def __init__(self, apiKey, algo, input, label):
-        super(BenchThread, self).__init__()
+    def __detectColdStarts(self):
+        '''
+        Description: Tags the first hit calls of each algo that took more than coldStartFactor times
+            the median duration as cold starts (res['coldStart']), and aggregates the durations of
+            cold and warm calls separately. The first hit calls are the first maxNumConnections calls
+            sent to an algo, as each of them may have started a new instance of it. Tags are only
+            kept for in-memory results, a resultsSink isn't rewritten.
+        '''
+        factor = self.settings['coldStartFactor']
+        window = self.settings['maxNumConnections']
+        thresholds = {}
+        for algo in self.durationStats:
+            thresholds[algo] = factor * self.durationStats[algo].percentile(0.5)
+
+        cold = {}
+        warm = {}
+        for res in self.__iterResults():
+            if res['response'] is None or res.get('cached'):
+                continue
+            duration = res['response']['metadata']['duration']
+            res['coldStart'] = res.get('callIndex', window) < window and duration > thresholds[res['algo']]
+            addDuration(cold if res['coldStart'] else warm, res)
+
+        self.latencyStats['cold'] = cold
+        self.latencyStats['warm'] = warm
+        self.coldStarts = dict((algo, cold[algo].count) for algo in cold)
+
+    def __calcDistribution(self):
+        '''
+        Description: Percentiles (p50, p90, p95, p99, p99.9), standard deviation and a 95% bootstrap
+            confidence interval on the mean for each algo. Uses the streaming aggregates built by
+            __calcAverage, so the raw durations aren't needed.
+        '''
+        for algo in self.durationStats:
+            summary = self.durationStats[algo].summary()
+            self.percentiles[algo] = dict((name, summary[name]) for name, q in DurationStats.percentiles)
+            self.stdDev[algo] = summary['stdDev']
+            self.confidenceInterval[algo] = summary['confidenceInterval']
+
+        # Same stats for the server duration and the client side latencies
+        for kind in self.latencyStats:
+            self.latency[kind] = {}
+            for algo in self.latencyStats[kind]:
+                self.latency[kind][algo] = self.latencyStats[kind][algo].summary()
+
+class ResultList(list):
+    '''
+    Description: The list kept in Benchmark.results. Counts the changes made to it in version, so
+        memoized mappings of the results can tell they are stale.
+    '''
+    version = 0
+
+def countChanges(name):
+    method = getattr(list, name)
+    def changed(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    return changed
+
+for name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__', '__imul__',
+             'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort'):
+    setattr(ResultList, name, countChanges(name))
+
+class BenchTask(object):
+    def __init__(self, algo, input, label, callIndex=0):
         self.algo = algo
-        self.conn = Algorithmia
-        self.conn.apiKey = apiKey
         self.input = input
         self.label = label
+        self.callIndex = callIndex
         self.response = None
+        self.timing = {}
+        self.reusedConnection = False
+        # Tasks packed into this one by batchSize, None for a single input
+        self.batch = None
+        # Whether the response was replayed from the responseCache
+        self.cached = False
+        # CallError of the last attempt when the call failed
+        self.error = None
+        self.attempts = 0
 
-    def run(self):
-        global threadLimiter
-        threadLimiter.acquire()
+    @staticmethod
+    def batchOf(tasks, callIndex):
+        # A single call for the inputs of several tasks to the same algo
+        task = BenchTask(tasks[0].algo, [t.input for t in tasks], [t.label for t in tasks], callIndex)
+        task.timing = dict(tasks[0].timing)
+        task.batch = tasks
+        return task
+
+class BenchThread(threading.Thread):
+    def __init__(self, client, threadLimiter, taskQueue, callback, sessionPool, retryPolicy, timeout=None, startCallback=None):
+        super(BenchThread, self).__init__()
+        self.daemon = True
+        self.conn = client
+        self.threadLimiter = threadLimiter
+        self.taskQueue = taskQueue
+        self.callback = callback
+        self.sessionPool = sessionPool
+        self.retryPolicy = retryPolicy
+        self.timeout = timeout
+        self.startCallback = startCallback
+        # The first exception raised by a callback, re-raised once every worker has stopped
+        self.excInfo = None
+
+    def __runCallback(self, callback, task):
+        # The worker has to keep draining the queue, or putting the next task would block forever
         try:
-            self.response = self.conn.algo(self.algo).pipe(self.input)
-        finally:
-            threadLimiter.release()
\ No newline at end of file
+            callback(task)
+        except Exception:
+            if self.excInfo is None:
+                self.excInfo = sys.exc_info()
+
+    def run(self):
+        while True:
+            task = self.taskQueue.get()
+            if task is None:
+                break
+
+            while True:
+                task.attempts += 1
+                self.threadLimiter.acquire(task.algo)
+                task.timing.setdefault('acquired', time.time())
+                if task.attempts == 1 and self.startCallback is not None:
+                    self.__runCallback(self.startCallback, task)
+                try:
+                    task.response = self.conn.algo(task.algo).pipe(task.input, task.timing, self.sessionPool, self.timeout)
+                    task.error = None
+                except Exception as e:
+                    # Keep the worker alive, a failed call leaves the response empty
+                    task.response = None
+                    task.error = asCallError(e)
+                finally:
+                    self.threadLimiter.release()
+                self.threadLimiter.observe(task.error)
+                if task.error is None or not self.retryPolicy.shouldRetry(task.error, task.attempts):
+                    break
+                # The connection slot is free for other calls during the back-off
+                time.sleep(self.retryPolicy.delay(task.attempts))
+
+            if task.error is not None:
+                task.timing['failed'] = time.time()
+            task.reusedConnection = self.sessionPool.lastReused()
+            self.__runCallback(self.callback, task)
@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+def cacheKey(algo, input):
+    '''
+    Description: Content address of a call, the sha256 of the algo and its canonicalised input.
+        Inputs are tagged with the way they're sent (text, binary or JSON) and JSON inputs are
+        dumped with sorted keys, so equal inputs always have the same key.
+    '''
+    if isinstance(input, basestring):
+        if isinstance(input, unicode):
+            input = input.encode('utf-8')
+        canonical = ['text', input]
+    elif isinstance(input, bytearray):
+        canonical = ['binary', base64.b64encode(input)]
+    else:
+        canonical = ['json', input]
+    data = json.dumps([algo, canonical], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data).hexdigest()
+
+class ResponseCache(object):
+    '''
+    Description: On-disk cache of algorithm responses, one JSON file per call named after its
+        cacheKey. Entries stored more than maxAge seconds ago are ignored and removed, and evict()
+        removes the least recently used entries until the cache is no larger than maxSize bytes.
+        The modification time of an entry is when it was stored, and its access time when it was
+        last used.
+
+        Include the version in the algo (e.g. "userName/algoName/1.0.2"), otherwise responses of
+        an older version are replayed after the algo is updated.
+
+    Example:
+        settings["responseCache"] = ResponseCache(".algobench-cache", maxSize=100 * 1024 * 1024, maxAge=7 * 24 * 3600)
+    '''
+    def __init__(self, path, maxSize=None, maxAge=None):
+        self.path = path
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        self.lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __entryPath(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, algo, input):
+        # The cached response of the call, or None
+        path = self.__entryPath(cacheKey(algo, input))
+        try:
+            modified = os.path.getmtime(path)
+            if self.maxAge is not None and time.time() - modified > self.maxAge:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                response = json.load(f)
+            # Keep track of the last use for eviction, without changing when it was stored
+            os.utime(path, (time.time(), modified))
+            return response
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, algo, input, response):
+        path = self.__entryPath(cacheKey(algo, input))
+        # Write to a temporary file first, so a reader never sees half an entry
+        with self.lock:
+            tmpPath = path + '.' + str(threading.current_thread().ident) + '.tmp'
+            with open(tmpPath, 'w') as f:
+                json.dump(response, f)
+            os.rename(tmpPath, path)
+
+    def evict(self):
+        '''
+        Description: Removes the expired entries, then the least recently used ones until the cache
+            fits in maxSize. Returns the number of removed entries.
+        '''
+        entries = []
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.maxAge is not None and now - stat.st_mtime > self.maxAge:
+                os.remove(path)
+                removed += 1
+            else:
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+        if self.maxSize is not None:
+            size = sum(entry[1] for entry in entries)
+            for used, entrySize, path in sorted(entries):
+                if size <= self.maxSize:
+                    break
+                os.remove(path)
+                size -= entrySize
+                removed += 1
+        return removed
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.path, name))
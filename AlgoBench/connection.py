@@ -0,0 +1,56 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+def trackingPool(poolClass, local):
+    # Connection pool class that flags the current thread whenever a request opens a connection.
+    # A pooled connection the server closed has no socket and is reconnected in place, so this
+    # is checked on every request rather than when the pool creates a connection object
+    class TrackingPool(poolClass):
+        def _make_request(self, conn, *args, **kwargs):
+            if conn.sock is None:
+                local.newConnection = True
+            return poolClass._make_request(self, conn, *args, **kwargs)
+    return TrackingPool
+
+class TrackingAdapter(HTTPAdapter):
+    def __init__(self, local, **kwargs):
+        self.local = local
+        super(TrackingAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TrackingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': trackingPool(HTTPConnectionPool, self.local),
+            'https': trackingPool(HTTPSConnectionPool, self.local)
+        }
+
+class SessionPool(object):
+    '''
+    Description: Keep-alive HTTP session shared by all the workers of a benchmark. It keeps up to
+        maxNumConnections connections open and reuses them across calls, so the measured latency
+        doesn't include a new TCP and TLS handshake for every call. requests sessions are safe to
+        share between threads for this use.
+
+        Whether the last request made by the current thread reused a connection is available
+        from lastReused().
+    '''
+    def __init__(self, maxNumConnections):
+        self.maxNumConnections = maxNumConnections
+        self.local = threading.local()
+        self.session = requests.Session()
+        adapter = TrackingAdapter(self.local, pool_connections=1, pool_maxsize=maxNumConnections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.local.newConnection = False
+        return self.session.post(url, data=data, headers=headers, timeout=timeout)
+
+    def lastReused(self):
+        return not getattr(self.local, 'newConnection', True)
+
+    def close(self):
+        self.session.close()
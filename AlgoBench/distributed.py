@@ -0,0 +1,196 @@
+import multiprocessing
+import threading
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from errors import AlgoBenchError
+
+def validateDistributed(settings):
+    '''
+    Description: Validates the distributed settings and fills in the defaults.
+
+    Example:
+        {"processes": 4, "remote": [("10.0.0.2", 6000)], "authkey": "secret", "chunkSize": 50, "mapFunc": func}
+    '''
+    distributed = settings['distributed']
+    if not isinstance(distributed, dict):
+        raise AlgoBenchError('Please provide distributed as a dict')
+
+    for key in ('loadProfile', 'adaptiveSampling', 'responseCache'):
+        if key in settings:
+            raise AlgoBenchError('You cannot provide distributed and ' + key + ' at the same time')
+
+    for key, default in [('processes', multiprocessing.cpu_count()), ('chunkSize', 50)]:
+        distributed.setdefault(key, default)
+        if not isinstance(distributed[key], int):
+            raise AlgoBenchError('distributed ' + key + ' should be an integer')
+        elif distributed[key] < 0 or (key == 'chunkSize' and distributed[key] == 0):
+            raise AlgoBenchError('distributed ' + key + ' is too small')
+
+    distributed.setdefault('remote', [])
+    if not isinstance(distributed['remote'], list):
+        raise AlgoBenchError('Please provide the distributed remote workers as a list of (host, port)')
+    if distributed['processes'] == 0 and len(distributed['remote']) == 0:
+        raise AlgoBenchError('distributed needs at least one process or remote worker')
+
+    distributed.setdefault('authkey', None)
+    if len(distributed['remote']) > 0:
+        validateAuthkey(distributed['authkey'])
+
+    distributed.setdefault('mapFunc', None)
+    if distributed['mapFunc'] is not None and not callable(distributed['mapFunc']):
+        raise AlgoBenchError('Please provide the distributed mapFunc as a function')
+
+def validateAuthkey(authkey):
+    # Anyone who can connect without it could send the worker pickles to run
+    if not isinstance(authkey, str) or len(authkey) == 0:
+        raise AlgoBenchError('Please provide the distributed authkey as a non-empty string')
+
+def workerSettings(settings, numWorkers):
+    '''
+    Description: The settings a worker runs its share of the calls with. The inputs are sent with
+        the calls, and the rate limit is split between the workers.
+    '''
+    excluded = ('inputLabelList', 'resultsSink', 'distributed', 'numWarmupRuns', 'reporters')
+    workerSettings = dict((key, value) for key, value in settings.iteritems() if key not in excluded)
+    workerSettings['inputList'] = []
+    if 'rateLimit' in settings:
+        workerSettings['rateLimit'] = dict(settings['rateLimit'])
+        workerSettings['rateLimit']['rps'] = settings['rateLimit']['rps'] / float(numWorkers)
+    return workerSettings
+
+def workerLoop(conn):
+    '''
+    Description: Serves a coordinator over a multiprocessing connection. The coordinator sends
+        ("init", settings, mapFunc), then ("chunk", calls) for each share of the calls, each
+        answered with ("aggregate", Aggregate), and finally ("stop",).
+    '''
+    # Imported here, benchmark imports this module
+    from benchmark import Benchmark
+
+    benchmark = None
+    mapFunc = None
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == 'init':
+                benchmark = Benchmark(message[1])
+                mapFunc = message[2]
+            elif message[0] == 'chunk':
+                try:
+                    conn.send(('aggregate', benchmark.runCalls(message[1], mapFunc)))
+                except Exception:
+                    conn.send(('error', traceback.format_exc()))
+            else:
+                break
+    except EOFError:
+        pass
+    finally:
+        if benchmark is not None:
+            benchmark.close()
+        conn.close()
+
+def serveWorker(address, authkey):
+    '''
+    Description: Runs a remote worker, e.g. on another host, that coordinators can connect to by
+        listing its address in the distributed remote setting. Serves one coordinator connection
+        per thread until the process is stopped. Only coordinators with the same authkey can
+        connect, but the settings (including the apiKey) and the results aren't encrypted.
+
+    Example:
+        python -c "from AlgoBench.distributed import serveWorker; serveWorker(('127.0.0.1', 6000), 'secret')"
+    '''
+    validateAuthkey(authkey)
+    listener = Listener(address, authkey=authkey)
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, IOError):
+            # A client that isn't a coordinator, or has the wrong authkey
+            continue
+        thread = threading.Thread(target=workerLoop, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+class Coordinator(object):
+    '''
+    Description: Shards calls over local worker processes and remote workers. Each worker is
+        sent chunkSize calls at a time and streams back the Aggregate of each chunk, which is
+        handed to onAggregate as soon as it arrives.
+    '''
+    def __init__(self, config, settings):
+        self.config = config
+        self.numWorkers = config['processes'] + len(config['remote'])
+        self.settings = workerSettings(settings, self.numWorkers)
+        self.lock = threading.Lock()
+        self.chunks = None
+        self.failures = []
+
+    def __connect(self):
+        # One connection per worker, local processes are started over a pipe
+        connections = []
+        processes = []
+        for i in range(self.config['processes']):
+            parentConn, childConn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=workerLoop, args=(childConn,))
+            process.daemon = True
+            process.start()
+            childConn.close()
+            connections.append(parentConn)
+            processes.append(process)
+        for address in self.config['remote']:
+            connections.append(Client(tuple(address), authkey=self.config['authkey']))
+        return connections, processes
+
+    def __nextChunk(self):
+        with self.lock:
+            chunk = []
+            for call in self.chunks:
+                chunk.append(call)
+                if len(chunk) == self.config['chunkSize']:
+                    break
+            return chunk
+
+    def __serve(self, conn, onAggregate, onChunk):
+        try:
+            conn.send(('init', self.settings, self.config['mapFunc']))
+            chunk = self.__nextChunk()
+            while chunk and not self.failures:
+                if onChunk is not None:
+                    onChunk(chunk)
+                conn.send(('chunk', chunk))
+                reply = conn.recv()
+                if reply[0] == 'error':
+                    raise AlgoBenchError('A worker failed: ' + reply[1])
+                onAggregate(reply[1])
+                chunk = self.__nextChunk()
+        except Exception as e:
+            with self.lock:
+                self.failures.append(e)
+        finally:
+            # Closing the connection isn't enough to stop a local worker, the processes started
+            # after it hold a copy of its end of the pipe
+            try:
+                conn.send(('stop',))
+            except (IOError, EOFError):
+                pass
+
+    def run(self, calls, onAggregate, onChunk=None):
+        '''
+        Description: Runs every (algo, input, label, callIndex) call on the workers, and calls
+            onChunk(chunk) with each chunk of calls just before it's sent.
+        '''
+        self.chunks = iter(calls)
+        connections, processes = self.__connect()
+        threads = [threading.Thread(target=self.__serve, args=(conn, onAggregate, onChunk)) for conn in connections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for conn in connections:
+            conn.close()
+        for process in processes:
+            process.join()
+        if self.failures:
+            raise self.failures[0]
@@ -0,0 +1,67 @@
+import json
+
+import requests
+
+class AlgoBenchError(Exception):
+     def __init__(self, value):
+         self.value = value
+     def __str__(self):
+         return repr(self.value)
+
+class CallError(Exception):
+    '''
+    Description: A failed algorithm call. errorType is one of:
+        timeout: no response within the timeout setting
+        connection: the connection couldn't be made or was dropped
+        http: the API answered with a 429 or 5xx status
+        algorithm: the algorithm returned an error
+        invalidResponse: the response wasn't a valid algorithm response
+        batchSplit: batchSplitter couldn't split the response of a batch
+        exception: any other error while making the call
+    Only timeout, connection and http errors are retried.
+    '''
+    def __init__(self, errorType, message, status=None):
+        Exception.__init__(self, message)
+        self.errorType = errorType
+        self.message = message
+        self.status = status
+
+    def retryable(self):
+        return self.errorType in ('timeout', 'connection', 'http')
+
+def isRetryableStatus(status):
+    # Throttled or a server side error, the same call may well succeed later
+    return status == 429 or status >= 500
+
+def parseApiResponse(status, body):
+    '''
+    Description: Parses the body of an algorithm API response with the given HTTP status and
+        returns its JSON, or raises a CallError when the call failed.
+    '''
+    try:
+        responseJson = json.loads(body)
+    except ValueError:
+        if isRetryableStatus(status):
+            raise CallError('http', 'HTTP ' + str(status), status)
+        raise CallError('invalidResponse', 'The response is not valid JSON', status)
+
+    if not isinstance(responseJson, dict):
+        raise CallError('invalidResponse', 'The response is not a JSON object', status)
+    elif 'error' in responseJson:
+        message = responseJson['error'].get('message') if isinstance(responseJson['error'], dict) else responseJson['error']
+        if isRetryableStatus(status):
+            raise CallError('http', message, status)
+        raise CallError('algorithm', message, status)
+    elif isRetryableStatus(status):
+        raise CallError('http', 'HTTP ' + str(status), status)
+    return responseJson
+
+def asCallError(exception):
+    # Classifies any exception raised while making a call
+    if isinstance(exception, CallError):
+        return exception
+    elif isinstance(exception, requests.exceptions.Timeout):
+        return CallError('timeout', str(exception))
+    elif isinstance(exception, requests.exceptions.ConnectionError):
+        return CallError('connection', str(exception))
+    return CallError('exception', repr(exception))
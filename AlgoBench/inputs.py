@@ -0,0 +1,113 @@
+import csv
+import json
+import mmap
+import os
+
+from errors import AlgoBenchError
+
+def isLazyInput(inputs):
+    # Any iterable but an in-memory list, strings and dicts are single inputs
+    return hasattr(inputs, '__iter__') and not isinstance(inputs, (list, basestring, dict))
+
+class InputSource(object):
+    '''
+    Description: Base class for file backed inputs. Iterating a source yields its inputs as
+        {"data": data, "label": label} dicts, reading the file as it goes, so only the inputs
+        waiting to be sent are held in memory. A source can be iterated more than once. Pass
+        sources as inputLabelList.
+    '''
+    def __iter__(self):
+        raise NotImplementedError()
+
+class JsonLinesInput(InputSource):
+    '''
+    Description: One JSON document per line. The input is taken from dataKey and the label from
+        labelKey of each document (None when there's no label). With useMmap the file is memory
+        mapped instead of read through a buffered file object.
+
+    Example:
+        settings["inputLabelList"] = JsonLinesInput("corpus.jsonl", dataKey="text", labelKey="sentiment")
+    '''
+    def __init__(self, path, dataKey="data", labelKey="label", useMmap=False):
+        self.path = path
+        self.dataKey = dataKey
+        self.labelKey = labelKey
+        self.useMmap = useMmap
+
+    def __lines(self, f):
+        if not self.useMmap:
+            for line in f:
+                yield line
+            return
+        if os.fstat(f.fileno()).st_size == 0:
+            # An empty file can't be mapped, it has no inputs like without useMmap
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            line = mapped.readline()
+            while line:
+                yield line
+                line = mapped.readline()
+        finally:
+            mapped.close()
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for lineNumber, line in enumerate(self.__lines(f)):
+                if not line.strip():
+                    continue
+                try:
+                    document = json.loads(line)
+                except ValueError:
+                    raise AlgoBenchError('Line ' + str(lineNumber + 1) + ' of ' + self.path + ' is not valid JSON')
+                if not isinstance(document, dict) or self.dataKey not in document:
+                    raise AlgoBenchError('Line ' + str(lineNumber + 1) + ' of ' + self.path + ' has no ' + self.dataKey)
+                yield {"data": document[self.dataKey], "label": document.get(self.labelKey)}
+
+class CsvInput(InputSource):
+    '''
+    Description: CSV file with a header row. The input is taken from dataColumn and the label from
+        labelColumn (None when there's no such column). parseData, e.g. json.loads, is applied to
+        each input, otherwise inputs are sent as text.
+
+    Example:
+        settings["inputLabelList"] = CsvInput("corpus.csv", dataColumn="text", labelColumn="sentiment")
+    '''
+    def __init__(self, path, dataColumn="data", labelColumn="label", parseData=None):
+        self.path = path
+        self.dataColumn = dataColumn
+        self.labelColumn = labelColumn
+        self.parseData = parseData
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or self.dataColumn not in reader.fieldnames:
+                raise AlgoBenchError(self.path + ' has no ' + self.dataColumn + ' column')
+            for row in reader:
+                data = row[self.dataColumn]
+                if self.parseData is not None:
+                    data = self.parseData(data)
+                yield {"data": data, "label": row.get(self.labelColumn)}
+
+class LabelledInputs(object):
+    '''
+    Description: Wraps a lazy inputList or inputLabelList. The items are converted to
+        {"data": data, "label": label} dicts, and validated, one at a time as they're consumed.
+        Iterating it again iterates the underlying inputs again, which only works when they can be
+        (e.g. an InputSource, but not a generator).
+    '''
+    def __init__(self, inputs, labelled):
+        self.inputs = inputs
+        self.labelled = labelled
+
+    def __iter__(self):
+        for item in self.inputs:
+            if not self.labelled:
+                yield {"data": item, "label": None}
+                continue
+            if not isinstance(item, dict):
+                raise AlgoBenchError('Please properly format your inputLabelList as a dictionary')
+            if 'label' not in item:
+                raise AlgoBenchError('Please properly put a label on each input')
+            yield item
@@ -0,0 +1,113 @@
+import math
+import random
+
+from errors import AlgoBenchError
+
+def validateLoadProfile(profile):
+    '''
+    Description: Validates an open-loop load profile.
+
+    Example profiles:
+        {"pattern": "constant", "rps": 20, "duration": 60}
+        {"pattern": "poisson", "rps": 20, "duration": 60, "seed": 1}
+        {"pattern": "linear", "startRps": 1, "endRps": 50, "duration": 120}
+        {"pattern": "step", "steps": [{"rps": 5, "duration": 30}, {"rps": 10, "duration": 30}]}
+    '''
+    if not isinstance(profile, dict):
+        raise AlgoBenchError('Please provide loadProfile as a dict')
+
+    pattern = profile.get('pattern')
+    if pattern in ('constant', 'poisson'):
+        steps = [profile]
+        rates = ['rps']
+    elif pattern == 'linear':
+        steps = [profile]
+        rates = ['startRps', 'endRps']
+    elif pattern == 'step':
+        steps = profile.get('steps')
+        rates = ['rps']
+        if not isinstance(steps, list) or len(steps) == 0:
+            raise AlgoBenchError('Please provide the steps of the loadProfile as a non-empty list')
+    else:
+        raise AlgoBenchError('loadProfile pattern should be constant, poisson, linear or step')
+
+    for step in steps:
+        if not isinstance(step, dict):
+            raise AlgoBenchError('Please provide each loadProfile step as a dict')
+        for key in rates + ['duration']:
+            if not isinstance(step.get(key), (int, float)):
+                raise AlgoBenchError('loadProfile ' + key + ' should be a number')
+            elif step[key] < 0 or (key == 'duration' and step[key] == 0):
+                raise AlgoBenchError('loadProfile ' + key + ' should be positive')
+        if all(step[key] == 0 for key in rates):
+            raise AlgoBenchError('loadProfile needs a request rate above 0')
+
+def arrivalTimes(profile):
+    '''
+    Description: Yields the intended send times of the requests, in seconds from the start of
+        the run, for a validated load profile.
+    '''
+    pattern = profile['pattern']
+    if pattern == 'constant':
+        return constantArrivals(profile['rps'], profile['duration'])
+    elif pattern == 'poisson':
+        return poissonArrivals(profile['rps'], profile['duration'], random.Random(profile.get('seed')))
+    elif pattern == 'linear':
+        return linearArrivals(profile['startRps'], profile['endRps'], profile['duration'])
+    else:
+        return stepArrivals(profile['steps'])
+
+def expectedArrivals(profile):
+    # Expected number of requests in the load profile
+    pattern = profile['pattern']
+    if pattern in ('constant', 'poisson'):
+        return int(profile['rps'] * profile['duration'])
+    elif pattern == 'linear':
+        return int((profile['startRps'] + profile['endRps']) / 2.0 * profile['duration'])
+    else:
+        return sum(int(step['rps'] * step['duration']) for step in profile['steps'])
+
+def constantArrivals(rps, duration, offset=0.0):
+    if rps <= 0:
+        return
+    i = 0
+    while i / float(rps) < duration:
+        yield offset + i / float(rps)
+        i += 1
+
+def poissonArrivals(rps, duration, rand):
+    # Exponentially distributed gaps between requests
+    t = rand.expovariate(rps)
+    while t < duration:
+        yield t
+        t += rand.expovariate(rps)
+
+def linearArrivals(startRps, endRps, duration):
+    '''
+    Description: The rate ramps linearly from startRps to endRps. The k-th request is sent when
+        the integral of the rate reaches k.
+    '''
+    if startRps == endRps:
+        for t in constantArrivals(startRps, duration):
+            yield t
+        return
+
+    slope = (endRps - startRps) / float(duration)
+    k = 0
+    while True:
+        discriminant = startRps * startRps + 2 * slope * k
+        if discriminant < 0:
+            # A decreasing rate that never reaches k requests
+            break
+        t = (-startRps + math.sqrt(discriminant)) / slope
+        if t >= duration:
+            break
+        yield t
+        k += 1
+
+def stepArrivals(steps):
+    offset = 0.0
+    for step in steps:
+        for t in constantArrivals(step['rps'], step['duration'], offset):
+            yield t
+        offset += step['duration']
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from errors import AlgoBenchError
+
+def validateRateLimit(rateLimit):
+    '''
+    Description: Validates the rateLimit settings and fills in the defaults.
+
+    Example:
+        {"rps": 20, "burst": 5, "adaptive": True}
+    '''
+    if not isinstance(rateLimit, dict):
+        raise AlgoBenchError('Please provide rateLimit as a dict')
+
+    if not isinstance(rateLimit.get('rps'), (int, float)):
+        raise AlgoBenchError('rateLimit rps should be a number')
+    elif rateLimit['rps'] <= 0:
+        raise AlgoBenchError('rateLimit rps should be positive')
+
+    rateLimit.setdefault('burst', 1)
+    if not isinstance(rateLimit['burst'], int):
+        raise AlgoBenchError('rateLimit burst should be an integer')
+    elif rateLimit['burst'] <= 0:
+        raise AlgoBenchError('rateLimit burst should be at least 1')
+
+    rateLimit.setdefault('adaptive', True)
+    if not isinstance(rateLimit['adaptive'], bool):
+        raise AlgoBenchError('rateLimit adaptive should be True or False')
+
+class TokenBucket(object):
+    '''
+    Description: Allows rps requests per second on average, and up to burst requests at once after
+        a quiet period. When adaptive, the rate is halved whenever the API throttles a call (at
+        most once per second, down to 1% of rps) and grows back towards rps with every successful
+        call.
+    '''
+    def __init__(self, rps, burst=1, adaptive=True):
+        self.rps = float(rps)
+        self.rate = float(rps)
+        self.burst = burst
+        self.adaptive = adaptive
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lastBackOff = 0
+        self.backOffs = 0
+        self.lock = threading.Lock()
+
+    def __refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def tryTake(self):
+        # Takes a token and returns 0, or returns how long to wait until one is available
+        with self.lock:
+            now = time.time()
+            self.__refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def take(self):
+        # Blocks until a token is available, returns how long it waited
+        start = time.time()
+        wait = self.tryTake()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.tryTake()
+        return time.time() - start
+
+    def backOff(self):
+        if not self.adaptive:
+            return
+        with self.lock:
+            now = time.time()
+            if now - self.lastBackOff < 1:
+                return
+            self.__refill(now)
+            self.lastBackOff = now
+            self.backOffs += 1
+            self.rate = max(self.rps / 100, self.rate / 2)
+
+    def recover(self):
+        if not self.adaptive:
+            return
+        with self.lock:
+            if self.rate < self.rps:
+                self.__refill(time.time())
+                self.rate = min(self.rps, self.rate + self.rps / 20)
+
+class RateLimiter(object):
+    '''
+    Description: Limits the calls of a benchmark to maxNumConnections at once and, with a
+        TokenBucket, to a request rate. Used by the worker pool in place of a semaphore: acquire()
+        before a call and release() after it. The time spent waiting for the request rate is added
+        up per algo in throttled.
+    '''
+    def __init__(self, maxNumConnections, bucket=None):
+        self.semaphore = threading.BoundedSemaphore(maxNumConnections)
+        self.bucket = bucket
+        self.throttled = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, algo=None):
+        self.semaphore.acquire()
+        if self.bucket is not None:
+            self.addThrottled(algo, self.bucket.take())
+
+    def release(self):
+        self.semaphore.release()
+
+    def addThrottled(self, algo, seconds):
+        with self.lock:
+            self.throttled[algo] = self.throttled.get(algo, 0) + seconds
+
+    def observe(self, error):
+        # Adapts the request rate to the outcome of a call, error is its CallError or None
+        if self.bucket is None:
+            return
+        if error is None:
+            self.bucket.recover()
+        elif error.status == 429:
+            self.bucket.backOff()
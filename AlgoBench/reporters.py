@@ -0,0 +1,202 @@
+import BaseHTTPServer
+import collections
+import math
+import threading
+import time
+
+class Reporter(object):
+    '''
+    Description: Receives the events of a benchmark run while it's in progress. Add instances to
+        the reporters setting. The hooks are called from the worker threads, so subclasses need to
+        be thread safe, and should return quickly as the calls wait for them.
+    '''
+    def runStarted(self, total):
+        # total is the number of inputs the run will send, None when it isn't known in advance
+        pass
+
+    def callStarted(self, algo, size):
+        # A call with size inputs (more than 1 for a batch) was sent to algo
+        pass
+
+    def callFinished(self, result):
+        # The result of one input came back, see Benchmark.results
+        pass
+
+    def runFinished(self):
+        pass
+
+class ProgressReporter(Reporter):
+    '''
+    Description: Prints the number of results that came back (out of the total, when it's known)
+        at most every interval seconds, and once more at the end of the run.
+    '''
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.total = None
+        self.processed = 0
+        self.lastPrint = 0
+
+    def runStarted(self, total):
+        with self.lock:
+            self.total = total
+            self.processed = 0
+            self.lastPrint = 0
+
+    def callFinished(self, result):
+        with self.lock:
+            self.processed += 1
+            if time.time() - self.lastPrint >= self.interval:
+                self.__print()
+
+    def runFinished(self):
+        with self.lock:
+            self.__print()
+
+    def __print(self):
+        self.lastPrint = time.time()
+        if self.total is not None:
+            print str(self.processed) + "/" + str(self.total)
+        else:
+            print str(self.processed)
+
+class MetricsReporter(Reporter):
+    '''
+    Description: Live metrics of each algo while the run is in progress: the number of inputs in
+        flight, completed and failed calls, and the throughput and latency quantiles over the last
+        window seconds. metrics() returns them as a dict, exposition() in the Prometheus text
+        format, which serve() exposes over HTTP. When a callback is given, callback(metrics) is
+        called at most every interval seconds during the run and once at its end.
+    '''
+    quantiles = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]
+
+    def __init__(self, window=10.0, callback=None, interval=1.0):
+        self.window = window
+        self.callback = callback
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.algos = {}
+        self.started = time.time()
+        self.lastCallback = 0
+        self.server = None
+
+    def runStarted(self, total):
+        with self.lock:
+            self.algos = {}
+            self.started = time.time()
+            self.lastCallback = 0
+
+    def __algo(self, algo):
+        if algo not in self.algos:
+            # (finish time, server duration) of the recent successful calls
+            self.algos[algo] = {"inFlight": 0, "completed": 0, "failed": 0, "recent": collections.deque()}
+        return self.algos[algo]
+
+    def callStarted(self, algo, size):
+        with self.lock:
+            self.__algo(algo)["inFlight"] += size
+
+    def callFinished(self, result):
+        with self.lock:
+            # Taken under the lock, so the callback times only go forward
+            now = time.time()
+            algo = self.__algo(result['algo'])
+            if not result.get('cached'):
+                algo["inFlight"] = max(0, algo["inFlight"] - 1)
+            if result['response'] is None:
+                algo["failed"] += 1
+            else:
+                algo["completed"] += 1
+                algo["recent"].append((now, result['response']['metadata']['duration']))
+            callback = self.callback is not None and now - self.lastCallback >= self.interval
+            if callback:
+                self.lastCallback = now
+        if callback:
+            self.callback(self.metrics())
+
+    def runFinished(self):
+        if self.callback is not None:
+            self.callback(self.metrics())
+
+    def metrics(self):
+        '''
+        Description: {algo: {"inFlight", "completed", "failed", "throughput", "latency": {"p50", "p90", "p99"}}}
+            The throughput is the number of successful calls per second over the window, and the
+            latency quantiles are those of their server durations (None without any).
+        '''
+        now = time.time()
+        metrics = {}
+        with self.lock:
+            for name, algo in self.algos.iteritems():
+                recent = algo["recent"]
+                while recent and recent[0][0] < now - self.window:
+                    recent.popleft()
+                durations = sorted(duration for finished, duration in recent)
+                span = min(self.window, max(now - self.started, 1e-3))
+                latency = {}
+                for key, q in self.quantiles:
+                    latency[key] = durations[max(0, int(math.ceil(q * len(durations))) - 1)] if durations else None
+                metrics[name] = {"inFlight": algo["inFlight"], "completed": algo["completed"], "failed": algo["failed"],
+                                 "throughput": len(durations) / span, "latency": latency}
+        return metrics
+
+    def exposition(self):
+        # The metrics in the Prometheus text exposition format
+        metrics = self.metrics()
+        lines = []
+        def family(name, metricType, help, samples):
+            lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + metricType)
+            for labels, value in samples:
+                if value is None:
+                    continue
+                labelText = ",".join(key + '="' + escapeLabel(labelValue) + '"' for key, labelValue in labels)
+                lines.append(name + "{" + labelText + "} " + repr(float(value)))
+
+        algos = sorted(metrics)
+        family("algobench_in_flight", "gauge", "Inputs sent to the algorithm and waiting for their result.",
+               [([("algo", algo)], metrics[algo]["inFlight"]) for algo in algos])
+        family("algobench_calls_total", "counter", "Finished calls by outcome.",
+               [([("algo", algo), ("outcome", outcome)], metrics[algo][outcome])
+                for algo in algos for outcome in ("completed", "failed")])
+        family("algobench_throughput", "gauge", "Successful calls per second over the rolling window.",
+               [([("algo", algo)], metrics[algo]["throughput"]) for algo in algos])
+        # A gauge, a summary would also need the _sum and _count of every duration
+        family("algobench_latency_seconds", "gauge", "Server duration quantiles over the rolling window.",
+               [([("algo", algo), ("quantile", str(q))], metrics[algo]["latency"][key])
+                for algo in algos for key, q in self.quantiles])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=0, host="127.0.0.1"):
+        '''
+        Description: Serves exposition() on http://host:port/metrics from a background thread,
+            until close() is called. Returns the port, which is picked by the OS for port 0.
+        '''
+        reporter = self
+        class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = reporter.exposition()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server.server_address[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def escapeLabel(value):
+    # Backslashes, double quotes and newlines are escaped in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
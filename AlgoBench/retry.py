@@ -0,0 +1,20 @@
+import random
+
+class RetryPolicy(object):
+    '''
+    Description: Decides whether a failed call is tried again and how long to wait before the next
+        attempt. The wait grows exponentially from backoff up to maxBackoff seconds, with full
+        jitter so throttled workers don't all come back at the same time.
+    '''
+    def __init__(self, maxRetries=0, backoff=0.5, maxBackoff=30.0, rand=None):
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.rand = rand if rand is not None else random.Random()
+
+    def shouldRetry(self, error, attempts):
+        # attempts is the number of attempts made so far
+        return error.retryable() and attempts <= self.maxRetries
+
+    def delay(self, attempts):
+        return self.rand.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (attempts - 1)))
@@ -0,0 +1,176 @@
+import math
+import random
+
+def normalSf(z):
+    # P(Z > z) for a standard normal Z
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def betaContinuedFraction(x, a, b):
+    # Continued fraction of the incomplete beta function (modified Lentz's method)
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in xrange(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return h
+
+def regularizedBeta(x, a, b):
+    '''
+    Description: The regularized incomplete beta function I_x(a, b).
+    '''
+    if x <= 0:
+        return 0.0
+    elif x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * betaContinuedFraction(x, a, b) / a
+    return 1.0 - front * betaContinuedFraction(1 - x, b, a) / b
+
+def studentTTwoSided(t, df):
+    # P(|T| > |t|) for a Student t distribution with df degrees of freedom
+    return regularizedBeta(df / (df + t * t), df / 2.0, 0.5)
+
+def studentTCritical(level, df):
+    # The t such that P(|T| > t) = 1 - level, found by bisection
+    low, high = 0.0, 1.0
+    while studentTTwoSided(high, df) > 1 - level:
+        high *= 2
+    for i in range(60):
+        middle = (low + high) / 2
+        if studentTTwoSided(middle, df) > 1 - level:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def mannWhitney(samplesA, samplesB):
+    '''
+    Description: Mann-Whitney U test of whether durations of A tend to be larger or smaller than
+        those of B, with the normal approximation and a correction for ties. The effect size is
+        the rank-biserial correlation, from -1 (A always faster) to 1 (A always slower).
+    '''
+    n1 = len(samplesA)
+    n2 = len(samplesB)
+    values = sorted([(value, 0) for value in samplesA] + [(value, 1) for value in samplesB])
+
+    # Average ranks of tied values
+    rankSumA = 0.0
+    tieTerm = 0.0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        rank = (i + j) / 2.0 + 1
+        ties = j - i + 1
+        tieTerm += ties ** 3 - ties
+        rankSumA += rank * sum(1 for k in xrange(i, j + 1) if values[k][1] == 0)
+        i = j + 1
+
+    u = rankSumA - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    variance = n1 * n2 / 12.0 * ((n + 1) - tieTerm / (n * (n - 1)))
+    if variance <= 0:
+        p = 1.0
+        z = 0.0
+    else:
+        # Continuity corrected
+        z = (abs(u - n1 * n2 / 2.0) - 0.5) / math.sqrt(variance)
+        p = min(1.0, 2 * normalSf(max(z, 0)))
+    return {"u": u, "z": z, "p": p, "effectSize": 2 * u / (n1 * n2) - 1}
+
+def welchTest(statsA, statsB):
+    '''
+    Description: Welch's t-test on the mean durations of two DurationStats, which doesn't assume
+        equal variances. Uses the exact streaming count, mean and variance. The effect size is
+        Cohen's d, the difference of the means (B - A) over the pooled standard deviation.
+    '''
+    n1 = float(statsA.count)
+    n2 = float(statsB.count)
+    var1 = statsA.stdDev() ** 2
+    var2 = statsB.stdDev() ** 2
+    difference = statsB.mean() - statsA.mean()
+
+    standardError = math.sqrt(var1 / n1 + var2 / n2)
+    pooled = math.sqrt(((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
+    effectSize = difference / pooled if pooled > 0 else 0.0
+    if standardError == 0:
+        return {"t": 0.0, "df": n1 + n2 - 2, "p": 1.0 if difference == 0 else 0.0, "effectSize": effectSize}
+
+    t = difference / standardError
+    df = (var1 / n1 + var2 / n2) ** 2 / ((var1 / n1) ** 2 / (n1 - 1) + (var2 / n2) ** 2 / (n2 - 1))
+    return {"t": t, "df": df, "p": studentTTwoSided(t, df), "effectSize": effectSize}
+
+def bootstrapTest(samplesA, samplesB, numResamples=2000, level=0.95, seed=0):
+    '''
+    Description: Bootstrap of the difference of the mean durations (B - A). Returns the observed
+        difference, its confidence interval and a two-sided p-value for a difference of 0.
+    '''
+    rand = random.Random(seed)
+    n1 = len(samplesA)
+    n2 = len(samplesB)
+    observed = float(sum(samplesB)) / n2 - float(sum(samplesA)) / n1
+
+    differences = []
+    for j in xrange(numResamples):
+        meanA = sum(samplesA[int(rand.random() * n1)] for i in xrange(n1)) / float(n1)
+        meanB = sum(samplesB[int(rand.random() * n2)] for i in xrange(n2)) / float(n2)
+        differences.append(meanB - meanA)
+    differences.sort()
+
+    alpha = (1 - level) / 2
+    low = differences[int(math.floor(alpha * (numResamples - 1)))]
+    high = differences[int(math.ceil((1 - alpha) * (numResamples - 1)))]
+    below = sum(1 for d in differences if d <= 0)
+    above = sum(1 for d in differences if d >= 0)
+    p = min(1.0, 2.0 * min(below, above) / numResamples)
+    return {"difference": observed, "confidenceInterval": [low, high], "p": p}
+
+def mcnemarTest(correctA, correctB):
+    '''
+    Description: McNemar's test on paired predictions, correctA and correctB map the same call
+        keys to whether A and B got them right. Only the pairs where exactly one of them is
+        right count: the exact binomial test is used for fewer than 25 of them, otherwise the
+        continuity corrected chi-squared test. The effect size is the odds ratio of A being right
+        where B is wrong.
+    '''
+    onlyA = 0
+    onlyB = 0
+    pairs = 0
+    for key in correctA:
+        if key not in correctB:
+            continue
+        pairs += 1
+        if correctA[key] and not correctB[key]:
+            onlyA += 1
+        elif correctB[key] and not correctA[key]:
+            onlyB += 1
+
+    discordant = onlyA + onlyB
+    if discordant == 0:
+        p = 1.0
+        statistic = 0.0
+    elif discordant < 25:
+        statistic = None
+        k = min(onlyA, onlyB)
+        tail = sum(math.exp(math.lgamma(discordant + 1) - math.lgamma(i + 1) - math.lgamma(discordant - i + 1))
+                   for i in xrange(k + 1)) / 2.0 ** discordant
+        p = min(1.0, 2 * tail)
+    else:
+        statistic = (abs(onlyA - onlyB) - 1) ** 2 / float(discordant)
+        # Survival function of chi-squared with 1 degree of freedom
+        p = math.erfc(math.sqrt(statistic / 2))
+
+    oddsRatio = float(onlyA) / onlyB if onlyB else None
+    return {"pairs": pairs, "onlyA": onlyA, "onlyB": onlyB, "statistic": statistic, "p": p, "oddsRatio": oddsRatio}
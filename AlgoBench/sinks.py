@@ -0,0 +1,66 @@
+import json
+
+class ResultsSink(object):
+    '''
+    Description: Base class for results sinks. A sink receives every result as soon as its call
+        completes and can be iterated afterwards to read the results back one at a time.
+    '''
+    def open(self):
+        pass
+
+    def write(self, result):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        raise NotImplementedError()
+
+class MemorySink(ResultsSink):
+    '''
+    Description: Keeps the results in a list, this is what Benchmark.results does by default.
+    '''
+    def __init__(self):
+        self.results = []
+
+    def open(self):
+        self.results = []
+
+    def write(self, result):
+        self.results.append(result)
+
+    def __iter__(self):
+        return iter(self.results)
+
+class JsonLinesSink(ResultsSink):
+    '''
+    Description: Appends each result as one JSON document per line. Only the file handle is kept
+        in memory, and reading the results back streams the file line by line.
+
+    Example:
+        settings["resultsSink"] = JsonLinesSink("results.jsonl")
+    '''
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, 'a' if self.append else 'w')
+
+    def write(self, result):
+        self.file.write(json.dumps(result) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __iter__(self):
+        if self.file is not None:
+            self.file.flush()
+        with open(self.path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
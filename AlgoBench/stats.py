@@ -0,0 +1,512 @@
+import math
+import random
+from array import array
+from significance import studentTCritical
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ConfusionMatrix(object):
+    '''
+    Description: Counts how often each label was predicted as each result. Results can be added
+        one at a time, and the OvR (one vs Rest) TP, FP, TN and FN counts for every label are
+        derived from the counts without going over the results again.
+    '''
+    def __init__(self):
+        # counts[label][result] = number of times label was predicted as result
+        self.counts = {}
+        self.total = 0
+
+    def add(self, result, label):
+        row = self.counts.setdefault(label, {})
+        row[result] = row.get(result, 0) + 1
+        self.total += 1
+
+    def merge(self, other):
+        for label, row in other.counts.iteritems():
+            ownRow = self.counts.setdefault(label, {})
+            for result, count in row.iteritems():
+                ownRow[result] = ownRow.get(result, 0) + count
+        self.total += other.total
+
+    def labels(self):
+        return self.counts.keys()
+
+    def correct(self):
+        return sum(row.get(label, 0) for label, row in self.counts.iteritems())
+
+    def toDict(self):
+        # JSON only has string keys, the counts are kept as [label, result, count] triples
+        return {"counts": [[label, result, count] for label, row in self.counts.iteritems()
+                           for result, count in row.iteritems()], "total": self.total}
+
+    @staticmethod
+    def fromDict(data):
+        matrix = ConfusionMatrix()
+        for label, result, count in data["counts"]:
+            matrix.counts.setdefault(label, {})[result] = count
+        matrix.total = data["total"]
+        return matrix
+
+    def basics(self, labels):
+        '''
+        Description: Returns {"TP": {label: n}, "FP": ..., "TN": ..., "FN": ...} for the given labels.
+        '''
+        # Number of times each value was given as a result, over all labels
+        predicted = {}
+        for row in self.counts.itervalues():
+            for result, count in row.iteritems():
+                predicted[result] = predicted.get(result, 0) + count
+
+        basics = {"TP": {}, "FP": {}, "TN": {}, "FN": {}}
+        for label in labels:
+            row = self.counts.get(label, {})
+            TP = row.get(label, 0)
+            FN = sum(row.itervalues()) - TP
+            FP = predicted.get(label, 0) - TP
+            basics["TP"][label] = TP
+            basics["FN"][label] = FN
+            basics["FP"][label] = FP
+            basics["TN"][label] = self.total - TP - FN - FP
+        return basics
+
+class LatencyHistogram(object):
+    '''
+    Description: Streaming quantile sketch. Values are counted in logarithmic buckets that are
+        relativeError wide (HDR histogram style), so memory depends on the range of the values
+        rather than on how many there are, and any quantile is accurate to within relativeError.
+        Histograms can be merged by adding their bucket counts.
+    '''
+    def __init__(self, relativeError=0.01):
+        self.relativeError = relativeError
+        self.logBase = math.log(1 + 2 * relativeError)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            index = int(math.floor(math.log(value) / self.logBase))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        '''
+        Description: Returns the value at quantile q (0 < q <= 1), using the nearest rank method.
+        '''
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        if rank <= self.zeros:
+            return 0.0
+
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Middle of the bucket, within relativeError of every value in it
+                return math.exp((index + 0.5) * self.logBase)
+
+    def toDict(self):
+        return {"relativeError": self.relativeError, "buckets": sorted(self.buckets.iteritems()),
+                "zeros": self.zeros, "count": self.count}
+
+    @staticmethod
+    def fromDict(data):
+        histogram = LatencyHistogram(data["relativeError"])
+        histogram.buckets = dict((index, count) for index, count in data["buckets"])
+        histogram.zeros = data["zeros"]
+        histogram.count = data["count"]
+        return histogram
+
+class Reservoir(object):
+    '''
+    Description: Fixed size uniform random sample of a stream of values (reservoir sampling).
+    '''
+    def __init__(self, size=1000, seed=0):
+        self.size = size
+        self.samples = []
+        self.count = 0
+        self.random = random.Random(seed)
+
+    def add(self, value):
+        self.count += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            i = self.random.randint(0, self.count - 1)
+            if i < self.size:
+                self.samples[i] = value
+
+    def merge(self, other):
+        # Draw from each reservoir in proportion to the number of values it has seen
+        ownSamples = list(self.samples)
+        otherSamples = list(other.samples)
+        ownCount = self.count
+        otherCount = other.count
+        merged = []
+        while len(merged) < self.size and (ownSamples or otherSamples):
+            if otherSamples and (not ownSamples or self.random.random() * (ownCount + otherCount) < otherCount):
+                merged.append(otherSamples.pop(self.random.randrange(len(otherSamples))))
+            else:
+                merged.append(ownSamples.pop(self.random.randrange(len(ownSamples))))
+        self.samples = merged
+        self.count = ownCount + otherCount
+
+    def toDict(self):
+        return {"size": self.size, "samples": self.samples, "count": self.count}
+
+    @staticmethod
+    def fromDict(data):
+        reservoir = Reservoir(data["size"])
+        reservoir.samples = list(data["samples"])
+        reservoir.count = data["count"]
+        return reservoir
+
+class DurationStats(object):
+    '''
+    Description: Running aggregates of the durations of a single algo: count, sum, min, max,
+        variance (Welford's method), a latency histogram for percentiles and a reservoir sample
+        for bootstrapping. Memory doesn't grow with the number of durations.
+    '''
+    percentiles = [("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99), ("p99.9", 0.999)]
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.runningMean = 0.0
+        self.m2 = 0.0
+        self.histogram = LatencyHistogram()
+        self.reservoir = Reservoir()
+
+    def add(self, duration):
+        self.count += 1
+        self.sum += duration
+        if self.min is None or float(duration) < float(self.min):
+            self.min = duration
+        if self.max is None or float(duration) > float(self.max):
+            self.max = duration
+
+        delta = duration - self.runningMean
+        self.runningMean += delta / self.count
+        self.m2 += delta * (duration - self.runningMean)
+
+        self.histogram.add(duration)
+        self.reservoir.add(duration)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.runningMean - self.runningMean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.runningMean += delta * other.count / count
+
+        self.count = count
+        self.sum += other.sum
+        if self.min is None or float(other.min) < float(self.min):
+            self.min = other.min
+        if self.max is None or float(other.max) > float(self.max):
+            self.max = other.max
+
+        self.histogram.merge(other.histogram)
+        self.reservoir.merge(other.reservoir)
+
+    def toDict(self):
+        '''
+        Description: The aggregates as a JSON serializable dict, DurationStats.fromDict(data)
+            restores them.
+        '''
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "runningMean": self.runningMean, "m2": self.m2,
+                "histogram": self.histogram.toDict(), "reservoir": self.reservoir.toDict()}
+
+    @staticmethod
+    def fromDict(data):
+        durationStats = DurationStats()
+        for key in ("count", "sum", "min", "max", "runningMean", "m2"):
+            setattr(durationStats, key, data[key])
+        durationStats.histogram = LatencyHistogram.fromDict(data["histogram"])
+        durationStats.reservoir = Reservoir.fromDict(data["reservoir"])
+        return durationStats
+
+    def mean(self):
+        return self.sum / self.count
+
+    def stdDev(self):
+        # Sample standard deviation
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def percentile(self, q):
+        # Clamped to the observed range, the sketch only knows the bucket
+        value = self.histogram.quantile(q)
+        return min(max(value, self.min), self.max)
+
+    def confidenceInterval(self, level=0.95, numResamples=200):
+        '''
+        Description: Bootstrap confidence interval on the mean. The resamples are drawn from the
+            reservoir, and their spread is scaled from the reservoir size to the full count so the
+            interval stays correct once the reservoir is full.
+        '''
+        samples = self.reservoir.samples
+        n = len(samples)
+        if n < 2:
+            return [self.mean(), self.mean()]
+
+        rand = random.Random(0)
+        sampleMean = float(sum(samples)) / n
+        means = sorted(sum(samples[int(rand.random() * n)] for i in xrange(n)) / float(n) for j in xrange(numResamples))
+
+        scale = math.sqrt(float(n) / self.count)
+        alpha = (1 - level) / 2
+        low = means[int(math.floor(alpha * (numResamples - 1)))]
+        high = means[int(math.ceil((1 - alpha) * (numResamples - 1)))]
+        mean = self.mean()
+        return [mean - (sampleMean - low) * scale, mean + (high - sampleMean) * scale]
+
+    def tConfidenceInterval(self, level=0.95):
+        '''
+        Description: Student t confidence interval on the mean, from the exact running mean and
+            variance. Much cheaper than the bootstrap interval, and as good once there are a few
+            dozen durations.
+        '''
+        mean = self.mean()
+        if self.count < 2:
+            return [mean, mean]
+        halfWidth = studentTCritical(level, self.count - 1) * self.stdDev() / math.sqrt(self.count)
+        return [mean - halfWidth, mean + halfWidth]
+
+    def percentileConfidenceInterval(self, q, level=0.95, numResamples=200):
+        '''
+        Description: Bootstrap confidence interval on the q-th percentile, drawn from the reservoir
+            and scaled to the full count like confidenceInterval.
+        '''
+        samples = self.reservoir.samples
+        n = len(samples)
+        value = self.percentile(q)
+        if n < 2:
+            return [value, value]
+
+        def quantile(values):
+            values = sorted(values)
+            return values[min(n - 1, int(q * n))]
+
+        rand = random.Random(0)
+        sampleValue = quantile(samples)
+        values = sorted(quantile(samples[int(rand.random() * n)] for i in xrange(n)) for j in xrange(numResamples))
+
+        scale = math.sqrt(float(n) / self.count)
+        alpha = (1 - level) / 2
+        low = values[int(math.floor(alpha * (numResamples - 1)))]
+        high = values[int(math.ceil((1 - alpha) * (numResamples - 1)))]
+        return [value - (sampleValue - low) * scale, value + (high - sampleValue) * scale]
+
+    def summary(self):
+        '''
+        Description: The latency distribution as a dict: mean, stdDev, min, max, count,
+            percentiles and the 95% confidence interval on the mean.
+        '''
+        summary = {
+            "count": self.count,
+            "mean": self.mean(),
+            "stdDev": self.stdDev(),
+            "min": self.min,
+            "max": self.max,
+            "confidenceInterval": self.confidenceInterval()
+        }
+        for name, q in self.percentiles:
+            summary[name] = self.percentile(q)
+        return summary
+
+def addDuration(durationStats, result):
+    '''
+    Description: Adds the server reported duration of a single result to a {algo: DurationStats}
+        dict. Results without a response are skipped.
+    '''
+    if result['response'] is None:
+        return
+    algo = result['algo']
+    if algo not in durationStats:
+        durationStats[algo] = DurationStats()
+    durationStats[algo].add(result['response']['metadata']['duration'])
+
+def averageScores(stats):
+    '''
+    Description: Macro, micro and support weighted averages of the per label precision, recall
+        and F1 Score. Undefined (None) per label scores count as 0 in the macro and weighted averages.
+    '''
+    labels = stats['labels']
+    TP = sum(stats['TP']['labels'][label] for label in labels)
+    FP = sum(stats['FP']['labels'][label] for label in labels)
+    FN = sum(stats['FN']['labels'][label] for label in labels)
+    support = dict((label, stats['TP']['labels'][label] + stats['FN']['labels'][label]) for label in labels)
+    totalSupport = sum(support.itervalues())
+
+    averages = {}
+    for key in ('precision', 'recall', 'fScore'):
+        scores = dict((label, stats[key]['labels'][label] or 0.0) for label in labels)
+        averages[key] = {
+            "macro": sum(scores.itervalues()) / len(labels) if labels else None,
+            "weighted": sum(scores[label] * support[label] for label in labels) / float(totalSupport) if totalSupport else None
+        }
+
+    microPrecision = float(TP) / float(TP + FP) if TP + FP else None
+    microRecall = float(TP) / float(TP + FN) if TP + FN else None
+    if microPrecision and microRecall:
+        microFScore = float(2*microPrecision*microRecall)/float(microPrecision+microRecall)
+    else:
+        microFScore = None
+    averages['precision']['micro'] = microPrecision
+    averages['recall']['micro'] = microRecall
+    averages['fScore']['micro'] = microFScore
+    return averages
+
+class EncodedResults(object):
+    '''
+    Description: Mapped results encoded as integer codes, one code per distinct label or result
+        value. Used by the NumPy backend so the confusion matrix is a single bincount.
+    '''
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self.labelCodes = array('l')
+        self.resultCodes = array('l')
+
+    def __encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def add(self, result, label):
+        self.labelCodes.append(self.__encode(label))
+        self.resultCodes.append(self.__encode(result))
+
+def numpyStats(encoded, labels):
+    '''
+    Description: Vectorized version of the calcStats calculations. Returns the confusion matrix
+        and a dict with the same TP, FP, TN, FN, accuracy, precision, recall and fScore entries
+        as Benchmark.stats.
+    '''
+    numValues = len(encoded.values)
+    # Zero-copy views of the code arrays
+    labelCodes = numpy.frombuffer(encoded.labelCodes, dtype=numpy.dtype('l'))
+    resultCodes = numpy.frombuffer(encoded.resultCodes, dtype=numpy.dtype('l'))
+
+    # One extra row and column that stay empty, for the labels without any result
+    size = numValues + 1
+    counts = numpy.bincount(labelCodes * size + resultCodes, minlength=size * size)
+    counts = counts.reshape((size, size))
+    total = int(counts.sum())
+
+    # A label missing from these results (e.g. every call with it failed) gets zero counts
+    index = numpy.array([encoded.codes.get(label, numValues) for label in labels], dtype=int)
+    TP = counts.diagonal()[index]
+    FN = counts.sum(axis=1)[index] - TP
+    FP = counts.sum(axis=0)[index] - TP
+    TN = total - TP - FN - FP
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        accuracy = (TP + TN).astype(float) / (TP + FP + TN + FN)
+        precision = TP.astype(float) / (TP + FP)
+        recall = TP.astype(float) / (TP + FN)
+        fScore = (2 * precision * recall) / (precision + recall)
+
+    def toDict(values, isCount=False):
+        # Undefined (0/0) scores are None, like in the scalar calculations
+        result = {}
+        for i, label in enumerate(labels):
+            if isCount:
+                result[label] = int(values[i])
+            elif numpy.isnan(values[i]):
+                result[label] = None
+            else:
+                result[label] = float(values[i])
+        return result
+
+    stats = {
+        "TP": {"labels": toDict(TP, True)},
+        "FP": {"labels": toDict(FP, True)},
+        "TN": {"labels": toDict(TN, True)},
+        "FN": {"labels": toDict(FN, True)},
+        "accuracy": {"labels": toDict(accuracy)},
+        "precision": {"labels": toDict(precision)},
+        "recall": {"labels": toDict(recall)},
+        "fScore": {"labels": toDict(fScore)}
+    }
+
+    correct = int(counts.diagonal().sum())
+    stats["accuracy"]["overall"] = float(correct) / float(total) if total else None
+
+    matrix = ConfusionMatrix()
+    for labelCode, resultCode in zip(*numpy.nonzero(counts)):
+        matrix.counts.setdefault(encoded.values[labelCode], {})[encoded.values[resultCode]] = int(counts[labelCode, resultCode])
+    matrix.total = total
+
+    return matrix, stats
+
+# Client side latencies, measured between two of the timestamps recorded for each call
+clientLatencies = [("roundTrip", "sent", "parsed"), ("queueWait", "enqueued", "acquired"),
+                   ("openLoop", "intended", "parsed")]
+
+def newLatencyStats():
+    '''
+    Description: Empty {kind: {algo: DurationStats}} dict for the server reported durations, the
+        durations of batched calls, the time until failed calls were given up and every client
+        side latency.
+    '''
+    latencyStats = {"server": {}, "batch": {}, "error": {}}
+    for kind, start, end in clientLatencies:
+        latencyStats[kind] = {}
+    return latencyStats
+
+def addLatencies(latencyStats, result):
+    '''
+    Description: Adds the server duration and the client side latencies of a single result to a
+        dict created by newLatencyStats. Responses replayed from a cache weren't timed and are
+        skipped.
+    '''
+    if result.get('cached'):
+        return
+    addDuration(latencyStats['server'], result)
+    algo = result['algo']
+    if result['response'] is None:
+        # Failed calls are kept out of the latencies, only the time until they failed is recorded
+        error = result.get('error')
+        if error is not None and error.get('latency') is not None:
+            if algo not in latencyStats['error']:
+                latencyStats['error'][algo] = DurationStats()
+            latencyStats['error'][algo].add(error['latency'])
+        return
+
+    batch = result.get('batch')
+    if batch is not None and batch['index'] == 0:
+        # The duration of a batched call is counted once, with its first item
+        if algo not in latencyStats['batch']:
+            latencyStats['batch'][algo] = DurationStats()
+        latencyStats['batch'][algo].add(batch['duration'])
+
+    timing = result.get('timing')
+    if not timing:
+        return
+    for kind, start, end in clientLatencies:
+        if start in timing and end in timing:
+            if algo not in latencyStats[kind]:
+                latencyStats[kind][algo] = DurationStats()
+            latencyStats[kind][algo].add(timing[end] - timing[start])
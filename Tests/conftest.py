@@ -1,3 +1,10 @@
+import Algorithmia
+import BaseHTTPServer
+import SocketServer
+import json
+import threading
+import time
+
 import pytest
 
 def pytest_addoption(parser):
@@ -8,4 +15,122 @@ def pytest_addoption(parser):
 
 @pytest.fixture
 def apiKey(request):
-    return request.config.getoption("--apiKey")
\ No newline at end of file
+    return request.config.getoption("--apiKey")
+
+class StubAlgoServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Description: Local stand-in for the Algorithmia API. Every POST to /v1/algo/... echoes the
+        request body back as the algorithm result, wrapped in the usual metadata.
+    '''
+    daemon_threads = True
+    # Enough for every connection the tests open at once
+    request_queue_size = 64
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), StubAlgoHandler)
+        self.url = "http://127.0.0.1:" + str(self.server_address[1])
+        self.delay = 0
+        self.duration = 0.01
+        # Optional callable(requestNumber, result) returning the duration to report
+        self.durationFunc = None
+        # Optional callable(inFlight) returning how long to take, to simulate an overloaded algorithm
+        self.delayFunc = None
+        # Optional callable(result) returning an extra delay for the given input
+        self.inputDelayFunc = None
+        # Optional callable(requestNumber, result) returning the HTTP status, errors are sent for
+        # anything but 200
+        self.statusFunc = None
+        # content_type reported in the metadata
+        self.contentType = "json"
+        # Answer with Connection: close, so every call needs a new connection
+        self.closeConnections = False
+        self.lock = threading.Lock()
+        self.numRequests = 0
+        self.numConnections = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.apiKeys = []
+        self.inFlightByKey = {}
+        self.maxInFlightByKey = {}
+
+class StubAlgoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Write each response in one go, keep-alive connections would otherwise stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.numConnections += 1
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.numRequests += 1
+            requestNumber = server.numRequests
+            server.inFlight += 1
+            server.maxInFlight = max(server.maxInFlight, server.inFlight)
+            inFlight = server.inFlight
+            apiKey = self.headers.getheader("Authorization")
+            server.apiKeys.append(apiKey)
+            server.inFlightByKey[apiKey] = server.inFlightByKey.get(apiKey, 0) + 1
+            server.maxInFlightByKey[apiKey] = max(server.maxInFlightByKey.get(apiKey, 0), server.inFlightByKey[apiKey])
+
+        body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        if self.headers.getheader("Content-Type") == "application/json":
+            result = json.loads(body)
+        else:
+            result = body
+
+        if server.delayFunc is not None:
+            time.sleep(server.delayFunc(inFlight))
+        else:
+            time.sleep(server.delay)
+        if server.inputDelayFunc is not None:
+            time.sleep(server.inputDelayFunc(result))
+
+        duration = server.duration
+        if server.durationFunc is not None:
+            duration = server.durationFunc(requestNumber, result)
+        status = 200
+        if server.statusFunc is not None:
+            status = server.statusFunc(requestNumber, result)
+        if status == 200:
+            response = json.dumps({
+                "result": result,
+                "metadata": {"content_type": server.contentType, "duration": duration}
+            })
+        else:
+            response = json.dumps({"error": {"message": "stub error", "stacktrace": ""}})
+
+        with server.lock:
+            server.inFlight -= 1
+            server.inFlightByKey[apiKey] -= 1
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        if server.closeConnections:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(response)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stubServer():
+    server = StubAlgoServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def useStubServer(stubServer, monkeypatch):
+    # Clients created without an apiAddress setting call the stub server
+    monkeypatch.setattr(Algorithmia, "apiAddress", stubServer.url)
@@ -0,0 +1,75 @@
+import pytest
+
+from AlgoBench.baseline import BaselineStore, checkMetrics, splitAlgoVersion
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+
+@pytest.mark.usefixtures("useStubServer")
+class TestBaseline():
+
+    def runVersion(self, stubServer, version, duration, labelFunc=lambda i: i % 2):
+        stubServer.durationFunc = lambda requestNumber, result: duration
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName/" + version
+        settings["inputLabelList"] = [{"data": i, "label": labelFunc(i)} for i in range(20)]
+        b = Benchmark(settings)
+        b.run()
+        b.calcStats(lambda res: {"result": res["response"]["result"] % 2, "label": res["label"]})
+        return b
+
+    def testRegressionCheck(self, stubServer, tmpdir):
+        store = BaselineStore(str(tmpdir.join("baseline.db")))
+        first = self.runVersion(stubServer, "1.0.0", 0.1)
+        report = first.checkRegression(store, "parity")
+        assert report["passed"]
+        assert report["algos"]["userName/algoName/1.0.0"]["baseline"] is None
+        first.recordBaseline(store, "parity")
+
+        # Twice as slow
+        second = self.runVersion(stubServer, "1.1.0", 0.2)
+        report = second.checkRegression(store, "parity")
+        assert not report["passed"]
+        algoReport = report["algos"]["userName/algoName/1.1.0"]
+        assert algoReport["baseline"]["version"] == "1.0.0"
+        checks = dict((check["metric"], check) for check in algoReport["checks"])
+        assert sorted(checks) == ["accuracy", "errorRate", "mean", "p95"]
+        assert checks["mean"]["change"] == pytest.approx(1.0)
+        assert not checks["mean"]["passed"]
+        assert checks["accuracy"]["passed"]
+
+        assert second.checkRegression(store, "parity", tolerances={"mean": 1.5, "p95": 1.5})["passed"]
+        # Baselines are kept per input set
+        assert second.checkRegression(store, "other")["passed"]
+        second.recordBaseline(store, "parity")
+        assert len(store.history("userName/algoName", "parity")) == 2
+
+        # Faster than 1.1.0 but slower than 1.0.0, and less accurate
+        third = self.runVersion(stubServer, "1.2.0", 0.15, labelFunc=lambda i: int(i < 5))
+        assert third.checkRegression(store, "parity", tolerances={"mean": 0.1})["passed"]
+        report = third.checkRegression(store, "parity", baselineVersion="1.0.0")
+        checks = dict((check["metric"], check) for check in report["algos"]["userName/algoName/1.2.0"]["checks"])
+        assert not checks["mean"]["passed"]
+        assert not checks["accuracy"]["passed"]
+
+    def testInvalidTolerances(self, stubServer, tmpdir):
+        store = BaselineStore(str(tmpdir.join("baseline.db")))
+        b = self.runVersion(stubServer, "1.0.0", 0.01)
+        with pytest.raises(AlgoBenchError):
+            b.checkRegression(store, "parity", tolerances={"median": 0.1})
+        with pytest.raises(AlgoBenchError):
+            b.checkRegression(store, "parity", tolerances={"mean": -1})
+        with pytest.raises(AlgoBenchError):
+            b.checkRegression(str(tmpdir.join("baseline.db")), "parity")
+
+    def testCheckMetrics(self):
+        assert splitAlgoVersion("algo://userName/algoName/1.0.0") == ("userName/algoName", "1.0.0")
+        assert splitAlgoVersion("userName/algoName") == ("userName/algoName", None)
+
+        checks = checkMetrics({"throughput": 90, "errorRate": 0.02, "p99": None},
+                              {"throughput": 100, "errorRate": 0.0, "p99": 1.0},
+                              {"throughput": 0.05, "errorRate": 0.05, "p99": 0.1})
+        assert [check["metric"] for check in checks] == ["errorRate", "throughput"]
+        assert checks[0]["change"] == pytest.approx(0.02)
+        assert checks[0]["passed"]
+        assert checks[1]["change"] == pytest.approx(0.1)
+        assert not checks[1]["passed"]
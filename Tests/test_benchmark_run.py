@@ -0,0 +1,500 @@
+import Algorithmia
+import base64
+import pytest
+import resource
+import threading
+
+from AlgoBench.benchmark import Benchmark
+from AlgoBench.sinks import JsonLinesSink
+
+@pytest.mark.usefixtures("useStubServer")
+class TestBenchmarkRun():
+
+    def testWorkerPoolRunsEveryCall(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = ["input " + str(i) for i in range(50)]
+        settings["numBenchRuns"] = 2
+        settings["maxNumConnections"] = 4
+        stubServer.delay = 0.005
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 100
+        assert stubServer.numRequests == 100
+        assert len(b.threads) == 4
+        assert stubServer.maxInFlight <= 4
+        assert "userName/algoName" in b.average
+
+    def testWorkerPoolKeepsLabels(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = [{"data": i, "label": i % 3} for i in range(30)]
+        settings["maxNumConnections"] = 3
+        b = Benchmark(settings)
+        b.run()
+
+        for res in b.results:
+            assert res["response"]["result"] % 3 == res["label"]
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testClientLatencies(self, stubServer, engine):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(12)
+        settings["engine"] = engine
+        settings["maxNumConnections"] = 2
+        stubServer.delay = 0.02
+        b = Benchmark(settings)
+        b.run()
+
+        for res in b.results:
+            timing = res["timing"]
+            assert timing["enqueued"] <= timing["acquired"] <= timing["sent"] <= timing["received"] <= timing["parsed"]
+
+        latency = b.latency
+        assert set(latency.keys()) == set(["server", "batch", "error", "roundTrip", "queueWait", "openLoop", "cold", "warm"])
+        assert latency["server"]["userName/algoName"]["count"] == 12
+        assert latency["roundTrip"]["userName/algoName"]["min"] >= 0.02
+        # Two connections for twelve calls, so most calls wait in the queue
+        assert latency["queueWait"]["userName/algoName"]["max"] >= 0.02
+
+    def testRunTwice(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(5)
+        b = Benchmark(settings)
+        b.run()
+        b.run()
+
+        # The second run replaces the first, every aggregate covers the same 5 calls
+        assert len(b.results) == 5
+        assert b.latency["server"]["userName/algoName"]["count"] == 5
+        warm = b.latency["warm"]["userName/algoName"]["count"]
+        assert warm + b.coldStarts.get("userName/algoName", 0) == 5
+        assert b.errors["userName/algoName"]["calls"] == 5
+        assert stubServer.numRequests == 10
+
+    def testColdStartDetection(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(20)
+        settings["maxNumConnections"] = 2
+        # Only the first two calls of the benchmark hit a cold algorithm
+        stubServer.durationFunc = lambda n, result: 2.0 if result < 2 else 0.1 + result / 1000.0
+        b = Benchmark(settings)
+        b.run()
+
+        assert b.coldStarts["userName/algoName"] == 2
+        assert len([res for res in b.results if res["coldStart"]]) == 2
+        assert b.latency["cold"]["userName/algoName"]["min"] == 2.0
+        assert b.latency["warm"]["userName/algoName"]["max"] < 0.2
+
+    def testWarmUp(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoList"] = ["userName/algoName/1.0.0", "userName/algoName/2.0.0"]
+        settings["inputSingle"] = "an input"
+        settings["numBenchRuns"] = 5
+        settings["numWarmupRuns"] = 3
+        settings["maxNumConnections"] = 1
+        # The warm-up absorbs the slow calls
+        stubServer.durationFunc = lambda n, result: 2.0 if n <= 6 else 0.1
+        b = Benchmark(settings)
+        b.run()
+
+        assert stubServer.numRequests == 16
+        assert len(b.results) == 10
+        for algo in settings["algoList"]:
+            assert b.latency["server"][algo]["max"] == 0.1
+        assert b.coldStarts == {}
+
+    def testOpenLoop(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = ["a", "b", "c"]
+        settings["maxNumConnections"] = 1
+        settings["loadProfile"] = {"pattern": "constant", "rps": 50, "duration": 0.4}
+        # 50 requests per second offered to a single connection that handles at most 20
+        stubServer.delay = 0.05
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 20
+        assert sorted(res["response"]["result"] for res in b.results)[:7] == ["a"] * 7
+        # Latency from the intended send time includes the time spent behind the slow calls
+        latency = b.latency["openLoop"]["userName/algoName"]
+        assert latency["max"] > 0.5
+        assert latency["max"] > 5 * b.latency["roundTrip"]["userName/algoName"]["max"]
+        assert b.throughput["userName/algoName"] < 25
+
+    def testSaturationSearch(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = ["a", "b"]
+        settings["saturation"] = {"start": 1, "factor": 2, "max": 32, "callsPerStep": 16, "sloP99": 0.3}
+        # Each call slows down with the number of calls in flight
+        stubServer.delayFunc = lambda inFlight: 0.05 * inFlight
+        b = Benchmark(settings)
+        b.searchSaturation()
+
+        saturation = b.saturation["userName/algoName"]
+        assert [step["level"] for step in saturation["curve"]] == [1, 2, 4, 8]
+        assert [step["withinSlo"] for step in saturation["curve"]] == [True, True, True, False]
+        assert saturation["sustainableLevel"] == 4
+        assert saturation["maxThroughput"] == max(step["throughput"] for step in saturation["curve"][:3])
+        assert stubServer.maxInFlight <= 8
+
+    def testConnectionReuse(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(30)
+        settings["maxNumConnections"] = 3
+        settings["numWarmupRuns"] = 3
+        b = Benchmark(settings)
+        b.run()
+
+        # The warm-up opened the connections, every measured call reused one of them
+        assert b.connections["userName/algoName"]["reused"] >= 27
+        assert b.connections["userName/algoName"]["new"] <= 3
+        assert len([res for res in b.results if res["reusedConnection"]]) == b.connections["userName/algoName"]["reused"]
+        assert b.sessionPool is None
+
+    def testConnectionsClosedByServer(self, stubServer):
+        stubServer.closeConnections = True
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(10)
+        settings["maxNumConnections"] = 1
+        b = Benchmark(settings)
+        b.run()
+
+        # The pooled connection is reconnected for every call, none of them is a reuse
+        assert stubServer.numConnections == 10
+        assert b.connections["userName/algoName"] == {"new": 10, "reused": 0}
+        assert not any(res["reusedConnection"] for res in b.results)
+
+    def testConcurrentBenchmarksAreIsolated(self, stubServer):
+        benchmarks = []
+        for apiKey, limit, engine in [("key-a", 2, "thread"), ("key-b", 5, "async")]:
+            settings = {}
+            settings["apiKey"] = apiKey
+            settings["apiAddress"] = stubServer.url
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputList"] = [apiKey] * 30
+            settings["maxNumConnections"] = limit
+            settings["engine"] = engine
+            benchmarks.append(Benchmark(settings))
+        stubServer.delay = 0.01
+
+        threads = [threading.Thread(target=b.run) for b in benchmarks]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert Algorithmia.apiKey is None
+        assert sorted(stubServer.apiKeys) == ["key-a"] * 30 + ["key-b"] * 30
+        assert stubServer.maxInFlightByKey["key-a"] <= 2
+        assert 2 < stubServer.maxInFlightByKey["key-b"] <= 5
+        for b in benchmarks:
+            assert len(b.results) == 30
+            assert set(res["response"]["result"] for res in b.results) == set([b.settings["apiKey"]])
+
+    def testAsyncEngineRunsEveryCall(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = [{"data": {"n": i}, "label": i % 2} for i in range(40)]
+        settings["maxNumConnections"] = 5
+        settings["engine"] = "async"
+        stubServer.delay = 0.005
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 40
+        assert stubServer.maxInFlight <= 5
+        assert stubServer.apiKeys == ["xxx"] * 40
+        for res in b.results:
+            assert res["algo"] == "userName/algoName"
+            assert res["response"]["result"]["n"] % 2 == res["label"]
+            assert res["response"]["metadata"]["duration"] == 0.01
+        assert "userName/algoName" in b.uncertainty
+        assert b.latency["roundTrip"]["userName/algoName"]["count"] == 40
+
+    def testBatching(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in range(7)]
+        settings["batchSize"] = 3
+        settings["maxNumConnections"] = 2
+        stubServer.duration = 0.03
+        b = Benchmark(settings)
+        b.run()
+
+        # 7 inputs are sent in batches of 3, 3 and 1
+        assert stubServer.numRequests == 3
+        assert len(b.results) == 7
+        assert sorted(res["response"]["result"] for res in b.results) == range(7)
+        for res in b.results:
+            assert res["response"]["result"] % 2 == res["label"]
+            assert res["batch"]["duration"] == 0.03
+            assert res["response"]["metadata"]["duration"] == pytest.approx(0.03 / res["batch"]["size"])
+        assert b.latency["batch"]["userName/algoName"]["count"] == 3
+        assert b.latency["server"]["userName/algoName"]["count"] == 7
+
+    def testBatchSplitter(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(4)
+        settings["batchSize"] = 2
+        settings["batchSplitter"] = lambda response, inputs: [{"echo": r} for r in response["result"]]
+        b = Benchmark(settings)
+        b.run()
+
+        assert sorted(res["response"]["result"]["echo"] for res in b.results) == range(4)
+
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(4)
+        settings["batchSize"] = 2
+        settings["batchSplitter"] = lambda response, inputs: response["result"][:1]
+        b2 = Benchmark(settings)
+        b2.run()
+
+        # Batches that can't be split fail like any other call, the run still finishes
+        assert len(b2.results) == 4
+        assert all(res["response"] is None and res["error"]["type"] == "batchSplit" for res in b2.results)
+        assert b2.errors["userName/algoName"]["types"] == {"batchSplit": 4}
+        assert b2.errorRate["userName/algoName"] == 1.0
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testRetries(self, stubServer, engine):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(10)
+        settings["engine"] = engine
+        settings["maxRetries"] = 2
+        settings["retryBackoff"] = 0.01
+        # The first two attempts of every call fail with a transient error
+        attempts = {}
+        def statusFunc(requestNumber, result):
+            attempts[result] = attempts.get(result, 0) + 1
+            return 503 if attempts[result] <= 2 else 200
+        stubServer.statusFunc = statusFunc
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 10
+        assert all(res["response"] is not None and res["error"] is None for res in b.results)
+        assert all(res["attempts"] == 3 for res in b.results)
+        assert stubServer.numRequests == 30
+        assert b.errorRate["userName/algoName"] == 0.0
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testErrorAccounting(self, stubServer, engine):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(12)
+        settings["engine"] = engine
+        settings["maxRetries"] = 1
+        settings["retryBackoff"] = 0.01
+        settings["timeout"] = 0.3
+        # Algorithm errors aren't retried, 5xx and timeouts are retried once
+        def statusFunc(requestNumber, result):
+            return {0: 400, 1: 500}.get(result % 4, 200)
+        stubServer.statusFunc = statusFunc
+        stubServer.delayFunc = lambda inFlight: 0
+        stubServer.inputDelayFunc = lambda result: 1.0 if result % 4 == 2 else 0
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 12
+        types = b.errors["userName/algoName"]["types"]
+        assert types == {"algorithm": 3, "http": 3, "timeout": 3}
+        assert b.errorRate["userName/algoName"] == 0.75
+        for res in b.results:
+            if res["error"] is None:
+                assert res["attempts"] == 1
+            elif res["error"]["type"] == "algorithm":
+                assert res["attempts"] == 1
+                assert res["error"]["status"] == 400
+            else:
+                assert res["attempts"] == 2
+        assert b.latency["server"]["userName/algoName"]["count"] == 3
+        assert b.latency["error"]["userName/algoName"]["count"] == 9
+        assert b.latency["error"]["userName/algoName"]["max"] >= 0.6
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testUnresolvableHost(self, engine):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["apiAddress"] = "http://no-such-host.invalid"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(3)
+        settings["engine"] = engine
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 3
+        assert all(res["error"]["type"] == "connection" for res in b.results)
+        assert b.errors["userName/algoName"]["types"] == {"connection": 3}
+
+    def testAsyncEngineManyConnections(self, stubServer, request):
+        # Both ends of every connection are open in this process
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        needed = 2 * 1100 + 100
+        if hard != resource.RLIM_INFINITY and hard < needed:
+            pytest.skip("needs at least " + str(needed) + " open files, the hard limit is " + str(hard))
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+            request.addfinalizer(lambda: resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard)))
+
+        # More sockets than select() can handle, poll() has no such limit
+        stubServer.socket.listen(2048)
+        stubServer.delay = 0.5
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(1100)
+        settings["engine"] = "async"
+        settings["maxNumConnections"] = 1100
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 1100
+        assert all(res["error"] is None for res in b.results)
+        assert stubServer.maxInFlight > 1024
+        # No keep-alive, every call opened its own connection
+        assert b.connections["userName/algoName"] == {"new": 1100, "reused": 0}
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testBinaryResponses(self, stubServer, engine):
+        stubServer.contentType = "binary"
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = [base64.b64encode("data " + str(i)) for i in range(5)]
+        settings["engine"] = engine
+        b = Benchmark(settings)
+        b.run()
+
+        # The full response is kept, with the result still base64 encoded
+        assert len(b.results) == 5
+        assert sorted(base64.b64decode(res["response"]["result"]) for res in b.results) == ["data " + str(i) for i in range(5)]
+        assert all(res["response"]["metadata"]["content_type"] == "binary" for res in b.results)
+        assert b.latency["server"]["userName/algoName"]["count"] == 5
+
+    def testStatsSkipFailedCalls(self, stubServer):
+        stubServer.statusFunc = lambda requestNumber, result: 500 if result % 4 == 0 else 200
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in range(20)]
+        b = Benchmark(settings)
+        b.run()
+
+        def mapFunc(res):
+            return {"result": res["response"]["result"] % 2, "label": res["label"]}
+
+        b.calcStats(mapFunc)
+        assert b.errorRate["userName/algoName"] == 0.25
+        assert b.confusionMatrix.total == 15
+        assert b.stats["accuracy"]["overall"] == 1.0
+
+    def testMatrixRun(self, stubServer):
+        algos = ["userName/algoName/1.0.0", "userName/algoName/1.1.0", "userName/algoName/2.0.0"]
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoList"] = algos
+        settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in range(6)]
+        settings["numBenchRuns"] = 2
+        settings["maxNumConnections"] = 1
+        settings["matrixOrder"] = "random"
+        settings["matrixSeed"] = 3
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 36
+        # Every block of calls has each algo once, in a different order from block to block
+        blocks = [[res["algo"] for res in b.results[i:i + 3]] for i in range(0, 36, 3)]
+        assert all(sorted(block) == algos for block in blocks)
+        assert len(set(tuple(block) for block in blocks)) > 1
+        for algo in algos:
+            assert b.latency["server"][algo]["count"] == 12
+
+        # Only the 2.0.0 version gets the odd inputs wrong
+        def mapFunc(res):
+            result = res["response"]["result"] % 2
+            if res["algo"].endswith("2.0.0"):
+                result = 0
+            return {"result": result, "label": res["label"]}
+
+        b.calcStats(mapFunc)
+        assert b.algoStats["userName/algoName/1.0.0"]["accuracy"]["overall"] == 1.0
+        assert b.algoStats["userName/algoName/2.0.0"]["accuracy"]["overall"] == 0.5
+        assert b.stats["accuracy"]["overall"] == pytest.approx(30 / 36.0)
+        assert b.confusionMatrices["userName/algoName/2.0.0"].total == 12
+
+    def testAdaptiveSampling(self, stubServer):
+        def runBenchmark(noise):
+            stubServer.durationFunc = lambda requestNumber, result: 1.0 + noise * ((requestNumber * 7) % 5 - 2)
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputList"] = range(3)
+            settings["maxNumConnections"] = 2
+            settings["adaptiveSampling"] = {"targetWidth": 0.05, "minCalls": 10, "maxCalls": 200, "checkEvery": 5}
+            b = Benchmark(settings)
+            b.run()
+            return b
+
+        # Stable durations converge after a few calls
+        b = runBenchmark(0.01)
+        sampling = b.sampling["userName/algoName"]
+        assert sampling["converged"]
+        assert sampling["relativeWidth"] <= 0.05
+        assert sampling["calls"] < 30
+        assert len(b.results) == sampling["calls"]
+
+        # Noisy durations use up the budget
+        b2 = runBenchmark(0.4)
+        sampling = b2.sampling["userName/algoName"]
+        assert not sampling["converged"]
+        assert sampling["calls"] == 200
+        assert len(b2.results) == 200
+
+    def testJsonLinesSink(self, stubServer, tmpdir):
+        path = str(tmpdir.join("results.jsonl"))
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = [{"data": i % 2, "label": i % 2} for i in range(20)]
+        settings["resultsSink"] = JsonLinesSink(path)
+        b = Benchmark(settings)
+        b.run()
+
+        assert b.results == []
+        assert len(open(path).readlines()) == 20
+        assert "userName/algoName" in b.average
+
+        def mapFunc(res):
+            return {"result": res["response"]["result"], "label": res["label"]}
+
+        b.calcStats(mapFunc)
+
+        assert b.stats["accuracy"]["overall"] == 1.0
@@ -0,0 +1,124 @@
+import multiprocessing
+import pytest
+import socket
+import time
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.distributed import serveWorker
+
+def mapParity(res):
+    # Module level, so it can be sent to the workers
+    return {"result": res["response"]["result"] % 2, "label": res["label"]}
+
+def freePort():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+@pytest.mark.usefixtures("useStubServer")
+class TestDistributed():
+
+    def newSettings(self, stubServer, distributed):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["apiAddress"] = stubServer.url
+        settings["algoList"] = ["userName/algoName/1.0.0", "userName/algoName/2.0.0"]
+        settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in range(30)]
+        settings["maxNumConnections"] = 2
+        settings["distributed"] = distributed
+        return settings
+
+    def testLocalProcesses(self, stubServer):
+        b = Benchmark(self.newSettings(stubServer, {"processes": 3, "chunkSize": 10}))
+        b.run()
+
+        assert stubServer.numRequests == 60
+        assert len(b.results) == 60
+        for algo in b.settings["algoList"]:
+            assert b.durationStats[algo].count == 30
+            assert b.errors[algo] == {"calls": 30, "failed": 0, "types": {}}
+            assert sorted(res["callIndex"] for res in b.results if res["algo"] == algo) == range(30)
+            assert b.throughput[algo] > 0
+
+        b.calcStats(mapParity)
+        assert b.stats["accuracy"]["overall"] == 1.0
+
+    def testMapFuncOnWorkers(self, stubServer):
+        b = Benchmark(self.newSettings(stubServer, {"processes": 2, "chunkSize": 7, "mapFunc": mapParity}))
+        b.run()
+
+        # Only the aggregates come back
+        assert b.results == []
+        assert b.confusionMatrix.total == 60
+        assert b.stats["accuracy"]["overall"] == 1.0
+        assert b.algoStats["userName/algoName/2.0.0"]["accuracy"]["overall"] == 1.0
+        assert len(b.predictions["userName/algoName/1.0.0"]) == 30
+
+    def testWorkersBatchTheirChunks(self, stubServer):
+        settings = self.newSettings(stubServer, {"processes": 2, "chunkSize": 8})
+        settings["batchSize"] = 4
+        b = Benchmark(settings)
+        b.run()
+
+        # Each chunk has 4 calls to each algo, the last one 2
+        assert stubServer.numRequests == 16
+        assert len(b.results) == 60
+        assert all(res["batch"]["size"] in (2, 4) for res in b.results)
+        b.calcStats(mapParity)
+        assert b.stats["accuracy"]["overall"] == 1.0
+
+    def testMapFuncSkipsFailedCalls(self, stubServer):
+        stubServer.statusFunc = lambda requestNumber, result: 500 if result % 5 == 0 else 200
+        b = Benchmark(self.newSettings(stubServer, {"processes": 2, "chunkSize": 7, "mapFunc": mapParity}))
+        b.run()
+
+        # The failed calls have no response to map, they only count as errors
+        assert b.errors["userName/algoName/1.0.0"]["failed"] == 6
+        assert b.confusionMatrix.total == 48
+        assert b.stats["accuracy"]["overall"] == 1.0
+
+    def testRemoteWorker(self, stubServer):
+        address = ("127.0.0.1", freePort())
+        worker = multiprocessing.Process(target=serveWorker, args=(address, "secret"))
+        worker.daemon = True
+        worker.start()
+        try:
+            # Wait for the worker to listen
+            for i in range(50):
+                try:
+                    socket.create_connection(address).close()
+                    break
+                except socket.error:
+                    time.sleep(0.1)
+
+            b = Benchmark(self.newSettings(stubServer, {"processes": 1, "remote": [address], "authkey": "secret"}))
+            b.run()
+            assert len(b.results) == 60
+        finally:
+            worker.terminate()
+
+    def testWorkerErrors(self, stubServer):
+        settings = self.newSettings(stubServer, {"processes": 2, "chunkSize": 5, "mapFunc": mapParity})
+        settings["inputLabelList"] = [{"data": "text", "label": 0}]
+        b = Benchmark(settings)
+        with pytest.raises(AlgoBenchError):
+            b.run()
+
+    def testSettings(self, stubServer):
+        for distributed in [[], {"processes": -1}, {"processes": 0}, {"chunkSize": 0},
+                            {"remote": ("127.0.0.1", 6000)}, {"mapFunc": 1},
+                            {"remote": [("127.0.0.1", 6000)]}, {"remote": [("127.0.0.1", 6000)], "authkey": ""},
+                            {"remote": [("127.0.0.1", 6000)], "authkey": 1}]:
+            with pytest.raises(AlgoBenchError):
+                Benchmark(self.newSettings(stubServer, distributed))
+
+        for authkey in [None, ""]:
+            with pytest.raises(AlgoBenchError):
+                serveWorker(("127.0.0.1", 0), authkey)
+
+        settings = self.newSettings(stubServer, {})
+        settings["adaptiveSampling"] = {"targetWidth": 0.1}
+        with pytest.raises(AlgoBenchError):
+            Benchmark(settings)
@@ -0,0 +1,92 @@
+import json
+import pytest
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.inputs import CsvInput, JsonLinesInput
+
+@pytest.mark.usefixtures("useStubServer")
+class TestInputSources():
+
+    def testGeneratorIsReadLazily(self, stubServer):
+        produced = {"count": 0, "maxAhead": 0}
+        def inputs():
+            for i in range(200):
+                produced["count"] += 1
+                # Inputs read ahead of the responses that came back
+                produced["maxAhead"] = max(produced["maxAhead"], produced["count"] - stubServer.numRequests)
+                yield i
+
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = inputs()
+        settings["maxNumConnections"] = 4
+        b = Benchmark(settings)
+        assert produced["count"] == 0
+        b.run()
+
+        assert len(b.results) == 200
+        assert sorted(res["response"]["result"] for res in b.results) == range(200)
+        # Bounded by the queue of 2 tasks per worker and the calls in flight
+        assert produced["maxAhead"] <= 3 * 4 + 2
+
+    def testJsonLinesInput(self, tmpdir):
+        path = tmpdir.join("inputs.jsonl")
+        path.write("\n".join(json.dumps({"text": i, "class": i % 2}) for i in range(10)) + "\n")
+
+        for useMmap in (False, True):
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputLabelList"] = JsonLinesInput(str(path), dataKey="text", labelKey="class", useMmap=useMmap)
+            settings["numWarmupRuns"] = 2
+            b = Benchmark(settings)
+            b.run()
+
+            assert len(b.results) == 10
+            b.calcStats(lambda res: {"result": res["response"]["result"] % 2, "label": res["label"]})
+            assert b.stats["accuracy"]["overall"] == 1.0
+
+    def testEmptyJsonLinesInput(self, tmpdir):
+        path = tmpdir.join("empty.jsonl")
+        path.write("")
+
+        for useMmap in (False, True):
+            source = JsonLinesInput(str(path), useMmap=useMmap)
+            assert list(source) == []
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputLabelList"] = source
+            b = Benchmark(settings)
+            with pytest.raises(AlgoBenchError):
+                b.run()
+
+    def testCsvInput(self, tmpdir):
+        path = tmpdir.join("inputs.csv")
+        path.write("data,label\n" + "".join('"{""n"": %d}",%s\n' % (i, "odd" if i % 2 else "even") for i in range(6)))
+
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = CsvInput(str(path), parseData=json.loads)
+        b = Benchmark(settings)
+        b.run()
+
+        for res in b.results:
+            assert res["label"] == ("odd" if res["response"]["result"]["n"] % 2 else "even")
+
+    def testInvalidInputsFailDuringTheRun(self, stubServer):
+        def inputs():
+            yield {"data": 1, "label": 1}
+            yield {"data": 2}
+
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputLabelList"] = inputs()
+        b = Benchmark(settings)
+        with pytest.raises(AlgoBenchError):
+            b.run()
+        assert len(b.threads) == 10
+        assert not any(t.is_alive() for t in b.threads)
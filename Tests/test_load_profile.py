@@ -0,0 +1,49 @@
+import pytest
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.loadprofile import arrivalTimes, expectedArrivals
+
+class TestLoadProfile():
+
+    def testConstant(self):
+        profile = {"pattern": "constant", "rps": 4, "duration": 2}
+        assert list(arrivalTimes(profile)) == [0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.75]
+        assert expectedArrivals(profile) == 8
+
+    def testStep(self):
+        profile = {"pattern": "step", "steps": [{"rps": 2, "duration": 1}, {"rps": 4, "duration": 1}]}
+        assert list(arrivalTimes(profile)) == [0.0, 0.5, 1.0, 1.25, 1.5, 1.75]
+        assert expectedArrivals(profile) == 6
+
+    def testLinear(self):
+        profile = {"pattern": "linear", "startRps": 0, "endRps": 20, "duration": 10}
+        times = list(arrivalTimes(profile))
+        assert len(times) == expectedArrivals(profile) == 100
+        # Twice the rate at the end of the ramp is half the gap between requests
+        firstHalf = [t for t in times if t < 5]
+        assert len(firstHalf) == 25
+
+    def testPoisson(self):
+        profile = {"pattern": "poisson", "rps": 100, "duration": 10, "seed": 1}
+        times = list(arrivalTimes(profile))
+        assert times == sorted(times)
+        assert len(times) == pytest.approx(1000, rel=0.1)
+        assert times == list(arrivalTimes(profile))
+
+    def testInvalidProfiles(self):
+        invalidProfiles = [
+            "constant",
+            {"pattern": "burst", "rps": 10, "duration": 1},
+            {"pattern": "constant", "rps": 10},
+            {"pattern": "constant", "rps": 0, "duration": 1},
+            {"pattern": "step", "steps": []},
+            {"pattern": "linear", "startRps": 1, "endRps": -1, "duration": 1}
+        ]
+        for profile in invalidProfiles:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["inputSingle"] = "an input"
+            settings["algoSingle"] = "userName/algoName"
+            settings["loadProfile"] = profile
+            with pytest.raises(AlgoBenchError):
+                b = Benchmark(settings)
@@ -0,0 +1,77 @@
+import pytest
+import time
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.ratelimit import TokenBucket
+
+class TestRateLimit():
+
+    def testTokenBucket(self):
+        bucket = TokenBucket(10, burst=3)
+        # The burst goes out straight away, then one token every 0.1s
+        assert [bucket.tryTake() for i in range(3)] == [0, 0, 0]
+        assert bucket.tryTake() == pytest.approx(0.1, abs=0.01)
+
+        start = time.time()
+        for i in range(5):
+            bucket.take()
+        assert time.time() - start == pytest.approx(0.5, abs=0.05)
+
+    def testAdaptiveBackOff(self):
+        bucket = TokenBucket(10)
+        bucket.backOff()
+        # Throttled calls that come back at the same time only halve the rate once
+        bucket.backOff()
+        assert bucket.rate == 5
+        assert bucket.backOffs == 1
+
+        for i in range(10):
+            bucket.recover()
+        assert bucket.rate == 10
+
+        fixed = TokenBucket(10, adaptive=False)
+        fixed.backOff()
+        assert fixed.rate == 10
+
+    @pytest.mark.usefixtures("useStubServer")
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testRateLimitedRun(self, stubServer, engine):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(12)
+        settings["engine"] = engine
+        settings["maxNumConnections"] = 6
+        settings["rateLimit"] = {"rps": 20}
+        stubServer.delay = 0
+        b = Benchmark(settings)
+        b.run()
+
+        assert len(b.results) == 12
+        # 12 calls at 20 per second, the first one doesn't wait
+        assert b.elapsed >= 0.5
+        assert b.throttled["userName/algoName"] >= 0.5
+
+    @pytest.mark.usefixtures("useStubServer")
+    def testBackOffOnThrottling(self, stubServer):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(6)
+        settings["maxRetries"] = 3
+        settings["retryBackoff"] = 0.01
+        settings["rateLimit"] = {"rps": 50, "burst": 5}
+        stubServer.statusFunc = lambda requestNumber, result: 429 if requestNumber <= 3 else 200
+        b = Benchmark(settings)
+        b.run()
+
+        assert all(res["error"] is None for res in b.results)
+        assert b.threadLimiter.bucket.backOffs >= 1
+
+    def testSettings(self):
+        invalidRateLimits = [20, {}, {"rps": 0}, {"rps": 10, "burst": 0}, {"rps": 10, "adaptive": "yes"}]
+        for rateLimit in invalidRateLimits:
+            settings = {"apiKey": "xxx", "inputSingle": "an input", "algoSingle": "userName/algoName"}
+            settings["rateLimit"] = rateLimit
+            with pytest.raises(AlgoBenchError):
+                b = Benchmark(settings)
@@ -0,0 +1,101 @@
+import pytest
+import urllib2
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.reporters import MetricsReporter, ProgressReporter, Reporter
+
+@pytest.mark.usefixtures("useStubServer")
+class TestReporters():
+
+    def newSettings(self, numInputs, reporters):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputList"] = range(numInputs)
+        settings["maxNumConnections"] = 4
+        settings["reporters"] = reporters
+        return settings
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def testLiveMetrics(self, stubServer, engine):
+        stubServer.delay = 0.02
+        stubServer.statusFunc = lambda requestNumber, result: 500 if result % 10 == 0 else 200
+        updates = []
+        reporter = MetricsReporter(callback=updates.append, interval=0)
+        settings = self.newSettings(40, [reporter])
+        settings["engine"] = engine
+        Benchmark(settings).run()
+
+        # Called for every result and once more at the end
+        assert len(updates) == 41
+        assert max(update["userName/algoName"]["inFlight"] for update in updates) <= 4
+        finished = [update["userName/algoName"]["completed"] + update["userName/algoName"]["failed"] for update in updates]
+        assert finished[0] >= 1
+        assert finished[-1] == 40
+
+        metrics = reporter.metrics()["userName/algoName"]
+        assert metrics["inFlight"] == 0
+        assert (metrics["completed"], metrics["failed"]) == (36, 4)
+        assert metrics["throughput"] > 0
+        assert metrics["latency"]["p50"] == pytest.approx(0.01)
+
+    def testPrometheusExposition(self, stubServer):
+        reporter = MetricsReporter()
+        port = reporter.serve()
+        try:
+            Benchmark(self.newSettings(10, [reporter])).run()
+            body = urllib2.urlopen("http://127.0.0.1:" + str(port) + "/metrics").read()
+        finally:
+            reporter.close()
+
+        lines = body.splitlines()
+        assert "# TYPE algobench_calls_total counter" in lines
+        assert "# TYPE algobench_latency_seconds gauge" in lines
+        assert 'algobench_in_flight{algo="userName/algoName"} 0.0' in lines
+        assert 'algobench_calls_total{algo="userName/algoName",outcome="completed"} 10.0' in lines
+        assert 'algobench_latency_seconds{algo="userName/algoName",quantile="0.99"} 0.01' in lines
+
+    def testDistributedInFlight(self, stubServer):
+        updates = []
+        reporter = MetricsReporter(callback=updates.append, interval=0)
+        settings = self.newSettings(40, [reporter])
+        settings["distributed"] = {"processes": 2, "chunkSize": 10}
+        Benchmark(settings).run()
+
+        # The calls of a chunk are in flight until its results come back
+        assert max(update["userName/algoName"]["inFlight"] for update in updates) >= 9
+        metrics = reporter.metrics()["userName/algoName"]
+        assert metrics["inFlight"] == 0
+        assert metrics["completed"] == 40
+
+    def testProgressReporter(self, stubServer, capsys):
+        Benchmark(self.newSettings(20, [ProgressReporter(interval=0)])).run()
+        lines = capsys.readouterr()[0].splitlines()
+        assert lines[0] == "1/20"
+        assert lines[-1] == "20/20"
+
+        # Nothing is printed without a reporter
+        Benchmark(self.newSettings(20, [])).run()
+        assert capsys.readouterr()[0] == ""
+
+    @pytest.mark.parametrize("hook", ["callStarted", "callFinished"])
+    def testFailingReporter(self, stubServer, hook):
+        class FailingReporter(Reporter):
+            def fail(self, *args):
+                raise IOError("disk full")
+        reporter = FailingReporter()
+        setattr(reporter, hook, reporter.fail)
+        settings = self.newSettings(20, [reporter])
+        settings["maxNumConnections"] = 2
+        b = Benchmark(settings)
+
+        # The workers keep going until every call is made, then the error fails the run
+        with pytest.raises(IOError):
+            b.run()
+        assert stubServer.numRequests == 20
+
+    def testInvalidReporters(self):
+        with pytest.raises(AlgoBenchError):
+            Benchmark(self.newSettings(1, Reporter()))
+        with pytest.raises(AlgoBenchError):
+            Benchmark(self.newSettings(1, [lambda result: None]))
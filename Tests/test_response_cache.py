@@ -0,0 +1,98 @@
+import os
+import pytest
+import time
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.cache import ResponseCache, cacheKey
+
+class TestResponseCache():
+
+    def testCacheKey(self):
+        assert cacheKey("userName/algoName", {"a": 1, "b": 2}) == cacheKey("userName/algoName", {"b": 2, "a": 1})
+        assert cacheKey("userName/algoName", "1") != cacheKey("userName/algoName", 1)
+        assert cacheKey("userName/algoName/1.0.0", 1) != cacheKey("userName/algoName/1.0.1", 1)
+
+    def testEviction(self, tmpdir):
+        cache = ResponseCache(str(tmpdir), maxSize=300)
+        for i in range(10):
+            cache.put("userName/algoName", i, {"result": "x" * 50, "metadata": {"duration": 0.1}})
+        assert cache.get("userName/algoName", 3)["result"] == "x" * 50
+
+        assert cache.evict() > 0
+        assert sum(os.path.getsize(str(path)) for path in tmpdir.listdir()) <= 300
+
+        cache.maxAge = 0
+        time.sleep(0.01)
+        assert cache.get("userName/algoName", 9) is None
+
+    def testMaxAgeCountsFromPut(self, tmpdir):
+        cache = ResponseCache(str(tmpdir), maxAge=0.3)
+        cache.put("userName/algoName", 1, {"result": 1, "metadata": {"duration": 0.1}})
+        cache.put("userName/algoName", 2, {"result": 2, "metadata": {"duration": 0.1}})
+
+        # Replaying an entry doesn't keep it alive
+        for i in range(3):
+            assert cache.get("userName/algoName", 1)["result"] == 1
+            time.sleep(0.1)
+        time.sleep(0.1)
+        assert cache.get("userName/algoName", 1) is None
+        assert cache.evict() == 1
+
+    def testEvictsLeastRecentlyUsed(self, tmpdir):
+        cache = ResponseCache(str(tmpdir))
+        for i in range(3):
+            cache.put("userName/algoName", i, {"result": "x" * 50, "metadata": {"duration": 0.1}})
+            time.sleep(0.01)
+        size = os.path.getsize(str(tmpdir.listdir()[0]))
+        cache.get("userName/algoName", 0)
+
+        cache.maxSize = 2 * size
+        assert cache.evict() == 1
+        assert cache.get("userName/algoName", 0) is not None
+        assert cache.get("userName/algoName", 1) is None
+
+    @pytest.mark.usefixtures("useStubServer")
+    def testReplay(self, stubServer, tmpdir):
+        def runBenchmark(cacheMode):
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in range(10)]
+            settings["responseCache"] = ResponseCache(str(tmpdir))
+            settings["cacheMode"] = cacheMode
+            b = Benchmark(settings)
+            b.run()
+            return b
+
+        b = runBenchmark("replay")
+        assert b.cacheStats["misses"] == 10 and b.cacheStats["stored"] == 10
+        assert stubServer.numRequests == 10
+
+        # Every response is replayed, and none of them counts as a timed call
+        b2 = runBenchmark("replay")
+        assert b2.cacheStats["hits"] == 10
+        assert stubServer.numRequests == 10
+        assert all(res["cached"] for res in b2.results)
+        assert "userName/algoName" not in b2.average
+
+        b2.calcStats(lambda res: {"result": res["response"]["result"] % 2, "label": res["label"]})
+        assert b2.stats["accuracy"]["overall"] == 1.0
+
+        b3 = runBenchmark("bypass")
+        assert b3.cacheStats["hits"] == 0
+        assert stubServer.numRequests == 20
+        assert b3.latency["server"]["userName/algoName"]["count"] == 10
+
+    def testSettings(self, tmpdir):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        settings["cacheMode"] = "replay"
+        with pytest.raises(AlgoBenchError):
+            b = Benchmark(settings)
+
+        settings["responseCache"] = ResponseCache(str(tmpdir))
+        settings["cacheMode"] = "always"
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
@@ -1,6 +1,7 @@
 import pytest
 
 from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.sinks import JsonLinesSink
 
 class TestSettingsValidation():
 
@@ -121,4 +122,165 @@ class TestSettingsValidation():
         settings["numBenchRuns"] = 5
         b = Benchmark(settings)
 
-        assert b.settings["maxNumConnections"] == 10
\ No newline at end of file
+        assert b.settings["maxNumConnections"] == 10
+
+    def testEngine(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["engine"] == "thread"
+
+        settings["engine"] = "gevent"
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
+
+    def testResultsSink(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        settings["resultsSink"] = "results.jsonl"
+        with pytest.raises(AlgoBenchError):
+            b = Benchmark(settings)
+
+    def testStatsBackend(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["statsBackend"] == "python"
+
+        settings["statsBackend"] = "pandas"
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
+
+    def testStatsMappingSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["statsMapping"] == {"processes": 0, "chunkSize": 500, "memoize": True}
+
+        # Results streamed to a sink aren't kept in memory, mapped or not
+        settings["resultsSink"] = JsonLinesSink("results.jsonl")
+        settings.pop("statsMapping")
+        assert Benchmark(settings).settings["statsMapping"]["memoize"] == False
+
+        for statsMapping in [4, {"processes": -1}, {"chunkSize": 0}, {"chunkSize": 1.5}, {"memoize": 1}]:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["inputSingle"] = "an input"
+            settings["algoSingle"] = "userName/algoName"
+            settings["statsMapping"] = statsMapping
+            with pytest.raises(AlgoBenchError):
+                Benchmark(settings)
+
+    def testWarmupAndColdStartSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["numWarmupRuns"] == 0
+        assert b.settings["coldStartFactor"] == 3.0
+
+        settings["numWarmupRuns"] = -1
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
+
+        settings["numWarmupRuns"] = 2
+        settings["coldStartFactor"] = 0.5
+        with pytest.raises(AlgoBenchError):
+            b3 = Benchmark(settings)
+
+    def testSaturationSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        settings["saturation"] = {"sloP99": 2.0}
+        b = Benchmark(settings)
+
+        assert b.settings["saturation"]["mode"] == "concurrency"
+        assert b.settings["saturation"]["sloMetric"] == "roundTrip"
+
+        invalidSaturations = [{}, {"sloP99": 2.0, "mode": "latency"}, {"sloP99": 2.0, "factor": 1}]
+        for saturation in invalidSaturations:
+            settings["saturation"] = saturation
+            with pytest.raises(AlgoBenchError):
+                b2 = Benchmark(settings)
+
+    def testBatchSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["batchSize"] == 1
+
+        settings["batchSize"] = 0
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
+
+        settings["batchSize"] = 4
+        settings["batchSplitter"] = "not a function"
+        with pytest.raises(AlgoBenchError):
+            b3 = Benchmark(settings)
+
+    def testRetrySettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        assert b.settings["timeout"] is None
+        assert b.settings["maxRetries"] == 0
+
+        invalidSettings = [("timeout", 0), ("timeout", "10"), ("maxRetries", -1), ("maxRetries", 1.5), ("retryBackoff", -1)]
+        for key, value in invalidSettings:
+            settings = {"apiKey": "xxx", "inputSingle": "an input", "algoSingle": "userName/algoName"}
+            settings[key] = value
+            with pytest.raises(AlgoBenchError):
+                b2 = Benchmark(settings)
+
+    def testMatrixSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputList"] = ["an input", "another input"]
+        settings["algoList"] = ["userName/algoName/ver1", "userName/algoName/ver2"]
+        b = Benchmark(settings)
+
+        assert b.settings["matrixOrder"] == "interleaved"
+        assert len(b.settings["inputLabelList"]) == 2
+
+        settings["matrixOrder"] = "shuffled"
+        with pytest.raises(AlgoBenchError):
+            b2 = Benchmark(settings)
+
+    def testAdaptiveSamplingSettings(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        settings["adaptiveSampling"] = {"targetWidth": 0.1}
+        b = Benchmark(settings)
+
+        assert b.settings["adaptiveSampling"]["metric"] == "mean"
+        assert b.settings["adaptiveSampling"]["maxCalls"] == 1000
+
+        invalidSamplings = [{}, {"targetWidth": 0.1, "metric": "p42"}, {"targetWidth": 0.1, "minCalls": 50, "maxCalls": 10}]
+        for sampling in invalidSamplings:
+            settings = {"apiKey": "xxx", "inputSingle": "an input", "algoSingle": "userName/algoName"}
+            settings["adaptiveSampling"] = sampling
+            with pytest.raises(AlgoBenchError):
+                b2 = Benchmark(settings)
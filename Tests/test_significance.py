@@ -0,0 +1,73 @@
+import pytest
+import random
+
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.significance import mannWhitney, mcnemarTest, studentTTwoSided
+
+class TestSignificance():
+
+    def testReferenceValues(self):
+        assert studentTTwoSided(2.0, 10) == pytest.approx(0.07339, abs=1e-4)
+        assert studentTTwoSided(2.228, 10) == pytest.approx(0.05, abs=1e-4)
+
+        test = mannWhitney([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+        assert test["u"] == 0
+        assert test["p"] == pytest.approx(0.01219, abs=1e-4)
+        assert test["effectSize"] == -1
+
+        test = mcnemarTest(dict((i, i < 10) for i in range(30)), dict((i, i >= 5) for i in range(30)))
+        assert (test["onlyA"], test["onlyB"]) == (5, 20)
+        assert test["statistic"] == pytest.approx(7.84)
+        assert test["p"] == pytest.approx(0.00511, abs=1e-4)
+
+    def newBenchmark(self, durationsA, durationsB):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoList"] = ["userName/algoName/1.0.0", "userName/algoName/2.0.0"]
+        settings["inputLabelList"] = [{"data": 1, "label": 1}, {"data": 0, "label": 0}]
+        b = Benchmark(settings)
+
+        b.results = []
+        for algo, durations in (("userName/algoName/1.0.0", durationsA), ("userName/algoName/2.0.0", durationsB)):
+            for i, duration in enumerate(durations):
+                b.results.append({"response": {"result": i % 2, "metadata": {"duration": duration}},
+                                  "algo": algo, "label": i % 2, "callIndex": i})
+        b._Benchmark__calcAverage()
+        return b
+
+    def testCompareDifferentVersions(self):
+        rand = random.Random(1)
+        b = self.newBenchmark([rand.gauss(1.0, 0.1) for i in range(200)],
+                              [rand.gauss(0.9, 0.1) for i in range(200)])
+        comparison = b.compare("userName/algoName/1.0.0", "userName/algoName/2.0.0", numResamples=500)
+
+        assert comparison["difference"] == pytest.approx(-0.1, abs=0.03)
+        assert comparison["welch"]["p"] < 0.001
+        assert comparison["welch"]["effectSize"] < -0.5
+        assert comparison["mannWhitney"]["p"] < 0.001
+        assert comparison["bootstrap"]["p"] < 0.01
+        assert comparison["bootstrap"]["confidenceInterval"][1] < 0
+        assert comparison["mcnemar"] is None
+
+    def testCompareSameVersions(self):
+        rand = random.Random(2)
+        b = self.newBenchmark([rand.gauss(1.0, 0.1) for i in range(200)],
+                              [rand.gauss(1.0, 0.1) for i in range(200)])
+        comparison = b.compare("userName/algoName/1.0.0", "userName/algoName/2.0.0", numResamples=500)
+
+        assert comparison["welch"]["p"] > 0.05
+        assert comparison["mannWhitney"]["p"] > 0.05
+        assert comparison["bootstrap"]["p"] > 0.05
+
+        # Both versions make the same predictions
+        b.calcStats(lambda res: {"result": res["response"]["result"], "label": res["label"]})
+        comparison = b.compare("userName/algoName/1.0.0", "userName/algoName/2.0.0", numResamples=100)
+        assert comparison["mcnemar"]["pairs"] == 200
+        assert comparison["mcnemar"]["p"] == 1.0
+
+    def testCompareUnknownAlgo(self):
+        b = self.newBenchmark([1.0, 1.1], [1.0, 1.2])
+        with pytest.raises(AlgoBenchError):
+            b.compare("userName/algoName/1.0.0", "userName/otherAlgo")
+        with pytest.raises(AlgoBenchError):
+            b.compare("userName/algoName/1.0.0", "userName/algoName/2.0.0", kind="total")
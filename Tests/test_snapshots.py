@@ -0,0 +1,89 @@
+import json
+import pytest
+
+from AlgoBench.aggregate import Aggregate
+from AlgoBench.benchmark import Benchmark, AlgoBenchError
+
+algoList = ["userName/algoName/1.0.0", "userName/algoName/2.0.0"]
+
+def mapParity(res):
+    return {"result": res["response"]["result"] % 2, "label": res["label"]}
+
+@pytest.mark.usefixtures("useStubServer")
+class TestSnapshots():
+
+    @pytest.fixture(autouse=True)
+    def durationPerInput(self, stubServer):
+        # Every input has its own duration
+        stubServer.durationFunc = lambda requestNumber, result: 0.01 * (1 + result)
+
+    def runShard(self, inputs):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoList"] = list(algoList)
+        settings["inputLabelList"] = [{"data": i, "label": i % 2} for i in inputs]
+        b = Benchmark(settings)
+        b.run()
+        b.calcStats(mapParity)
+        return b
+
+    def testLoadMergesShards(self, tmpdir):
+        first = self.runShard(range(20))
+        second = self.runShard(range(20, 40))
+        first.save(str(tmpdir.join("first.json")))
+        second.save(str(tmpdir.join("second.json.gz")))
+
+        b = Benchmark.load([str(tmpdir.join("first.json")), str(tmpdir.join("second.json.gz"))])
+        assert b.settings["algoList"] == algoList
+        assert b.results == []
+        for algo in algoList:
+            assert b.latency["server"][algo]["count"] == 40
+            assert b.latency["server"][algo]["mean"] == pytest.approx(0.205)
+            assert b.latency["server"][algo]["min"] == pytest.approx(0.01)
+            assert b.latency["server"][algo]["max"] == pytest.approx(0.4)
+            assert b.percentiles[algo]["p50"] == pytest.approx(0.2, rel=0.02)
+            assert b.errors[algo]["calls"] == 40
+            assert b.errorRate[algo] == 0
+        assert b.confusionMatrix.total == 80
+        assert b.stats["accuracy"]["overall"] == 1.0
+        assert b.algoStats["userName/algoName/1.0.0"]["TP"]["labels"][1] == 20
+
+        # The predictions of the second shard don't overwrite those of the first
+        comparison = b.compare(algoList[0], algoList[1], numResamples=100)
+        assert comparison["mcnemar"]["pairs"] == 40
+
+    def testMergeBenchmarks(self):
+        b = self.runShard(range(10))
+        b.merge(self.runShard(range(10, 30)))
+
+        assert len(b.results) == 60
+        assert b.durationStats[algoList[0]].count == 30
+        assert b.confusionMatrices[algoList[1]].total == 30
+
+        # Recalculating from the merged results gives the same stats
+        accuracy = b.stats["accuracy"]
+        b.calcStats(mapParity)
+        assert b.stats["accuracy"] == accuracy
+
+    def testSnapshotWithResults(self, tmpdir):
+        path = str(tmpdir.join("shard.json"))
+        self.runShard(range(5)).save(path, includeResults=True)
+        with open(path) as f:
+            data = json.load(f)
+        assert len(data["results"]) == 10
+
+        b = Benchmark.load(path)
+        assert len(b.results) == 10
+        assert b.durationStats[algoList[0]].count == 5
+
+    def testInvalidSnapshots(self, tmpdir):
+        path = tmpdir.join("shard.json")
+        path.write(json.dumps({"version": 0}))
+        with pytest.raises(AlgoBenchError):
+            Benchmark.load(str(path))
+
+        b = self.runShard(range(2))
+        with pytest.raises(AlgoBenchError):
+            b.merge({"count": 2})
+        b.merge(Aggregate())
+        assert b.durationStats[algoList[0]].count == 2
@@ -1,6 +1,12 @@
+import multiprocessing
 import pytest
 
-from AlgoBench.benchmark import Benchmark, AlgoBenchError
+from AlgoBench.benchmark import Benchmark, AlgoBenchError, iterChunks, mapChunks
+from AlgoBench.stats import ConfusionMatrix, DurationStats
+
+def mapResult(res):
+    # Module level, so it can be sent to the statsMapping processes
+    return {"result": res["result"], "label": res["label"]}
 
 class TestStatisticalCalculations():
 
@@ -193,4 +199,259 @@ class TestStatisticalCalculations():
         b.calcStats(mapFunc)
 
         assert b.stats['fScore']['labels'][5] == 0.7499999999999999
-        assert b.stats['fScore']['labels'][7] == 0.7499999999999999
\ No newline at end of file
+        assert b.stats['fScore']['labels'][7] == 0.7499999999999999
+
+    def testConfusionMatrixMerge(self):
+        results = [{"result": 5, "label": 5}, {"result": 7, "label": 7},\
+                   {"result": 5, "label": 5}, {"result": 1, "label": 7},\
+                   {"result": 3, "label": 5}, {"result": 7, "label": 7},\
+                   {"result": 5, "label": 5}, {"result": 4, "label": 7},\
+                   {"result": 4, "label": 5}, {"result": 7, "label": 7}]
+
+        # Adding the results to two matrices and merging them is the same as adding them to one
+        first = ConfusionMatrix()
+        second = ConfusionMatrix()
+        for res in results[:4]:
+            first.add(res["result"], res["label"])
+        for res in results[4:]:
+            second.add(res["result"], res["label"])
+        first.merge(second)
+
+        basics = first.basics([5, 7])
+
+        assert first.total == 10
+        assert first.correct() == 6
+        assert basics["TP"] == {5: 3, 7: 3}
+        assert basics["FN"] == {5: 2, 7: 2}
+        assert basics["FP"] == {5: 0, 7: 0}
+        assert basics["TN"] == {5: 5, 7: 5}
+
+    def testDurationStatsMerge(self):
+        first = DurationStats()
+        second = DurationStats()
+        for duration in [0.24214214, 0.43523423]:
+            first.add(duration)
+        for duration in [0.12435256, 0.35314251, 0.12451533]:
+            second.add(duration)
+        first.merge(second)
+
+        assert first.count == 5
+        assert first.min == 0.12435256
+        assert first.max == 0.43523423
+        assert round(first.mean(), 9) == 0.255877354
+
+    def testTConfidenceInterval(self):
+        stats = DurationStats()
+        for duration in [1.0, 2.0, 3.0, 4.0, 5.0]:
+            stats.add(duration)
+
+        # mean 3, standard error sqrt(2.5 / 5), t(0.975, 4 df) = 2.776
+        low, high = stats.tConfidenceInterval(0.95)
+        assert low == pytest.approx(3 - 2.776 * 0.5 ** 0.5, abs=1e-3)
+        assert high == pytest.approx(3 + 2.776 * 0.5 ** 0.5, abs=1e-3)
+        assert stats.tConfidenceInterval(0.99)[1] > high
+
+    def testCalcAverageScores(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["algoSingle"] = "userName/algoName"
+        settings["inputSingle"] = "an input"
+
+        b = Benchmark(settings)
+
+        b.results = [{"result": 5, "label": 5}, {"result": 7, "label": 7},\
+                     {"result": 5, "label": 5}, {"result": 1, "label": 7},\
+                     {"result": 3, "label": 5}, {"result": 7, "label": 7},\
+                     {"result": 5, "label": 5}, {"result": 4, "label": 7},\
+                     {"result": 4, "label": 5}, {"result": 7, "label": 7}]
+
+        def mapFunc(res):
+            return res
+
+        b.calcStats(mapFunc)
+
+        assert b.stats['precision']['macro'] == 1.0
+        assert b.stats['precision']['micro'] == 1.0
+        assert b.stats['recall']['macro'] == 0.6
+        assert b.stats['recall']['micro'] == 0.6
+        assert b.stats['recall']['weighted'] == 0.6
+        assert b.stats['fScore']['micro'] == pytest.approx(0.75)
+
+    def testNumpyBackend(self):
+        pytest.importorskip("numpy")
+
+        results = [{"result": i % 4, "label": i % 3} for i in range(100)]
+        results += [{"result": "other", "label": 2}]
+
+        def mapFunc(res):
+            return res
+
+        allStats = []
+        for backend in ["python", "numpy"]:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputSingle"] = "an input"
+            settings["statsBackend"] = backend
+
+            b = Benchmark(settings)
+            b.results = results
+            b.calcStats(mapFunc)
+            allStats.append(b.stats)
+
+        pythonStats, numpyStats = allStats
+        for key in ["TP", "FP", "TN", "FN", "accuracy", "precision", "recall", "fScore"]:
+            assert numpyStats[key]["labels"] == pytest.approx(pythonStats[key]["labels"])
+        for key in ["precision", "recall", "fScore"]:
+            for average in ["macro", "micro", "weighted"]:
+                assert numpyStats[key][average] == pytest.approx(pythonStats[key][average])
+        assert numpyStats["accuracy"]["overall"] == pythonStats["accuracy"]["overall"]
+
+    def testNumpyBackendMissingLabel(self):
+        pytest.importorskip("numpy")
+
+        # Every call to algoB with label 1 failed, so its results only have label 0
+        results = []
+        for i in range(8):
+            results.append({"algo": "userName/algoA", "callIndex": i, "result": i % 2, "label": i % 2, "error": None})
+            error = {"type": "http"} if i % 2 else None
+            results.append({"algo": "userName/algoB", "callIndex": i, "result": 0, "label": i % 2, "error": error})
+
+        allStats = []
+        for backend in ["python", "numpy"]:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoList"] = ["userName/algoA", "userName/algoB"]
+            settings["inputSingle"] = "an input"
+            settings["statsBackend"] = backend
+
+            b = Benchmark(settings)
+            b.results = results
+            b.calcStats(mapResult)
+            allStats.append(b.algoStats["userName/algoB"])
+
+        pythonStats, numpyStats = allStats
+        for key in ["TP", "FP", "TN", "FN", "accuracy", "precision", "recall", "fScore"]:
+            assert numpyStats[key]["labels"] == pythonStats[key]["labels"]
+        assert numpyStats["TP"]["labels"][1] == 0
+        assert numpyStats["FN"]["labels"][1] == 0
+        assert numpyStats["accuracy"]["overall"] == 1.0
+
+    def testParallelMapping(self):
+        results = [{"result": i % 4, "label": i % 3, "algo": "userName/algoName", "callIndex": i} for i in range(1000)]
+
+        allStats = []
+        for processes in [0, 3]:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputSingle"] = "an input"
+            settings["statsMapping"] = {"processes": processes, "chunkSize": 64}
+
+            b = Benchmark(settings)
+            b.results = results
+            b.calcStats(mapResult)
+            allStats.append((b.stats, b.predictions))
+        assert allStats[0] == allStats[1]
+
+        # Lambdas can't be sent to the worker processes
+        with pytest.raises(AlgoBenchError):
+            b.calcStats(lambda res: res)
+
+        # Only a few chunks are handed to the pool ahead of the ones being consumed
+        pulled = []
+        def chunks():
+            for chunk in iterChunks(results, 10):
+                pulled.append(chunk)
+                yield chunk
+        pool = multiprocessing.Pool(2)
+        try:
+            mapped = mapChunks(pool, mapResult, chunks(), 4)
+            assert len(next(mapped)) == 10
+            assert len(pulled) == 4
+            assert sum(len(chunk) for chunk in mapped) == 990
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def testMemoizedMapping(self):
+        calls = {"count": 0}
+        def mapFunc(res):
+            calls["count"] += 1
+            return {"result": res["result"], "label": res["label"]}
+
+        for memoize, expected in [(True, 10), (False, 20)]:
+            settings = {}
+            settings["apiKey"] = "xxx"
+            settings["algoSingle"] = "userName/algoName"
+            settings["inputSingle"] = "an input"
+            settings["statsMapping"] = {"memoize": memoize}
+
+            b = Benchmark(settings)
+            b.results = [{"result": i % 2, "label": i % 3 % 2} for i in range(10)]
+            calls["count"] = 0
+            b.calcStats(mapFunc)
+            stats = b.stats["accuracy"]["overall"]
+            b.calcStats(mapFunc)
+            assert b.stats["accuracy"]["overall"] == stats
+            assert calls["count"] == expected
+
+        # New results are mapped again
+        b = Benchmark(settings)
+        b.settings["statsMapping"]["memoize"] = True
+        b.results = [{"result": 1, "label": 1}, {"result": 0, "label": 0}]
+        b.calcStats(mapFunc)
+        b.results = b.results + [{"result": 1, "label": 0}]
+        b.calcStats(mapFunc)
+        assert b.confusionMatrix.total == 3
+
+        # So are results changed in place
+        b.results[2] = {"result": 0, "label": 0}
+        b.calcStats(mapFunc)
+        assert b.stats["accuracy"]["overall"] == 1.0
+        b.results.append({"result": 0, "label": 1})
+        b.calcStats(mapFunc)
+        assert b.stats["accuracy"]["overall"] == 0.75
+
+    def testCalcDistribution(self):
+        settings = {}
+        settings["apiKey"] = "xxx"
+        settings["inputSingle"] = "an input"
+        settings["algoSingle"] = "userName/algoName"
+        b = Benchmark(settings)
+
+        # 1..1000ms plus a single cold start outlier
+        b.results = [{"response": {"metadata": {"duration": i / 1000.0}}, "algo": "userName/algoName"} for i in range(1, 1001)]
+        b.results.append({"response": {"metadata": {"duration": 60.0}}, "algo": "userName/algoName"})
+        b._Benchmark__calcAverage()
+        b._Benchmark__calcDistribution()
+
+        percentiles = b.percentiles["userName/algoName"]
+        assert percentiles["p50"] == pytest.approx(0.501, rel=0.01)
+        assert percentiles["p90"] == pytest.approx(0.901, rel=0.01)
+        assert percentiles["p99"] == pytest.approx(0.991, rel=0.01)
+        assert percentiles["p99.9"] == pytest.approx(1.0, rel=0.01)
+
+        durations = [res["response"]["metadata"]["duration"] for res in b.results]
+        mean = sum(durations) / len(durations)
+        stdDev = (sum((d - mean) ** 2 for d in durations) / (len(durations) - 1)) ** 0.5
+        assert b.stdDev["userName/algoName"] == pytest.approx(stdDev)
+
+        low, high = b.confidenceInterval["userName/algoName"]
+        assert low < b.average["userName/algoName"] < high
+
+    def testDurationStatsMergeDistribution(self):
+        merged = DurationStats()
+        whole = DurationStats()
+        parts = [DurationStats() for i in range(4)]
+        for i in range(2000):
+            duration = 0.1 + (i * 7919 % 1000) / 1000.0
+            parts[i % 4].add(duration)
+            whole.add(duration)
+        for part in parts:
+            merged.merge(part)
+
+        assert merged.count == whole.count
+        assert merged.stdDev() == pytest.approx(whole.stdDev())
+        assert merged.percentile(0.95) == whole.percentile(0.95)
+        assert len(merged.reservoir.samples) == 1000